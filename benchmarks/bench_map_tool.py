@@ -0,0 +1,366 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+# Headless benchmarks for the Measure Radius map tool hot paths.
+#
+# Run with the Python interpreter of a QGIS install, e.g.
+#   python benchmarks/bench_map_tool.py
+#   python benchmarks/bench_map_tool.py --trace moves.json --json results.json
+#   python benchmarks/bench_map_tool.py --baseline results.json --max-regression 0.2
+#
+# Mouse traces are replayed against MeasureRadiusTool on a real
+# QgsMapCanvas for every combination of CRS, measurement mode and snapping.
+# Latency percentiles are reported per event; allocations are measured in a
+# separate tracemalloc pass so they don't skew the timings.
+import os
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import argparse
+import importlib.util
+import json
+import math
+import random
+import sys
+import time
+import tracemalloc
+from unittest import mock
+
+from qgis.PyQt.QtCore import Qt, QEvent, QPoint
+from qgis.core import (Qgis, QgsApplication, QgsProject, QgsVectorLayer, QgsFeature, QgsGeometry,
+                        QgsPointXY, QgsCoordinateReferenceSystem, QgsRectangle,
+                        QgsSnappingConfig, QgsTolerance)
+from qgis.PyQt.QtWidgets import QMainWindow
+from qgis.gui import QgisInterface, QgsMapCanvas, QgsMapMouseEvent
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CANVAS_SIZE = (1920, 1080)
+
+# name: (crs, extent)
+CRS_CASES = {
+    'planar': ('EPSG:3857', QgsRectangle(-2e6, -1e6, 2e6, 1e6)),
+    'geographic': ('EPSG:4326', QgsRectangle(-20, -10, 20, 10)),
+}
+
+
+def load_plugin():
+    # The plugin folder name isn't necessarily a valid module name. Returns
+    # the package and how long importing it took, which is what QGIS pays
+    # at startup.
+    spec = importlib.util.spec_from_file_location('measure_radius',
+            os.path.join(PLUGIN_DIR, '__init__.py'),
+            submodule_search_locations=[PLUGIN_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['measure_radius'] = module
+    start = time.perf_counter()
+    spec.loader.exec_module(module)
+    return module, time.perf_counter() - start
+
+
+def plugin_startup(package):
+    # classFactory() plus initGui(), the rest of what QGIS runs at startup.
+    # initGui() registers the Processing provider, so whatever that imports
+    # is counted too. There is no QGIS main window headless, the interface
+    # is a mock around a real window and canvas like qgis.testing uses.
+    iface = mock.Mock(spec=QgisInterface)
+    window = QMainWindow()
+    iface.mainWindow.return_value = window
+    iface.mapCanvas.return_value = QgsMapCanvas(window)
+    start = time.perf_counter()
+    instance = package.classFactory(iface)
+    instance.initGui()
+    elapsed = time.perf_counter() - start
+    instance.unload()
+    return elapsed
+
+
+def load_map_tool():
+    # Deferred until the toolbar action is first used
+    start = time.perf_counter()
+    module = importlib.import_module('measure_radius.map_tool')
+    return module, time.perf_counter() - start
+
+
+def dense_layers(extent, crs, point_count, line_count):
+    rng = random.Random(1)
+    points = QgsVectorLayer('Point?crs={}'.format(crs), 'bench points', 'memory')
+    features = []
+    for i in range(point_count):
+        ft = QgsFeature()
+        ft.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(
+                rng.uniform(extent.xMinimum(), extent.xMaximum()),
+                rng.uniform(extent.yMinimum(), extent.yMaximum()))))
+        features.append(ft)
+    points.dataProvider().addFeatures(features)
+    lines = QgsVectorLayer('LineString?crs={}'.format(crs), 'bench lines', 'memory')
+    features = []
+    step = extent.width() / 200
+    for i in range(line_count):
+        x = rng.uniform(extent.xMinimum(), extent.xMaximum())
+        y = rng.uniform(extent.yMinimum(), extent.yMaximum())
+        vertices = []
+        for j in range(50):
+            x += rng.uniform(-step, step)
+            y += rng.uniform(-step, step)
+            vertices.append(QgsPointXY(x, y))
+        ft = QgsFeature()
+        ft.setGeometry(QgsGeometry.fromPolylineXY(vertices))
+        features.append(ft)
+    lines.dataProvider().addFeatures(features)
+    return [points, lines]
+
+
+def synthetic_trace(moves, seed=0):
+    # Left click near the middle of the canvas, a spiral drag outwards with
+    # some jitter, then a right click. Positions are in canvas pixels.
+    rng = random.Random(seed)
+    w, h = CANVAS_SIZE
+    cx, cy = w / 2, h / 2
+    trace = [('press', cx, cy, Qt.LeftButton)]
+    for i in range(moves):
+        t = i / moves
+        angle = t * 6 * math.pi
+        r = 20 + t * min(w, h) * 0.45
+        trace.append(('move', cx + r * math.cos(angle) + rng.uniform(-2, 2),
+                        cy + r * math.sin(angle) + rng.uniform(-2, 2), Qt.NoButton))
+    x, y = trace[-1][1:3]
+    trace.append(('press', x, y, Qt.RightButton))
+    return trace
+
+
+def load_trace(path):
+    # JSON list of [kind, x, y, button] with kind 'press' or 'move' and
+    # button 'left', 'right' or null, x/y in canvas pixels
+    buttons = {'left': Qt.LeftButton, 'right': Qt.RightButton, None: Qt.NoButton}
+    with open(path) as f:
+        return [(kind, x, y, buttons[button]) for kind, x, y, button in json.load(f)]
+
+
+def mouse_event(canvas, kind, x, y, button):
+    event_type = QEvent.MouseButtonPress if kind == 'press' else QEvent.MouseMove
+    return QgsMapMouseEvent(canvas, event_type, QPoint(int(x), int(y)), button, button, Qt.NoModifier)
+
+
+def replay(tool, canvas, trace, paint):
+    # Returns one latency (seconds) per move event. Each move is followed by
+    # a flush of the frame scheduler so the geometry and dialog update it
+    # triggers is included in its cost.
+    latencies = []
+    for kind, x, y, button in trace:
+        event = mouse_event(canvas, kind, x, y, button)
+        if kind == 'press':
+            tool.canvasPressEvent(event)
+            continue
+        start = time.perf_counter()
+        tool.canvasMoveEvent(event)
+        tool.render_scheduler.flush()
+        if paint:
+            canvas.viewport().repaint()
+        latencies.append(time.perf_counter() - start)
+    tool.new_measurement()
+    return latencies
+
+
+def allocations(tool, canvas, trace, paint):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    replay(tool, canvas, trace, paint)
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    stats = after.compare_to(before, 'filename')
+    allocated = sum(s.size_diff for s in stats if s.size_diff > 0)
+    blocks = sum(s.count_diff for s in stats if s.count_diff > 0)
+    moves = sum(1 for e in trace if e[0] == 'move') or 1
+    return {'bytes_per_event': allocated / moves, 'blocks_per_event': blocks / moves,
+            'peak_bytes': peak}
+
+
+def percentiles(values):
+    ordered = sorted(values)
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1e6
+    return {'p50_us': pct(50), 'p90_us': pct(90), 'p99_us': pct(99), 'max_us': ordered[-1] * 1e6}
+
+
+def time_calls(func, repeat):
+    latencies = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+def hot_path_benchmarks(plugin, tool, repeat):
+    # Per call cost of the individual methods behind canvasMoveEvent
+    extent = tool.canvas.extent()
+    tool.centre_point = extent.center()
+    tool.outer_point = QgsPointXY(extent.center().x() + extent.width() / 5, extent.center().y())
+    tool.measurement = plugin.RadiusMeasurement(tool.centre_point, tool.outer_point, tool.crs)
+    results = {
+        'create_buffer_geom': time_calls(tool.create_buffer_geom, repeat),
+        'create_buffer_geom_full': time_calls(
+                lambda: tool.create_buffer_geom(tool.tessellator.max_vertices), repeat),
+        'cartesian_length': time_calls(
+                lambda: tool.cartesian_length(1234.5, tool.units, 2), repeat),
+        'ellipsoidal_length': time_calls(
+                lambda: tool.ellipsoidal_length(tool.centre_point, tool.outer_point), repeat),
+    }
+    tool.measurement = None
+    return results
+
+
+def crs_change_benchmark(plugin, tool, canvas, measurements, repeat):
+    # Cost of a project CRS switch with a number of stored measurements
+    project = QgsProject.instance()
+    extent = canvas.extent()
+    rng = random.Random(2)
+    for i in range(measurements):
+        centre = QgsPointXY(rng.uniform(extent.xMinimum(), extent.xMaximum()),
+                            rng.uniform(extent.yMinimum(), extent.yMaximum()))
+        outer = QgsPointXY(centre.x() + extent.width() / 50, centre.y())
+        tool.session.add(plugin.RadiusMeasurement(centre, outer, tool.crs))
+    tool.canvas_item().update()
+    crs_pair = [project.crs(), QgsCoordinateReferenceSystem('EPSG:3395')]
+    latencies = []
+    for i in range(repeat):
+        crs = crs_pair[(i + 1) % 2]
+        start = time.perf_counter()
+        project.setCrs(crs)
+        latencies.append(time.perf_counter() - start)
+    project.setCrs(crs_pair[0])
+    tool.new_measurement()
+    return percentiles(latencies)
+
+
+def run(args):
+    app = QgsApplication([], True)
+    app.initQgis()
+    package, import_time = load_plugin()
+    init_time = plugin_startup(package)
+    plugin, tool_import_time = load_map_tool()
+    results = {'startup/import': percentiles([import_time]),
+                'startup/init_gui': percentiles([init_time]),
+                'startup/first_run_import': percentiles([tool_import_time])}
+    startup_ms = (import_time + init_time) * 1000
+    if startup_ms > package.STARTUP_BUDGET_MS:
+        print('WARNING plugin import, classFactory() and initGui() took {:.1f} ms, budget is {} ms'.format(
+                startup_ms, package.STARTUP_BUDGET_MS))
+    project = QgsProject.instance()
+
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(args.moves)
+    for crs_name, (authid, extent) in CRS_CASES.items():
+        crs = QgsCoordinateReferenceSystem(authid)
+        project.clear()
+        project.setCrs(crs)
+        layers = dense_layers(extent, authid, args.points, args.lines)
+        project.addMapLayers(layers)
+
+        canvas = QgsMapCanvas()
+        canvas.resize(*CANVAS_SIZE)
+        canvas.show()
+        canvas.setDestinationCrs(crs)
+        canvas.setLayers(layers)
+        canvas.setExtent(extent)
+        canvas.refresh()
+        canvas.waitWhileRendering()
+        app.processEvents()
+
+        start = time.perf_counter()
+        tool = plugin.MeasureRadiusTool(canvas)
+        results['{}/tool_construction'.format(crs_name)] = percentiles([time.perf_counter() - start])
+        # Time the measurement work itself rather than task submission
+        tool.async_measurements = False
+        canvas.setMapTool(tool)
+        snapping = canvas.snappingUtils()
+
+        for snap in (False, True):
+            config = QgsSnappingConfig(project)
+            config.setEnabled(snap)
+            config.setMode(QgsSnappingConfig.AllLayers)
+            config.setTypeFlag(Qgis.SnappingType.Vertex | Qgis.SnappingType.Segment)
+            config.setTolerance(12)
+            config.setUnits(QgsTolerance.Pixels)
+            snapping.setConfig(config)
+            for mode in ('cartesian', 'ellipsoidal'):
+                getattr(tool.dlg, mode + '_rb').setChecked(True)
+                name = '{}/{}/{}'.format(crs_name, mode, 'snap' if snap else 'nosnap')
+                replay(tool, canvas, trace, args.paint) # warm up
+                latencies = replay(tool, canvas, trace, args.paint)
+                results[name] = percentiles(latencies)
+                results[name].update(allocations(tool, canvas, trace, args.paint))
+
+        for name, stats in hot_path_benchmarks(plugin, tool, args.repeat).items():
+            results['{}/{}'.format(crs_name, name)] = stats
+        results['{}/crs_changed'.format(crs_name)] = crs_change_benchmark(
+                plugin, tool, canvas, args.measurements, min(args.repeat, 50))
+
+        canvas.unsetMapTool(tool)
+        tool.dlg.close()
+        del tool
+        del canvas
+    app.exitQgis()
+    return results
+
+
+def report(results):
+    columns = ['p50_us', 'p90_us', 'p99_us', 'max_us', 'bytes_per_event', 'blocks_per_event']
+    print('{:<42}'.format('benchmark') + ''.join('{:>18}'.format(c) for c in columns))
+    for name, stats in results.items():
+        row = '{:<42}'.format(name)
+        for c in columns:
+            row += '{:>18.1f}'.format(stats[c]) if c in stats else '{:>18}'.format('-')
+        print(row)
+
+
+def regressions(results, baseline, max_regression):
+    failed = []
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        if stats['p90_us'] > old['p90_us'] * (1 + max_regression):
+            failed.append('{}: p90 {:.1f}us vs baseline {:.1f}us'.format(name, stats['p90_us'], old['p90_us']))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure Radius map tool benchmarks')
+    parser.add_argument('--trace', help='JSON mouse trace to replay instead of the synthetic one')
+    parser.add_argument('--moves', type=int, default=2000, help='moves in the synthetic trace')
+    parser.add_argument('--points', type=int, default=200000, help='points in the snapping layer')
+    parser.add_argument('--lines', type=int, default=5000, help='lines in the snapping layer')
+    parser.add_argument('--measurements', type=int, default=200, help='stored measurements for crs_changed')
+    parser.add_argument('--repeat', type=int, default=1000, help='calls per hot path benchmark')
+    parser.add_argument('--paint', action='store_true', help='repaint the canvas after every move')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file to compare p90 latencies against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+            help='allowed relative p90 slowdown against the baseline')
+    args = parser.parse_args()
+
+    results = run(args)
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed = regressions(results, json.load(f), args.max_regression)
+        for line in failed:
+            print('REGRESSION ' + line)
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+# Headless replay of traces recorded with MeasureRadiusTool.start_trace().
+#
+# Run with the Python interpreter of a QGIS install, e.g.
+#   python benchmarks/replay_trace.py session.mrt
+#   python benchmarks/replay_trace.py session.mrt --repeat 20 --json replay.json
+#
+# Every finished measurement in the trace is compared with what the tool
+# shows after the replay, the script exits with status 1 on any mismatch.
+# Latency percentiles per record kind give a load profile of real use.
+import os
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import argparse
+import json
+import sys
+import time
+
+from qgis.core import QgsApplication, QgsProject
+from qgis.gui import QgsMapCanvas
+
+from bench_map_tool import CANVAS_SIZE, load_plugin, load_map_tool, percentiles
+
+KIND_NAMES = {1: 'press', 2: 'move', 3: 'idle_snap', 4: 'frame', 5: 'crs', 6: 'extent',
+                7: 'units', 8: 'mode', 9: 'output', 10: 'undo', 11: 'new', 12: 'typed',
+                13: 'circles'}
+
+
+def run(args):
+    app = QgsApplication([], True)
+    app.initQgis()
+    load_plugin()
+    plugin, _ = load_map_tool()
+    traces = sys.modules['measure_radius.traces']
+
+    canvas = QgsMapCanvas()
+    canvas.resize(*CANVAS_SIZE)
+    canvas.show()
+    tool = plugin.MeasureRadiusTool(canvas)
+    canvas.setMapTool(tool)
+
+    latencies = {}
+    last = [time.perf_counter()]
+
+    def on_record(kind, values):
+        now = time.perf_counter()
+        latencies.setdefault(KIND_NAMES[kind], []).append(now - last[0])
+        last[0] = now
+
+    failed = []
+    totals = []
+    for i in range(args.repeat):
+        QgsProject.instance().clear()
+        start = time.perf_counter()
+        last[0] = start
+        count, checked, mismatches = traces.replay_trace(tool, args.trace, on_record)
+        totals.append(time.perf_counter() - start)
+        failed.extend(mismatches)
+    # Canvas items are pooled, replaying any number of times must not add any
+    memory = tool.memory_stats()
+
+    canvas.unsetMapTool(tool)
+    tool.dlg.close()
+    del tool
+    del canvas
+    app.exitQgis()
+
+    results = {name: percentiles(values) for name, values in latencies.items()}
+    results['total'] = percentiles(totals)
+    return count, checked, results, memory, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a Measure Radius trace')
+    parser.add_argument('trace', help='trace file recorded with MeasureRadiusTool.start_trace()')
+    parser.add_argument('--repeat', type=int, default=1, help='times to replay the trace')
+    parser.add_argument('--json', help='write latencies to this file')
+    args = parser.parse_args()
+
+    count, checked, results, memory, failed = run(args)
+    print('{} records, {} measurements checked per replay'.format(count, checked))
+    print('canvas items: {}'.format(memory['canvas_items']))
+    print('{:<12}'.format('record') + ''.join('{:>14}'.format(c) for c in ('p50_us', 'p90_us', 'p99_us', 'max_us')))
+    for name, stats in results.items():
+        print('{:<12}'.format(name) + ''.join('{:>14.1f}'.format(stats[c])
+                for c in ('p50_us', 'p90_us', 'p99_us', 'max_us')))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    for record, expected, replayed in failed:
+        print('MISMATCH record {}: recorded {} replayed {}'.format(record, expected, replayed))
+    items = memory['canvas_items']
+    if items['leaked'] or items['created'] > items['items']:
+        print('LEAK canvas items were allocated outside the pool')
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
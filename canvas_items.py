@@ -0,0 +1,311 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from qgis.PyQt.QtCore import Qt, QPointF, QRectF, QLineF
+from qgis.PyQt.QtGui import QColor, QFont, QPen, QBrush, QPainter, QPolygonF
+
+from qgis.core import QgsPointXY
+
+from qgis.gui import QgsMapCanvasItem
+
+import math
+
+import numpy as np
+
+LINE_COLOR = QColor(222,155,67,150)
+MARKER_FILL_COLOR = QColor(222,155,67,100)
+CIRCLE_COLOR = QColor(25,25,25)
+CIRCLE_FILL_COLOR = QColor(125,125,125,35)
+MARKER_SIZE = 10
+
+
+class MeasureRadiusCanvasItem(QgsMapCanvasItem):
+    # Paints the measurement being drawn and every measurement of a
+    # MeasurementSession (centre and outer markers, radius line and circle)
+    # straight onto the canvas with QPainter. Circles are always defined in
+    # the canvas CRS, so they are drawn as ellipses in screen space and no
+    # polygon is ever tessellated for display.
+
+    def __init__(self, canvas, session, transforms):
+        super(MeasureRadiusCanvasItem, self).__init__(canvas)
+        self.canvas = canvas
+        self.session = session
+        self.transforms = transforms
+        self.preview_centre = None
+        self.preview_outer = None
+        self.preview_rect = QRectF()
+        self.line_pen = QPen(LINE_COLOR, 3)
+        self.marker_pen = QPen(LINE_COLOR, 1)
+        self.marker_brush = QBrush(MARKER_FILL_COLOR)
+        self.circle_pen = QPen(CIRCLE_COLOR, 2)
+        self.circle_brush = QBrush(CIRCLE_FILL_COLOR)
+        self.ring_pen = QPen(CIRCLE_COLOR, 1, Qt.DashLine)
+        # Range rings around one centre, radii in map units drawn as circles
+        # and lines as (xs, ys) map coordinate arrays
+        self.ring_centre = None
+        self.ring_radii = []
+        self.ring_lines = []
+        self.instrumentation = None
+        # Optional callable(dest_crs) which computes stored measurement
+        # coordinates in the background, returning True if it will do so
+        self.request_display_points = None
+        # GeodesicCircleLod when stored circles are drawn as geodesic
+        # outlines (ellipsoidal mode), otherwise they are drawn as ellipses
+        self.lod = None
+        self.setZValue(10)
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.canvas.width(), self.canvas.height())
+
+    def updatePosition(self):
+        # The item always covers the whole canvas
+        self.prepareGeometryChange()
+        self.setPos(0, 0)
+        self.preview_rect = self.current_preview_rect()
+        self.update()
+
+    def set_preview(self, centre, outer=None):
+        # Map points in the canvas CRS. Only the part of the canvas covered
+        # by the old and new preview is repainted.
+        self.preview_centre = centre
+        self.preview_outer = outer
+        rect = self.current_preview_rect()
+        self.update(rect.united(self.preview_rect))
+        self.preview_rect = rect
+
+    def set_rings(self, centre, radii, lines=()):
+        self.ring_centre = centre
+        self.ring_radii = list(radii)
+        self.ring_lines = list(lines)
+        self.update()
+        
+    def clear_preview(self):
+        self.set_preview(None)
+        
+    def reset(self):
+        # Back to an empty item for reuse by CanvasItemPool
+        self.preview_centre = None
+        self.preview_outer = None
+        self.preview_rect = QRectF()
+        self.ring_centre = None
+        self.ring_radii = []
+        self.ring_lines = []
+        self.instrumentation = None
+
+    def current_preview_rect(self):
+        if self.preview_centre is None:
+            return QRectF()
+        c = self.toCanvasCoordinates(self.preview_centre)
+        radius = 0.0
+        if self.preview_outer is not None:
+            o = self.toCanvasCoordinates(self.preview_outer)
+            radius = math.hypot(o.x() - c.x(), o.y() - c.y())
+        # Leave room for the markers and pen widths
+        margin = radius + MARKER_SIZE
+        return QRectF(c.x() - margin, c.y() - margin, 2 * margin, 2 * margin)
+
+    def screen_coords(self, xs, ys):
+        # Map to canvas pixel coordinates for whole arrays at once. The map
+        # to pixel transform is affine, so it is sampled at three points
+        # around the extent centre and applied with NumPy.
+        centre = self.canvas.extent().center()
+        o = self.toCanvasCoordinates(centre)
+        ex = self.toCanvasCoordinates(QgsPointXY(centre.x() + 1, centre.y())) - o
+        ey = self.toCanvasCoordinates(QgsPointXY(centre.x(), centre.y() + 1)) - o
+        dx = xs - centre.x()
+        dy = ys - centre.y()
+        return (o.x() + dx * ex.x() + dy * ey.x(),
+                o.y() + dx * ex.y() + dy * ey.y())
+
+    def paint(self, painter, option=None, widget=None):
+        if self.instrumentation:
+            with self.instrumentation.stage('paint'):
+                self.paint_all(painter)
+        else:
+            self.paint_all(painter)
+
+    def paint_all(self, painter):
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        if len(self.session):
+            self.paint_session(painter)
+        if self.ring_centre is not None and (self.ring_radii or self.ring_lines):
+            self.paint_rings(painter)
+        if self.preview_centre is not None:
+            self.paint_preview(painter)
+            
+    def paint_rings(self, painter):
+        c = self.toCanvasCoordinates(self.ring_centre)
+        pixels = 1 / self.canvas.mapUnitsPerPixel()
+        painter.setPen(self.ring_pen)
+        painter.setBrush(Qt.NoBrush)
+        for radius in self.ring_radii:
+            painter.drawEllipse(c, radius * pixels, radius * pixels)
+        for xs, ys in self.ring_lines:
+            sx, sy = self.screen_coords(xs, ys)
+            painter.drawPolyline(QPolygonF([QPointF(x, y) for x, y in zip(sx, sy)]))
+
+    def paint_session(self, painter):
+        dest_crs = self.canvas.mapSettings().destinationCrs()
+        points = self.session.cached_display_points(dest_crs)
+        if points is None:
+            if self.request_display_points and self.request_display_points(dest_crs):
+                # Painted once the coordinates arrive
+                return
+            points = self.session.display_points(dest_crs, self.transforms)
+        cx, cy, ox, oy = points
+        scx, scy = self.screen_coords(cx, cy)
+        sox, soy = self.screen_coords(ox, oy)
+        radii = np.hypot(sox - scx, soy - scy)
+
+        # Skip anything which doesn't reach into the visible canvas. Geodesic
+        # outlines can reach a little beyond the planar radius.
+        reach = radii * 1.1 if self.lod else radii
+        width = self.canvas.width()
+        height = self.canvas.height()
+        visible = np.flatnonzero((scx + reach >= 0) & (scx - reach <= width)
+                                & (scy + reach >= 0) & (scy - reach <= height))
+        if not len(visible):
+            return
+
+        painter.setPen(self.circle_pen)
+        painter.setBrush(self.circle_brush)
+        rings = None
+        if self.lod:
+            rings = self.lod.rings(self.session.rows()['id'][visible], cx[visible], cy[visible],
+                                    ox[visible], oy[visible], dest_crs, self.canvas.mapUnitsPerPixel())
+        if rings is None:
+            for i in visible:
+                painter.drawEllipse(QPointF(scx[i], scy[i]), radii[i], radii[i])
+        else:
+            for xs, ys in rings:
+                sx, sy = self.screen_coords(xs, ys)
+                painter.drawPolygon(QPolygonF([QPointF(x, y) for x, y in zip(sx, sy)]))
+
+        painter.setPen(self.line_pen)
+        painter.drawLines([QLineF(scx[i], scy[i], sox[i], soy[i]) for i in visible])
+
+        painter.setPen(self.marker_pen)
+        painter.setBrush(self.marker_brush)
+        half = MARKER_SIZE / 2
+        for i in visible:
+            painter.drawEllipse(QPointF(scx[i], scy[i]), half, half)
+            painter.drawEllipse(QPointF(sox[i], soy[i]), half, half)
+
+    def paint_preview(self, painter):
+        c = self.toCanvasCoordinates(self.preview_centre)
+        if self.preview_outer is not None:
+            o = self.toCanvasCoordinates(self.preview_outer)
+            radius = math.hypot(o.x() - c.x(), o.y() - c.y())
+            painter.setPen(self.circle_pen)
+            painter.setBrush(self.circle_brush)
+            painter.drawEllipse(c, radius, radius)
+            painter.setPen(self.line_pen)
+            painter.drawLine(c, o)
+        painter.setPen(self.marker_pen)
+        painter.setBrush(self.marker_brush)
+        half = MARKER_SIZE / 2
+        painter.drawEllipse(c, half, half)
+
+
+class FrameTimeOverlay(QgsMapCanvasItem):
+    # Small readout of the latest and p90 stage times in the top left corner
+    # of the canvas
+    STAGES = ('frame', 'snap', 'ellipsoidal', 'area', 'render', 'paint')
+
+    def __init__(self, canvas, instrumentation):
+        super(FrameTimeOverlay, self).__init__(canvas)
+        self.instrumentation = instrumentation
+        self.rect = QRectF(10, 10, 240, 12 + 16 * len(self.STAGES))
+        self.font = QFont('LiberationMono', 9)
+        self.setZValue(100)
+
+    def boundingRect(self):
+        return self.rect
+
+    def updatePosition(self):
+        self.setPos(0, 0)
+        self.update()
+
+    def reset(self):
+        self.instrumentation = None
+
+    def paint(self, painter, option=None, widget=None):
+        if self.instrumentation is None:
+            return
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QBrush(QColor(0, 0, 0, 150)))
+        painter.drawRect(self.rect)
+        painter.setPen(QColor(255, 255, 255))
+        painter.setFont(self.font)
+        y = self.rect.top() + 18
+        for name in self.STAGES:
+            histogram = self.instrumentation.histogram(name)
+            stats = histogram.summary()
+            p90 = stats.get('p90_ms', 0.0)
+            painter.drawText(QPointF(self.rect.left() + 8, y),
+                    '{:<12}{:>8.2f} ms  p90 {:>7.2f} ms'.format(name, histogram.last() * 1000, p90))
+            y += 16
+
+
+# Kinds of item CanvasItemPool.leaked() looks for
+POOLED_TYPES = (MeasureRadiusCanvasItem, FrameTimeOverlay)
+
+
+class CanvasItemPool:
+    # Owns the canvas items of a map tool for its whole life, one per name.
+    # Released items are reset and hidden rather than removed from the
+    # scene, and acquiring one again just shows it, so a long session of
+    # measurements allocates no canvas items at all. Only clear() removes
+    # them from the scene, when the tool is unloaded.
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.items = {}
+        self.created = 0
+        self.reused = 0
+        self.removed = 0
+
+    def acquire(self, name, factory):
+        item = self.items.get(name)
+        if item is None:
+            item = factory()
+            self.items[name] = item
+            self.created += 1
+        elif not item.isVisible():
+            item.show()
+            self.reused += 1
+        return item
+
+    def release(self, name):
+        item = self.items.get(name)
+        if item is not None and item.isVisible():
+            item.reset()
+            item.hide()
+
+    def clear(self):
+        scene = self.canvas.scene()
+        for item in self.items.values():
+            if item.scene() is scene:
+                scene.removeItem(item)
+                self.removed += 1
+        self.items.clear()
+
+    def leaked(self):
+        # Items of the pooled kinds in the canvas scene that the pool doesn't
+        # own, e.g. left over from a tool that was never unloaded
+        owned = list(self.items.values())
+        return sum(1 for item in self.canvas.scene().items()
+                    if isinstance(item, POOLED_TYPES) and not any(item is i for i in owned))
+
+    def stats(self):
+        return {'items': len(self.items), 'visible': sum(1 for i in self.items.values() if i.isVisible()),
+                'created': self.created, 'reused': self.reused, 'removed': self.removed,
+                'leaked': self.leaked()}
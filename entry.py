@@ -0,0 +1,110 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import array
+import io
+import math
+import re
+
+import numpy as np
+
+from .geodesic import GeodesicCircleEngine, direct
+
+# Fields may be separated by commas, semicolons, tabs or spaces
+FIELD_SEPARATOR = re.compile(r'[,;\t ]+')
+
+# Upper limit on the number of range rings around one centre
+MAX_RINGS = 200
+
+
+def parse_circle_rows(text):
+    # Reads 'x, y, radius' rows one line at a time into three arrays.
+    # Lines which aren't three finite numbers with a positive radius
+    # (headers, comments, nan, inf) are skipped, their 1-based line numbers
+    # are returned so they can be reported. Blank lines are ignored.
+    xs = array.array('d')
+    ys = array.array('d')
+    radii = array.array('d')
+    skipped = []
+    for number, line in enumerate(io.StringIO(text), 1):
+        if not line.strip():
+            continue
+        fields = FIELD_SEPARATOR.split(line.strip())
+        if len(fields) < 3:
+            skipped.append(number)
+            continue
+        try:
+            x, y, radius = float(fields[0]), float(fields[1]), float(fields[2])
+        except ValueError:
+            skipped.append(number)
+            continue
+        if not (math.isfinite(x) and math.isfinite(y) and math.isfinite(radius)) or radius <= 0:
+            skipped.append(number)
+            continue
+        xs.append(x)
+        ys.append(y)
+        radii.append(radius)
+    return (np.frombuffer(xs, dtype=float), np.frombuffer(ys, dtype=float),
+            np.frombuffer(radii, dtype=float), skipped)
+
+
+def parse_ring_distances(text):
+    # Either 'count x interval', e.g. '5 x 2' for rings at 2, 4, ... 10, or
+    # a list of distances, e.g. '1, 2, 5, 10'. Returns a sorted array, empty
+    # if text can't be read or has a count below one or a non-finite number.
+    text = text.strip().lower()
+    try:
+        if 'x' in text:
+            count, interval = (float(part) for part in text.split('x'))
+            if not (math.isfinite(count) and math.isfinite(interval)) or count < 1:
+                raise ValueError(text)
+            # Huge intervals overflow, which is rejected below
+            with np.errstate(over='ignore'):
+                distances = interval * np.arange(1, min(int(count), MAX_RINGS) + 1)
+        else:
+            distances = np.array([float(part) for part in FIELD_SEPARATOR.split(text) if part])
+        if not np.isfinite(distances).all():
+            raise ValueError(text)
+    except ValueError:
+        return np.zeros(0)
+    return np.unique(distances[distances > 0])[:MAX_RINGS]
+
+
+def transformed_xy(transforms, x, y, src_crs, dest_crs):
+    # nan, nan if the point can't be transformed. QGIS is only imported
+    # here so the parsers above can be used and tested without it.
+    from qgis.core import QgsPointXY, QgsCsException
+    try:
+        point = transforms.point(QgsPointXY(x, y), src_crs, dest_crs)
+    except QgsCsException:
+        return math.nan, math.nan
+    return point.x(), point.y()
+
+
+def geodesic_outer_points(xs, ys, distances, crs, ellipsoid, transforms, azimuth=90.0):
+    # Points distances meters from xs, ys (in crs) along the ellipsoid, due
+    # east by default. None if there is no ellipsoid to measure on. Points
+    # which can't be transformed, e.g. centres outside the area of use of
+    # crs, are nan.
+    try:
+        engine = GeodesicCircleEngine.from_acronym(ellipsoid)
+    except ValueError:
+        return None
+    geographic = crs.toGeographicCrs()
+    centres = np.array([transformed_xy(transforms, x, y, crs, geographic)
+                        for x, y in zip(xs, ys)]).reshape(-1, 2)
+    ok = np.flatnonzero(np.isfinite(centres[:, 0]))
+    lons, lats = direct(centres[ok, 0], centres[ok, 1], azimuth,
+                        np.broadcast_to(distances, len(centres))[ok], engine.semi_major, engine.flattening)
+    outer = np.full((len(centres), 2), math.nan)
+    outer[ok] = np.array([transformed_xy(transforms, x, y, geographic, crs)
+                            for x, y in zip(lons, lats)]).reshape(-1, 2)
+    return outer[:, 0], outer[:, 1]
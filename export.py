@@ -0,0 +1,151 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from qgis.PyQt.QtCore import QTimer, QVariant
+
+from qgis.core import (Qgis, QgsVectorLayer, QgsVectorFileWriter, QgsFeature, QgsField,
+                        QgsFields, QgsProject, QgsCoordinateTransform, QgsWkbTypes,
+                        QgsMessageLog)
+
+import os
+
+from .units import RADIUS_UNIT_NAMES
+
+LAYER_NAME = 'radius_measurements'
+
+
+def radius_field_name(unit_name):
+    return 'radius_' + unit_name.replace(' ', '_')
+
+
+def measurement_fields():
+    fields = QgsFields()
+    fields.append(QgsField('centre_x', QVariant.Double))
+    fields.append(QgsField('centre_y', QVariant.Double))
+    fields.append(QgsField('outer_x', QVariant.Double))
+    fields.append(QgsField('outer_y', QVariant.Double))
+    fields.append(QgsField('crs', QVariant.String))
+    fields.append(QgsField('mode', QVariant.String))
+    for name in RADIUS_UNIT_NAMES:
+        fields.append(QgsField(radius_field_name(name), QVariant.Double))
+    return fields
+
+
+def memory_layer(crs, name='Radius measurements'):
+    # Custom CRSs have no authid to put in the URI
+    layer = QgsVectorLayer('Polygon', name, 'memory')
+    layer.setCrs(crs)
+    layer.dataProvider().addAttributes(measurement_fields().toList())
+    layer.updateFields()
+    return layer
+
+
+def range_ring_layer(crs, name='Range rings'):
+    layer = QgsVectorLayer('LineString', name, 'memory')
+    layer.setCrs(crs)
+    fields = [QgsField('site_id', QVariant.Int),
+                QgsField('distance', QVariant.Double),
+                QgsField('units', QVariant.String)]
+    layer.dataProvider().addAttributes(fields)
+    layer.updateFields()
+    return layer
+
+
+def geopackage_layer(path, crs, layer_name=LAYER_NAME):
+    # Opens layer_name in the GeoPackage at path, creating the file and/or
+    # the layer first if needed
+    uri = '{}|layername={}'.format(path, layer_name)
+    if os.path.exists(path):
+        layer = QgsVectorLayer(uri, layer_name, 'ogr')
+        if layer.isValid():
+            return layer
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.layerName = layer_name
+    if os.path.exists(path):
+        options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+    writer = QgsVectorFileWriter.create(path, measurement_fields(), QgsWkbTypes.Polygon, crs,
+                                        QgsProject.instance().transformContext(), options)
+    if writer.hasError():
+        raise IOError(writer.errorMessage())
+    del writer
+    return QgsVectorLayer(uri, layer_name, 'ogr')
+
+
+class MeasurementWriter:
+    # Streams finished measurements into a vector layer. Features are
+    # buffered and written with one addFeatures() call per batch, which the
+    # OGR provider wraps in a single transaction, either once batch_size
+    # features are waiting or flush_interval ms after the last one arrived.
+
+    def __init__(self, layer, batch_size=500, flush_interval=2000):
+        self.layer = layer
+        self.fields = layer.fields()
+        self.batch_size = batch_size
+        self.buffer = []
+        self.written = 0
+        self.transforms = {}
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(flush_interval)
+        self.timer.timeout.connect(self.flush)
+
+    def add(self, measurement, geometry, radii, mode):
+        # measurement: RadiusMeasurement, geometry: its circle polygon in the
+        # measurement CRS, radii: the radius in every RADIUS_UNIT_NAMES unit
+        ft = QgsFeature(self.fields)
+        geometry = self.to_layer_crs(geometry, measurement.crs)
+        ft.setGeometry(geometry)
+        ft['centre_x'] = measurement.centre.x()
+        ft['centre_y'] = measurement.centre.y()
+        ft['outer_x'] = measurement.outer.x()
+        ft['outer_y'] = measurement.outer.y()
+        # Custom CRSs have no authid, keep their WKT instead
+        ft['crs'] = measurement.crs.authid() or measurement.crs.toWkt()
+        ft['mode'] = mode
+        for name, radius in zip(RADIUS_UNIT_NAMES, radii):
+            ft[radius_field_name(name)] = radius
+        self.buffer.append(ft)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        else:
+            self.timer.start()
+
+    def to_layer_crs(self, geometry, crs):
+        layer_crs = self.layer.crs()
+        if crs == layer_crs:
+            return geometry
+        key = crs.authid() or crs.toWkt()
+        xform = self.transforms.get(key)
+        if xform is None:
+            xform = QgsCoordinateTransform(crs, layer_crs, QgsProject.instance())
+            self.transforms[key] = xform
+        geometry.transform(xform)
+        return geometry
+
+    def flush(self):
+        self.timer.stop()
+        if not self.buffer:
+            return
+        ok, added = self.layer.dataProvider().addFeatures(self.buffer)
+        if not ok:
+            # Keep the batch so the next flush retries it
+            QgsMessageLog.logMessage('Could not write measurements to {}: {}'.format(
+                    self.layer.name(), self.layer.dataProvider().lastError()),
+                    'Measure Radius', Qgis.MessageLevel.Warning)
+            return
+        self.written += len(self.buffer)
+        self.buffer = []
+        self.layer.updateExtents()
+        self.layer.triggerRepaint()
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,281 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+# True geodesic circles: every ring vertex is the solution of the direct
+# geodesic problem (Vincenty) from the centre along one azimuth. Spawned
+# process pool workers import this module, and with it the package
+# __init__.py, to unpickle rings_chunk. Neither imports QGIS or Qt at module
+# level (from_acronym imports qgis.core when called), so workers only load
+# NumPy and the standard library.
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import math
+import multiprocessing
+import multiprocessing.spawn
+import os
+import sys
+
+import numpy as np
+
+# Centres handed to a worker process in one work unit
+CHUNK_SIZE = 2000
+
+
+def direct(lons, lats, azimuths, distances, semi_major, flattening):
+    # Vincenty's direct formula, broadcast over all arguments.
+    # Angles in degrees, distances in meters.
+    b = (1 - flattening) * semi_major
+    lats = np.radians(lats)
+    alpha1 = np.radians(azimuths)
+    sin_alpha1 = np.sin(alpha1)
+    cos_alpha1 = np.cos(alpha1)
+    tan_u1 = (1 - flattening) * np.tan(lats)
+    cos_u1 = 1 / np.sqrt(1 + tan_u1 * tan_u1)
+    sin_u1 = tan_u1 * cos_u1
+    sigma1 = np.arctan2(tan_u1, cos_alpha1)
+    sin_alpha = cos_u1 * sin_alpha1
+    cos2_alpha = 1 - sin_alpha * sin_alpha
+    u2 = cos2_alpha * (semi_major * semi_major - b * b) / (b * b)
+    big_a = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    big_b = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+
+    sigma_0 = distances / (b * big_a)
+    sigma = sigma_0
+    for i in range(100):
+        cos_2sigma_m = np.cos(2 * sigma1 + sigma)
+        sin_sigma = np.sin(sigma)
+        cos_sigma = np.cos(sigma)
+        delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+                cos_sigma * (-1 + 2 * cos_2sigma_m * cos_2sigma_m)
+                - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma * sin_sigma)
+                * (-3 + 4 * cos_2sigma_m * cos_2sigma_m)))
+        sigma_next = sigma_0 + delta_sigma
+        converged = np.all(np.abs(sigma_next - sigma) < 1e-12)
+        sigma = sigma_next
+        if converged:
+            break
+    cos_2sigma_m = np.cos(2 * sigma1 + sigma)
+    sin_sigma = np.sin(sigma)
+    cos_sigma = np.cos(sigma)
+
+    tmp = sin_u1 * sin_sigma - cos_u1 * cos_sigma * cos_alpha1
+    lats2 = np.arctan2(sin_u1 * cos_sigma + cos_u1 * sin_sigma * cos_alpha1,
+                        (1 - flattening) * np.sqrt(sin_alpha * sin_alpha + tmp * tmp))
+    lam = np.arctan2(sin_sigma * sin_alpha1,
+                        cos_u1 * cos_sigma - sin_u1 * sin_sigma * cos_alpha1)
+    c = flattening / 16 * cos2_alpha * (4 + flattening * (4 - 3 * cos2_alpha))
+    big_l = lam - (1 - c) * flattening * sin_alpha * (sigma + c * sin_sigma * (
+            cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m * cos_2sigma_m)))
+    return lons + np.degrees(big_l), np.degrees(lats2)
+
+
+def inverse(lons1, lats1, lons2, lats2, semi_major, flattening, return_converged=False):
+    # Vincenty's inverse formula, broadcast over all arguments. Returns the
+    # geodesic distances in meters. Nearly antipodal pairs, where the
+    # iteration does not converge, keep their last estimate, which can be
+    # off by 100 km. With return_converged a boolean array flagging the
+    # pairs which did converge is returned as well.
+    b = (1 - flattening) * semi_major
+    big_l = np.radians(np.asarray(lons2, dtype=float) - np.asarray(lons1, dtype=float))
+    u1 = np.arctan((1 - flattening) * np.tan(np.radians(lats1)))
+    u2 = np.arctan((1 - flattening) * np.tan(np.radians(lats2)))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+    sin_u1, cos_u1, sin_u2, cos_u2, big_l = np.broadcast_arrays(sin_u1, cos_u1, sin_u2, cos_u2, big_l)
+
+    lam = big_l
+    for i in range(200):
+        sin_lam = np.sin(lam)
+        cos_lam = np.cos(lam)
+        sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha * sin_alpha
+            # Zero on the equator
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+        c = flattening / 16 * cos2_alpha * (4 + flattening * (4 - 3 * cos2_alpha))
+        lam_next = big_l + (1 - c) * flattening * sin_alpha * (sigma + c * sin_sigma * (
+                cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m * cos_2sigma_m)))
+        converged = np.abs(lam_next - lam) < 1e-12
+        lam = lam_next
+        if np.all(converged):
+            break
+
+    u_sq = cos2_alpha * (semi_major * semi_major - b * b) / (b * b)
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m * cos_2sigma_m)
+            - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma * sin_sigma)
+            * (-3 + 4 * cos_2sigma_m * cos_2sigma_m)))
+    meters = b * big_a * (sigma - delta_sigma)
+    if return_converged:
+        return meters, converged
+    return meters
+
+
+def azimuth_table(vertices):
+    # Closed ring of azimuths, clockwise from north
+    azimuths = np.linspace(0.0, 360.0, vertices, endpoint=False)
+    return np.append(azimuths, 0.0)
+
+
+def geodesic_rings(lons, lats, radii, semi_major, flattening, vertices):
+    # One ring per centre, returned as two (centres, vertices + 1) arrays.
+    # Longitudes are continuous along each ring, so a ring crossing the
+    # antimeridian runs past +-180 and one around a pole sweeps a full turn
+    # without closing. lonlat_polygons() makes those valid in lon/lat.
+    lons = np.asarray(lons, dtype=float)[:, None]
+    lats = np.asarray(lats, dtype=float)[:, None]
+    radii = np.asarray(radii, dtype=float)[:, None]
+    ring_lons, ring_lats = direct(lons, lats, azimuth_table(vertices)[None, :], radii, semi_major, flattening)
+    # Whole turns only, so closed rings stay exactly closed
+    turns = np.round(np.diff(ring_lons, axis=1) / 360)
+    ring_lons[:, 1:] -= 360 * np.cumsum(turns, axis=1)
+    return ring_lons, ring_lats
+
+
+def clip_ring(lons, lats, meridian, west):
+    # Part of a closed ring west (or east) of meridian, Sutherland-Hodgman
+    keep = lons <= meridian if west else lons >= meridian
+    xs = []
+    ys = []
+    for i in range(len(lons) - 1):
+        if keep[i]:
+            xs.append(lons[i])
+            ys.append(lats[i])
+        if keep[i] != keep[i + 1]:
+            xs.append(meridian)
+            ys.append(lats[i] + (lats[i + 1] - lats[i]) * (meridian - lons[i]) / (lons[i + 1] - lons[i]))
+    if not xs:
+        return None
+    return np.array(xs + xs[:1]), np.array(ys + ys[:1])
+
+
+def lonlat_polygons(lons, lats):
+    # Polygon parts, as (lons, lats) rings with every longitude within
+    # [-180, 180], of one ring from geodesic_rings(). A ring around a pole
+    # is closed through the pole along the antimeridian, one crossing the
+    # antimeridian is split into a part on either side.
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    if abs(lons[-1] - lons[0]) > 180:
+        # Around a pole, every meridian crosses the ring once
+        xs = (lons[:-1] + 180) % 360 - 180
+        order = np.argsort(xs, kind='stable')
+        xs = xs[order]
+        ys = lats[:-1][order]
+        gap = xs[0] + 360 - xs[-1]
+        edge = ys[-1] + (ys[0] - ys[-1]) * (180 - xs[-1]) / gap if gap else ys[0]
+        pole = math.copysign(90.0, np.mean(lats))
+        return [(np.r_[-180.0, xs, 180.0, 180.0, -180.0, -180.0],
+                    np.r_[edge, ys, edge, pole, pole, edge])]
+    # Bring the ring's middle within [-180, 180]
+    lons = lons - 360 * np.round((lons.min() + lons.max()) / 720)
+    if lons.max() > 180:
+        parts = [clip_ring(lons, lats, 180.0, True), clip_ring(lons - 360, lats, -180.0, False)]
+    elif lons.min() < -180:
+        parts = [clip_ring(lons, lats, -180.0, False), clip_ring(lons + 360, lats, 180.0, True)]
+    else:
+        return [(lons, lats)]
+    return [part for part in parts if part is not None]
+
+
+def rings_chunk(args):
+    # Process pool work unit
+    return geodesic_rings(*args)
+
+
+def python_executable():
+    # Inside QGIS sys.executable is the QGIS binary rather than a Python
+    # interpreter, which spawned workers can't be started with
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    for name in ('python.exe', 'python3', 'python'):
+        for folder in (sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin')):
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+class GeodesicCircleEngine:
+
+    def __init__(self, semi_major, flattening, vertices=360):
+        self.semi_major = semi_major
+        self.flattening = flattening
+        self.vertices = vertices
+
+    @classmethod
+    def from_acronym(cls, acronym, vertices=360):
+        from qgis.core import QgsEllipsoidUtils
+        params = QgsEllipsoidUtils.ellipsoidParameters(acronym)
+        if not params.valid:
+            raise ValueError('Unknown ellipsoid: {}'.format(acronym))
+        flattening = (params.semiMajor - params.semiMinor) / params.semiMajor
+        return cls(params.semiMajor, flattening, vertices)
+
+    def ring(self, lon, lat, radius):
+        lons, lats = self.rings([lon], [lat], [radius])
+        return lons[0], lats[0]
+
+    def rings(self, lons, lats, radii):
+        return geodesic_rings(lons, lats, radii, self.semi_major, self.flattening, self.vertices)
+
+    def chunks(self, lons, lats, radii, chunk_size):
+        radii = np.broadcast_to(np.asarray(radii, dtype=float), np.shape(lons))
+        for start in range(0, len(lons), chunk_size):
+            end = start + chunk_size
+            yield (lons[start:end], lats[start:end], radii[start:end],
+                    self.semi_major, self.flattening, self.vertices)
+
+    def rings_parallel(self, lons, lats, radii, workers=None, chunk_size=CHUNK_SIZE):
+        # Yields (first index, lons, lats) per chunk, in input order. Chunks
+        # are spread over a process pool unless only one worker is asked for.
+        lons = np.asarray(lons, dtype=float)
+        lats = np.asarray(lats, dtype=float)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        work = self.chunks(lons, lats, radii, chunk_size)
+        if workers <= 1 or len(lons) <= chunk_size:
+            results = map(rings_chunk, work)
+            for start, (ring_lons, ring_lats) in zip(range(0, len(lons), chunk_size), results):
+                yield start, ring_lons, ring_lats
+            return
+        # Only a bounded window of chunks is queued ahead of the consumer, so
+        # closing the generator (a cancelled task) cancels whatever hasn't
+        # started yet instead of waiting for every chunk
+        window = 2 * workers
+        pending = deque()
+        # The spawn executable is process global; restore it when done
+        previous = multiprocessing.spawn.get_executable()
+        python = python_executable()
+        if python:
+            multiprocessing.spawn.set_executable(python)
+        pool = ProcessPoolExecutor(max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'))
+        try:
+            for start, args in zip(range(0, len(lons), chunk_size), work):
+                pending.append((start, pool.submit(rings_chunk, args)))
+                if len(pending) >= window:
+                    start, future = pending.popleft()
+                    ring_lons, ring_lats = future.result()
+                    yield start, ring_lons, ring_lats
+            while pending:
+                start, future = pending.popleft()
+                ring_lons, ring_lats = future.result()
+                yield start, ring_lons, ring_lats
+        finally:
+            pool.shutdown(cancel_futures=True)
+            multiprocessing.spawn.set_executable(previous)
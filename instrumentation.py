@@ -0,0 +1,106 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from qgis.core import Qgis, QgsMessageLog
+
+import contextlib
+import time
+
+import numpy as np
+
+# Stages timed by MeasureRadiusTool, in event order
+STAGES = ('snap', 'geometry', 'ellipsoidal', 'area', 'render', 'query', 'dialog', 'paint', 'frame')
+
+# Shared do-nothing context used for every stage when instrumentation is off
+NULL_STAGE = contextlib.nullcontext()
+
+
+class StageHistogram:
+    # Ring buffer of the most recent durations (in seconds) of one stage
+
+    def __init__(self, size):
+        self.samples = np.zeros(size)
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+
+    def recent(self):
+        return self.samples[:min(self.count, len(self.samples))]
+
+    def last(self):
+        if not self.count:
+            return 0.0
+        return self.samples[(self.count - 1) % len(self.samples)]
+
+    def summary(self):
+        recent = self.recent()
+        if not len(recent):
+            return {'count': 0}
+        p50, p90, p99 = np.percentile(recent, [50, 90, 99]) * 1000
+        return {'count': self.count, 'p50_ms': p50, 'p90_ms': p90, 'p99_ms': p99,
+                'max_ms': recent.max() * 1000}
+
+
+class StageTimer:
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add(time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    # Per stage latency histograms for the map tool. Use as
+    #     with instrumentation.stage('snap'):
+    #         ...
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.histograms = {}
+        self.timers = {}
+        self.reset()
+
+    def reset(self):
+        self.histograms = {name: StageHistogram(self.size) for name in STAGES}
+        self.timers = {name: StageTimer(h) for name, h in self.histograms.items()}
+
+    def stage(self, name):
+        return self.timers[name]
+
+    def histogram(self, name):
+        return self.histograms[name]
+
+    def summary(self):
+        return {name: h.summary() for name, h in self.histograms.items()}
+
+    def summary_text(self):
+        lines = []
+        for name, stats in self.summary().items():
+            if not stats['count']:
+                continue
+            lines.append('{:<12} n={:<7} p50={:.3f}ms p90={:.3f}ms p99={:.3f}ms max={:.3f}ms'.format(
+                    name, stats['count'], stats['p50_ms'], stats['p90_ms'],
+                    stats['p99_ms'], stats['max_ms']))
+        return '\n'.join(lines)
+
+    def log_summary(self):
+        text = self.summary_text()
+        if text:
+            QgsMessageLog.logMessage(text, 'Measure Radius', Qgis.MessageLevel.Info)
@@ -0,0 +1,164 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+# Widget free measurement functions shared by the map tool, the Processing
+# algorithms and headless scripts, e.g.
+#
+#     from measure_radius import kernel
+#     kernel.ellipsoidal_radius(centre, outer, crs, 'EPSG:7030', Qgis.DistanceUnit.Kilometers)
+#     kernel.measure_many(cx, cy, ox, oy, crs, crs.ellipsoidAcronym())
+#
+# Points are QgsPointXY, batches are NumPy arrays of coordinates, all in
+# crs. Units are a Qgis.DistanceUnit or an index into RADIUS_UNIT_NAMES.
+# Single ellipsoidal measurements use a QgsDistanceArea owned by the
+# calling thread, so everything here is safe to call from a thread pool.
+from qgis.core import (Qgis, QgsCoordinateTransform, QgsCoordinateTransformContext,
+                        QgsGeometry, QgsLineString, QgsPoint, QgsPointXY, QgsPolygon)
+
+import math
+
+import numpy as np
+
+from .radius_math import (DISTANCE_UNITS, CONVERSION_ARRAY, conversion_factor, convert_lengths,
+                            unit_index, transform_arrays, thread_measurement_context,
+                            CircleTessellator, MeasurementResult)
+from .geodesic import GeodesicCircleEngine, inverse
+
+DEFAULT_TESSELLATOR = CircleTessellator()
+
+
+def convert_length(length, input_units, output_units):
+    return length * conversion_factor(input_units, output_units)
+
+
+def measurement_context(crs, ellipsoid, transform_context=None):
+    # The calling thread's MeasurementContext
+    if transform_context is None:
+        transform_context = QgsCoordinateTransformContext()
+    return thread_measurement_context(crs, ellipsoid, transform_context)
+
+
+def cartesian_radius(centre, outer, crs, units):
+    return convert_length(centre.distance(outer), crs.mapUnits(), units)
+
+
+def cartesian_radii(cx, cy, ox, oy, crs, units):
+    return convert_lengths(np.hypot(np.subtract(ox, cx), np.subtract(oy, cy)), crs.mapUnits(), units)
+
+
+def ellipsoidal_radius(centre, outer, crs, ellipsoid, units, transform_context=None, context=None):
+    # context is a MeasurementContext to use instead of the thread's own,
+    # e.g. the map tool's
+    if context is None:
+        context = measurement_context(crs, ellipsoid, transform_context)
+    da = context.distance_area()
+    return da.convertLengthMeasurement(da.measureLine(centre, outer), DISTANCE_UNITS[unit_index(units)])
+
+
+def geodesic_distances(lons1, lats1, lons2, lats2, geographic, ellipsoid, engine, transform_context=None):
+    # Meters between lon/lat points in geographic, broadcast over all
+    # arguments. Vincenty's inverse formula agrees with QgsDistanceArea to
+    # well under a millimeter, the few nearly antipodal pairs where it
+    # doesn't converge are measured with QgsDistanceArea instead.
+    meters, converged = inverse(lons1, lats1, lons2, lats2, engine.semi_major, engine.flattening, True)
+    missing = np.flatnonzero(~converged)
+    if not len(missing):
+        return meters
+    meters = np.array(meters, dtype=float)
+    lons1, lats1, lons2, lats2 = (a.ravel() for a in np.broadcast_arrays(lons1, lats1, lons2, lats2))
+    da = measurement_context(geographic, ellipsoid, transform_context).distance_area()
+    to_meters = conversion_factor(da.lengthUnits(), Qgis.DistanceUnit.Meters)
+    flat = meters.reshape(-1)
+    for i in missing:
+        flat[i] = da.measureLine(QgsPointXY(lons1[i], lats1[i]), QgsPointXY(lons2[i], lats2[i])) * to_meters
+    return meters
+
+
+def ellipsoidal_radii(cx, cy, ox, oy, crs, ellipsoid, units, transform_context=None):
+    # Vectorized version of ellipsoidal_radius()
+    try:
+        engine = GeodesicCircleEngine.from_acronym(ellipsoid)
+    except ValueError:
+        # Without an ellipsoid QgsDistanceArea measures in the plane
+        return cartesian_radii(cx, cy, ox, oy, crs, units)
+    if transform_context is None:
+        transform_context = QgsCoordinateTransformContext()
+    geographic = crs.toGeographicCrs()
+    xform = QgsCoordinateTransform(crs, geographic, transform_context)
+    lons1, lats1 = transform_arrays(np.asarray(cx, dtype=float), np.asarray(cy, dtype=float), xform)
+    lons2, lats2 = transform_arrays(np.asarray(ox, dtype=float), np.asarray(oy, dtype=float), xform)
+    meters = geodesic_distances(lons1, lats1, lons2, lats2, geographic, ellipsoid, engine, transform_context)
+    return meters * conversion_factor(Qgis.DistanceUnit.Meters, units)
+
+
+def measure(centre, outer, crs, ellipsoid, transform_context=None, context=None):
+    # MeasurementResult with the radius in every unit for both modes
+    if context is None:
+        context = measurement_context(crs, ellipsoid, transform_context)
+    da = context.distance_area()
+    return MeasurementResult.from_lengths(centre.distance(outer), crs.mapUnits(),
+                                            da.measureLine(centre, outer), da.lengthUnits())
+
+
+def measure_many(cx, cy, ox, oy, crs, ellipsoid, transform_context=None):
+    # Radii of many measurements in every unit, as two (measurements,
+    # units) arrays: cartesian and ellipsoidal
+    cartesian = cartesian_radii(cx, cy, ox, oy, crs, 0)
+    ellipsoidal = ellipsoidal_radii(cx, cy, ox, oy, crs, ellipsoid, 0, transform_context)
+    return (cartesian[:, None] * CONVERSION_ARRAY[0], ellipsoidal[:, None] * CONVERSION_ARRAY[0])
+
+
+def geodesic_circle_measures(centre, outer, crs, ellipsoid, vertices, transform_context=None, context=None):
+    # (area in square meters, circumference in meters) of the geodesic
+    # circle through outer, measured by QgsDistanceArea on a ring of
+    # vertices vertices. A coarse ring is cheap enough for every mouse
+    # move, the area of the inscribed ring is short by a fraction of about
+    # (2 * pi / vertices) ** 2 / 6. Without an ellipsoid QgsDistanceArea
+    # measures in the plane, so the circle formulas are exact.
+    if context is None:
+        context = measurement_context(crs, ellipsoid, transform_context)
+    da = context.distance_area()
+    radius = da.convertLengthMeasurement(da.measureLine(centre, outer), Qgis.DistanceUnit.Meters)
+    try:
+        engine = GeodesicCircleEngine.from_acronym(ellipsoid, vertices)
+    except ValueError:
+        return (math.pi * radius ** 2, 2 * math.pi * radius)
+    xform = QgsCoordinateTransform(crs.toGeographicCrs(), crs, context.transform_context)
+    lonlat = xform.transform(QgsPointXY(centre), Qgis.TransformDirection.Reverse)
+    lons, lats = engine.ring(lonlat.x(), lonlat.y(), radius)
+    ring = QgsLineString(lons.tolist(), lats.tolist())
+    ring.transform(xform)
+    poly = QgsPolygon()
+    poly.setExteriorRing(ring)
+    geom = QgsGeometry(poly)
+    return (da.convertAreaMeasurement(da.measureArea(geom), Qgis.AreaUnit.SquareMeters),
+            da.convertLengthMeasurement(da.measurePerimeter(geom), Qgis.DistanceUnit.Meters))
+
+
+def radius_line(centre, outer):
+    return QgsGeometry.fromPolyline([QgsPoint(centre), QgsPoint(outer)])
+
+
+def circle_vertex_count(radius, map_units_per_pixel, tessellator=DEFAULT_TESSELLATOR):
+    # Enough vertices for a circle of radius map units to look round on screen
+    return tessellator.vertex_count(radius / map_units_per_pixel)
+
+
+def circle_geometry(centre, outer, vertices=None, tessellator=DEFAULT_TESSELLATOR):
+    # Polygon through outer, with the finest tessellation unless vertices is given
+    if vertices is None:
+        vertices = tessellator.max_vertices
+    return tessellator.circle_geom(centre, outer, vertices)
+
+
+def circle_rings(cx, cy, ox, oy, vertices, tessellator=DEFAULT_TESSELLATOR):
+    # Ring coordinates of many circles as two (circles, vertices + 1) arrays
+    return tessellator.ring_arrays(cx, cy, np.subtract(ox, cx), np.subtract(oy, cy), vertices)
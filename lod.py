@@ -0,0 +1,190 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from collections import OrderedDict
+import math
+
+import numpy as np
+
+from .geodesic import GeodesicCircleEngine, geodesic_rings
+
+# Rings more than this many scale buckets away from the current one are
+# dropped when the canvas zooms
+KEEP_BUCKETS = 4
+
+
+def scale_bucket(map_units_per_pixel):
+    # Zoom levels in half octave steps
+    return int(math.floor(2 * math.log2(map_units_per_pixel)))
+
+
+def bucket_units_per_pixel(bucket):
+    return 2 ** (bucket / 2)
+
+
+class LodCache:
+    # Least recently used cache of ring coordinate arrays keyed by
+    # (measurement id, scale bucket), capped at max_bytes
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        ring = self.entries.get(key)
+        if ring is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return ring
+
+    def put(self, key, ring):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[0].nbytes + old[1].nbytes
+        self.entries[key] = ring
+        self.bytes += ring[0].nbytes + ring[1].nbytes
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            self.pop_oldest()
+
+    def pop_oldest(self):
+        key, ring = self.entries.popitem(last=False)
+        self.bytes -= ring[0].nbytes + ring[1].nbytes
+        self.evictions += 1
+
+    def discard_buckets(self, keep):
+        # keep: callable(bucket) -> bool
+        for key in [key for key in self.entries if not keep(key[1])]:
+            ring = self.entries.pop(key)
+            self.bytes -= ring[0].nbytes + ring[1].nbytes
+
+    def discard_measurement(self, measurement_id):
+        for key in [key for key in self.entries if key[0] == measurement_id]:
+            ring = self.entries.pop(key)
+            self.bytes -= ring[0].nbytes + ring[1].nbytes
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+class GeodesicCircleLod:
+    # Geodesic outlines of stored measurements in the canvas CRS, for
+    # display in ellipsoidal mode. Each outline gets just enough vertices
+    # for its size on screen at the current zoom, so small circles cost a
+    # handful of vertices and zooming in swaps in finer rings.
+
+    def __init__(self, measure_context, transforms, tessellator, max_bytes=16 * 1024 * 1024):
+        self.measure_context = measure_context
+        self.transforms = transforms
+        self.tessellator = tessellator
+        self.cache = LodCache(max_bytes)
+        # measurement id -> (lon, lat, radius in meters), independent of zoom
+        self.params = {}
+        self.crs = None
+        self.bucket = None
+        self.engine = None
+        self.ellipsoid = None
+
+    def clear(self):
+        self.cache.clear()
+        self.params.clear()
+
+    def forget(self, measurement_id):
+        # Called when a measurement is removed, its id is never reused
+        if measurement_id is None:
+            return
+        self.params.pop(int(measurement_id), None)
+        self.cache.discard_measurement(int(measurement_id))
+
+    def set_crs(self, crs):
+        if crs != self.crs or self.measure_context.ellipsoid != self.ellipsoid:
+            self.crs = crs
+            self.ellipsoid = self.measure_context.ellipsoid
+            try:
+                self.engine = GeodesicCircleEngine.from_acronym(self.ellipsoid)
+            except ValueError:
+                self.engine = None
+            self.clear()
+
+    def set_scale(self, map_units_per_pixel):
+        # Called when the canvas extent changes. Rings for zoom levels far
+        # from the new one are unlikely to be needed again soon.
+        bucket = scale_bucket(map_units_per_pixel)
+        if bucket != self.bucket:
+            self.bucket = bucket
+            self.cache.discard_buckets(lambda b: abs(b - bucket) <= KEEP_BUCKETS)
+        return bucket
+
+    def rings(self, ids, cx, cy, ox, oy, crs, map_units_per_pixel):
+        # (xs, ys) arrays per measurement in crs, or None if there is no
+        # ellipsoid to draw geodesic circles on
+        self.set_crs(crs)
+        if self.engine is None:
+            return None
+        bucket = scale_bucket(map_units_per_pixel)
+        rings = [self.cache.get((int(mid), bucket)) for mid in ids]
+        missing = [i for i, ring in enumerate(rings) if ring is None]
+        if missing:
+            for i, ring in zip(missing, self.build([ids[i] for i in missing], cx[missing], cy[missing],
+                                                    ox[missing], oy[missing], bucket)):
+                rings[i] = ring
+                self.cache.put((int(ids[i]), bucket), ring)
+        return rings
+
+    def build(self, ids, cx, cy, ox, oy, bucket):
+        # QGIS is only imported here so LodCache can be used and tested
+        # without it
+        from qgis.core import Qgis, QgsLineString, QgsPointXY
+        from .radius_math import conversion_factor
+        geographic = self.crs.toGeographicCrs()
+        da = self.measure_context.distance_area()
+        to_meters = conversion_factor(da.lengthUnits(), Qgis.DistanceUnit.Meters)
+        lons = np.zeros(len(ids))
+        lats = np.zeros(len(ids))
+        radii = np.zeros(len(ids))
+        for i, mid in enumerate(ids):
+            params = self.params.get(int(mid))
+            if params is None:
+                centre = QgsPointXY(cx[i], cy[i])
+                lonlat = self.transforms.point(centre, self.crs, geographic)
+                radius = da.measureLine(centre, QgsPointXY(ox[i], oy[i])) * to_meters
+                params = (lonlat.x(), lonlat.y(), radius)
+                self.params[int(mid)] = params
+            lons[i], lats[i], radii[i] = params
+
+        # Vertex counts for the on screen size at this zoom level, rings
+        # with the same count are generated together
+        radius_px = np.hypot(ox - cx, oy - cy) / bucket_units_per_pixel(bucket)
+        counts = np.array([self.tessellator.vertex_count(r) for r in radius_px])
+        xform = self.transforms.transform(geographic, self.crs)
+        rings = [None] * len(ids)
+        for n in np.unique(counts):
+            group = np.flatnonzero(counts == n)
+            ring_lons, ring_lats = geodesic_rings(lons[group], lats[group], radii[group],
+                                                    self.engine.semi_major, self.engine.flattening, int(n))
+            for row, i in enumerate(group):
+                line = QgsLineString(ring_lons[row].tolist(), ring_lats[row].tolist())
+                line.transform(xform)
+                rings[i] = (np.array(line.xVector()), np.array(line.yVector()))
+        return rings
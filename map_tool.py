@@ -0,0 +1,1397 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from qgis.PyQt.QtCore import Qt, QTimer
+from qgis.PyQt.QtWidgets import (QDialog, QLabel, QLineEdit, QComboBox,
+                            QRadioButton, QHBoxLayout, QVBoxLayout, QPushButton,
+                            QFileDialog, QTreeWidget, QTreeWidgetItem, QInputDialog,
+                            QApplication, QSpinBox, QCheckBox)
+                            
+from qgis.PyQt.QtGui import QFont, QKeySequence
+
+from qgis.core import (Qgis, QgsProject, QgsGeometry,
+                        QgsPointXY, QgsCoordinateReferenceSystem, QgsPointLocator,
+                        QgsMessageLog, QgsVectorLayer, QgsFeature, QgsLineString,
+                        QgsMapLayerProxyModel, QgsCsException)
+
+from qgis.gui import QgsMapTool, QgsSnapIndicator, QgsCheckableComboBox, QgsMapLayerComboBox
+
+import math
+import time
+
+import numpy as np
+
+from .units import RADIUS_UNIT_NAMES
+from .radius_math import (DISTANCE_UNITS, conversion_factor, CircleTessellator,
+                            MeasurementContext, RadiusMeasurement, TransformCache,
+                            transform_arrays)
+from . import kernel
+from .session import MeasurementSession
+from .canvas_items import MeasureRadiusCanvasItem, FrameTimeOverlay, CanvasItemPool
+from .instrumentation import Instrumentation, NULL_STAGE
+from .export import MeasurementWriter, memory_layer, geopackage_layer, range_ring_layer
+from .tasks import LatestTaskRunner, ellipsoidal_length_job, circle_measures_job, display_points_job
+from .query import RadiusQuery, planar_rect, ellipsoidal_rect
+from .entry import parse_circle_rows, parse_ring_distances, geodesic_outer_points, transformed_xy
+from .geodesic import GeodesicCircleEngine
+from .lod import GeodesicCircleLod
+from .matrix import DistanceMatrix
+from .traces import TraceRecorder
+
+# Feature ids listed per layer in the query results
+MAX_LISTED_FEATURES = 1000
+
+# Vertices of every drawn and exported ellipsoidal range ring
+RING_VERTICES = 360
+
+# Vertices of the geodesic ring measured for the live ellipsoidal area and
+# circumference while dragging, refined on the finest ring once the
+# measurement is finished
+LIVE_AREA_VERTICES = 64
+
+
+class MeasureRadiusDialog(QDialog):
+    
+    def __init__(self):
+        super(MeasureRadiusDialog, self).__init__()
+        self.setGeometry( 100, 100, 550, 200)
+        self.setWindowTitle('Measure')
+        
+        self.radius_combo_items = RADIUS_UNIT_NAMES
+        
+        self.x_label = QLabel('Centre X', self)
+        self.x_edit = QLineEdit(self)
+        self.y_label = QLabel('Centre Y', self)
+        self.y_edit = QLineEdit(self)
+        self.x_layout = QHBoxLayout()
+        self.x_layout.addWidget(self.x_label)
+        self.x_layout.addWidget(self.x_edit)
+        self.y_layout = QHBoxLayout()
+        self.y_layout.addWidget(self.y_label)
+        self.y_layout.addWidget(self.y_edit)
+        
+        self.radius_label = QLabel('Radius', self)
+        self.radius_edit = QLineEdit(self)
+        self.radius_combo = QComboBox(self)
+        self.radius_combo.setMinimumWidth(200)
+        self.radius_combo.addItems(self.radius_combo_items)
+        self.radius_layout = QHBoxLayout()
+        self.radius_layout.addWidget(self.radius_label)
+        self.radius_layout.addWidget(self.radius_edit)
+        self.radius_layout.addWidget(self.radius_combo)
+        
+        self.circumference_label = QLabel('Circumference', self)
+        self.circumference_edit = QLineEdit(self)
+        self.circumference_edit.setReadOnly(True)
+        self.area_label = QLabel('Area', self)
+        self.area_edit = QLineEdit(self)
+        self.area_edit.setReadOnly(True)
+        self.area_units_label = QLabel(self)
+        self.shape_layout = QHBoxLayout()
+        self.shape_layout.addWidget(self.circumference_label)
+        self.shape_layout.addWidget(self.circumference_edit)
+        self.shape_layout.addWidget(self.area_label)
+        self.shape_layout.addWidget(self.area_edit)
+        self.shape_layout.addWidget(self.area_units_label)
+        
+        self.cartesian_rb = QRadioButton('Cartesian', self)
+        self.cartesian_rb.setChecked(True)
+        self.ellipsoidal_rb = QRadioButton('Ellipsoidal', self)
+        self.rb_layout = QHBoxLayout()
+        self.rb_layout.addWidget(self.cartesian_rb)
+        self.rb_layout.addWidget(self.ellipsoidal_rb)
+        self.rb_layout.addStretch()
+        
+        self.rings_label = QLabel('Range rings', self)
+        self.rings_edit = QLineEdit(self)
+        self.rings_edit.setPlaceholderText('5 x 1  or  1, 2, 5, 10')
+        self.rings_combo = QComboBox(self)
+        self.rings_combo.addItems(self.radius_combo_items)
+        self.rings_button = QPushButton('Rings to layer', self)
+        self.rings_layout = QHBoxLayout()
+        self.rings_layout.addWidget(self.rings_label)
+        self.rings_layout.addWidget(self.rings_edit)
+        self.rings_layout.addWidget(self.rings_combo)
+        self.rings_layout.addWidget(self.rings_button)
+        
+        self.query_label = QLabel('Query layers', self)
+        self.query_combo = QgsCheckableComboBox(self)
+        self.query_combo.setMinimumWidth(200)
+        self.query_layout = QHBoxLayout()
+        self.query_layout.addWidget(self.query_label)
+        self.query_layout.addWidget(self.query_combo)
+        self.query_layout.addStretch()
+        self.query_tree = QTreeWidget(self)
+        self.query_tree.setHeaderLabels(['Layer / feature', 'Features'])
+        self.query_tree.setMinimumHeight(120)
+        
+        self.matrix_label = QLabel('Distances to', self)
+        self.matrix_combo = QgsMapLayerComboBox(self)
+        self.matrix_combo.setFilters(QgsMapLayerProxyModel.VectorLayer)
+        self.matrix_combo.setAllowEmptyLayer(True)
+        self.matrix_combo.setLayer(None)
+        self.matrix_count_label = QLabel('Nearest', self)
+        self.matrix_count = QSpinBox(self)
+        self.matrix_count.setRange(1, 10000)
+        self.matrix_count.setValue(10)
+        self.matrix_vertices_cb = QCheckBox('Each vertex', self)
+        self.matrix_layout = QHBoxLayout()
+        self.matrix_layout.addWidget(self.matrix_label)
+        self.matrix_layout.addWidget(self.matrix_combo)
+        self.matrix_layout.addWidget(self.matrix_count_label)
+        self.matrix_layout.addWidget(self.matrix_count)
+        self.matrix_layout.addWidget(self.matrix_vertices_cb)
+        self.matrix_tree = QTreeWidget(self)
+        self.matrix_tree.setHeaderLabels(['Feature', 'Cartesian', 'Ellipsoidal'])
+        self.matrix_tree.setRootIsDecorated(False)
+        self.matrix_tree.setMinimumHeight(120)
+        
+        self.record_label = QLabel('Record to', self)
+        self.record_combo = QComboBox(self)
+        self.record_combo.addItems(['Nothing', 'Memory layer', 'GeoPackage...'])
+        self.record_layout = QHBoxLayout()
+        self.record_layout.addWidget(self.record_label)
+        self.record_layout.addWidget(self.record_combo)
+        self.record_layout.addStretch()
+
+        self.paste_button = QPushButton('Paste circles...', self)
+        self.undo_button = QPushButton('Undo', self)
+        self.new_button = QPushButton('New', self)
+        self.close_button = QPushButton('Close', self)
+        self.button_layout = QHBoxLayout()
+        self.button_layout.addWidget(self.paste_button)
+        self.button_layout.addStretch()
+        self.button_layout.addWidget(self.undo_button)
+        self.button_layout.addWidget(self.new_button)
+        self.button_layout.addWidget(self.close_button)
+        
+        self.main_layout = QVBoxLayout(self)
+        self.main_layout.addLayout(self.x_layout)
+        self.main_layout.addLayout(self.y_layout)
+        self.main_layout.addLayout(self.radius_layout)
+        self.main_layout.addLayout(self.shape_layout)
+        self.main_layout.addLayout(self.rb_layout)
+        self.main_layout.addLayout(self.rings_layout)
+        self.main_layout.addLayout(self.query_layout)
+        self.main_layout.addWidget(self.query_tree)
+        self.main_layout.addLayout(self.matrix_layout)
+        self.main_layout.addWidget(self.matrix_tree)
+        self.main_layout.addLayout(self.record_layout)
+        self.main_layout.addStretch()
+        self.main_layout.addLayout(self.button_layout)
+        
+        self.edit_font = QFont('LiberationSans', 12)
+        self.edit_font.setBold(True)
+        
+        self.x_edit.setFont(self.edit_font)
+        self.y_edit.setFont(self.edit_font)
+        self.radius_edit.setFont(self.edit_font)
+        self.radius_edit.setAlignment(Qt.AlignRight)
+        self.circumference_edit.setAlignment(Qt.AlignRight)
+        self.area_edit.setAlignment(Qt.AlignRight)
+        
+        self.close_button.clicked.connect(lambda: self.close())
+
+class FrameScheduler:
+    # Coalesces a burst of mouse moves into at most one call of callback
+    # per display frame. Only the most recent point is kept.
+    
+    def __init__(self, callback, interval=16):
+        self.callback = callback
+        self.pending_point = None
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.fire)
+        
+    def schedule(self, point):
+        self.pending_point = point
+        if not self.timer.isActive():
+            self.timer.start()
+            
+    def flush(self):
+        # Run any pending frame straight away
+        if self.timer.isActive():
+            self.timer.stop()
+            self.fire()
+            
+    def cancel(self):
+        self.timer.stop()
+        self.pending_point = None
+        
+    def fire(self):
+        point = self.pending_point
+        self.pending_point = None
+        if point is not None:
+            self.callback(point)
+
+class SnappingThrottle:
+    # Cuts down the snapToMap() queries made while the mouse moves:
+    # - moves of less than a pixel reuse the previous result
+    # - the last match is reused while the cursor stays within window
+    #   pixels of the snapped point
+    # - at most one query is made every min_interval seconds, moves in
+    #   between keep the last result
+    # - while the cursor moves faster than fast_move pixels per event the
+    #   query is deferred until it settles
+    # A query skipped by either of the last two is made once the cursor has
+    # been still for idle_interval ms, then idle_callback is called with
+    # the snapped point. Clicks should always use snap_exact(). clock
+    # returns seconds and is only replaced by tests.
+    
+    def __init__(self, canvas, snap_utils, snap_indicator, window=2.0, fast_move=30.0,
+                    min_interval=0.02, idle_interval=50, clock=time.perf_counter):
+        self.canvas = canvas
+        self.snap_utils = snap_utils
+        self.snap_indicator = snap_indicator
+        self.window = window
+        self.fast_move = fast_move
+        self.min_interval = min_interval
+        self.clock = clock
+        self.last_query = -math.inf
+        self.defer_when_fast = True
+        self.idle_callback = None
+        self.last_pixel = None
+        self.last_match = QgsPointLocator.Match()
+        self.idle_point = None
+        self.queries = 0
+        self.skipped = 0
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(idle_interval)
+        self.timer.timeout.connect(self.idle_snap)
+        
+    def snap(self, map_point, pixel):
+        if self.last_pixel is None:
+            moved = math.inf
+        else:
+            moved = math.hypot(pixel.x() - self.last_pixel.x(), pixel.y() - self.last_pixel.y())
+        self.last_pixel = pixel
+        if moved < 1:
+            self.skipped += 1
+            return self.last_match.point() if self.last_match.isValid() else map_point
+        if self.last_match.isValid():
+            match_pixel = self.canvas.getCoordinateTransform().transform(self.last_match.point())
+            if math.hypot(match_pixel.x() - pixel.x(), match_pixel.y() - pixel.y()) <= self.window:
+                self.skipped += 1
+                return self.last_match.point()
+        # The first move after a reset has nothing to measure its speed by
+        if self.defer_when_fast and self.fast_move < moved < math.inf:
+            self.defer(map_point)
+            self.set_match(QgsPointLocator.Match())
+            return map_point
+        if self.clock() - self.last_query < self.min_interval:
+            self.defer(map_point)
+            self.skipped += 1
+            return self.last_match.point() if self.last_match.isValid() else map_point
+        return self.snap_exact(map_point)
+        
+    def defer(self, map_point):
+        self.idle_point = map_point
+        self.timer.start()
+        
+    def snap_exact(self, map_point):
+        self.timer.stop()
+        self.idle_point = None
+        match = self.snap_utils.snapToMap(map_point)
+        self.queries += 1
+        self.last_query = self.clock()
+        self.set_match(match)
+        if match.isValid():
+            # cursor is snapped to a vertex/segment (based on snapping settings)
+            return match.point()
+        return map_point
+        
+    def set_match(self, match):
+        self.last_match = match
+        self.snap_indicator.setMatch(match)
+        
+    def idle_snap(self):
+        if self.idle_point is None:
+            return
+        point = self.snap_exact(self.idle_point)
+        if self.idle_callback:
+            self.idle_callback(point)
+            
+    def reset(self):
+        # Cached pixel positions are meaningless after the map moves
+        self.timer.stop()
+        self.idle_point = None
+        self.last_pixel = None
+        self.last_query = -math.inf
+        self.last_match = QgsPointLocator.Match()
+
+class MeasureRadiusTool(QgsMapTool):
+    
+    def __init__(self, canvas):
+        self.canvas = canvas
+        QgsMapTool.__init__(self, self.canvas)
+        
+        self.project = QgsProject.instance()
+        self.crs = self.project.crs()
+        self.ellipsoid = self.crs.ellipsoidAcronym()
+        self.units = self.crs.mapUnits()
+        
+        self.drawing = False
+        
+        self.centre_point = None
+        self.outer_point = None
+        
+        self.radius_length = 0.0
+        # Source of truth for the current measurement, centre_point and
+        # outer_point are its display coordinates in the project CRS
+        self.measurement = None
+        # Finalized measurements. They and the live preview are all painted
+        # by a single canvas item.
+        self.session = MeasurementSession()
+        # Canvas items are reused for the life of the tool, render_item is
+        # None while the pooled one is released
+        self.items = CanvasItemPool(self.canvas)
+        self.render_item = None
+        # Id of the finalized measurement shown in the dialog and the
+        # MeasurementResult of every finalized measurement by id
+        self.measurement_id = None
+        self.result = None
+        self.results = {}
+        # Whether the dialog shows the coarse ellipsoidal area and
+        # circumference of the measurement being drawn
+        self.live_area = False
+        
+        self.dlg = MeasureRadiusDialog()
+        # self.dlg.show()
+        self.reset_dlg_line_edits()
+        
+        self.dlg.radius_combo.currentIndexChanged.connect(self.units_changed)
+        
+        self.dlg.cartesian_rb.toggled.connect(self.radios_toggled)
+        
+        self.dlg.finished.connect(self.dialog_closed)
+        self.dlg.new_button.clicked.connect(self.new_measurement)
+        self.dlg.undo_button.clicked.connect(self.undo_measurement)
+        # Typing a centre and radius and pressing Enter draws the circle
+        self.dlg.x_edit.returnPressed.connect(self.typed_measurement)
+        self.dlg.y_edit.returnPressed.connect(self.typed_measurement)
+        self.dlg.radius_edit.returnPressed.connect(self.typed_measurement)
+        self.dlg.paste_button.clicked.connect(self.paste_measurements)
+        self.dlg.rings_edit.textChanged.connect(self.update_rings)
+        self.dlg.rings_combo.currentIndexChanged.connect(self.update_rings)
+        self.dlg.rings_button.clicked.connect(self.export_range_rings)
+        self.dlg.matrix_combo.layerChanged.connect(self.matrix_layer_changed)
+        self.dlg.matrix_count.valueChanged.connect(self.show_matrix)
+        self.dlg.matrix_vertices_cb.toggled.connect(self.update_matrix)
+        self.dlg.record_combo.currentIndexChanged.connect(self.record_target_changed)
+        
+        # Streams finished measurements to a layer when recording
+        self.writer = None
+        
+        # Features of the layers checked in the dialog within the circle
+        self.dlg.query_combo.checkedItemsChanged.connect(self.query_layers_changed)
+        
+        # Project signals are only connected while the tool is active, see
+        # activate()
+        self.project_connected = False
+        self.measure_context = MeasurementContext(self.crs, self.ellipsoid, self.project.transformContext())
+        self.transforms = TransformCache(self.project.transformContext())
+        
+        self.distance_units = DISTANCE_UNITS
+        
+        #####################August 2024###########################
+        self.snap_indicator = QgsSnapIndicator(self.canvas)
+        self.snap_utils = self.canvas.snappingUtils()
+        #####################August 2024###########################
+        
+        self.tessellator = CircleTessellator()
+        self.query = RadiusQuery(self.transforms, self.query_index_ready)
+        # Zoom dependent geodesic outlines of stored circles in ellipsoidal mode
+        self.lod = GeodesicCircleLod(self.measure_context, self.transforms, self.tessellator)
+        # Distances from the centre to every feature of the chosen layer
+        self.matrix = DistanceMatrix(self.transforms, self.matrix_ready)
+        self.matrix_result = None
+        self.canvas.extentsChanged.connect(self.lod_extents_changed)
+        self.render_scheduler = FrameScheduler(self.render_preview)
+        
+        self.snapper = SnappingThrottle(self.canvas, self.snap_utils, self.snap_indicator)
+        self.snapper.idle_callback = self.idle_snapped
+        self.canvas.extentsChanged.connect(self.snapper.reset)
+        
+        # Opt-in stage timings, see enable_instrumentation()
+        self.instrumentation = None
+        self.overlay = None
+        # Opt-in input trace, see start_trace()
+        self.recorder = None
+        
+        # Ellipsoidal lengths and reprojection of stored measurements run in
+        # QgsTasks so the GUI thread only ever draws the planar preview.
+        # Turn off to compute everything inline (benchmarks, replays).
+        self.async_measurements = True
+        self.length_runner = LatestTaskRunner('Measure radius: ellipsoidal length')
+        self.area_runner = LatestTaskRunner('Measure radius: ellipsoidal area')
+        self.display_runner = LatestTaskRunner('Measure radius: reproject measurements')
+        self.display_request = None
+        
+    ######UTILS TO CALCULATE DISTANCES, AREAS, ELLIPSOIDAL, CARTESIAN ETC#######
+    #########AND TRANSFORM BETWEEN CRS E.G. WHEN PROJECT CRS IS CHANGED#########
+    def cartesian_length(self, length, input_units, output_units):
+        return kernel.convert_length(length, input_units, output_units)
+        
+    def cartesian_lengths(self, lengths, input_units, output_units):
+        return kernel.convert_lengths(lengths, input_units, output_units)
+    ############################################################################
+    def ellipsoidal_length(self, pt1, pt2):
+        with self.stage('ellipsoidal'):
+            converted_length = kernel.ellipsoidal_radius(pt1, pt2, self.crs, self.measure_context.ellipsoid,
+                                                            self.dlg.radius_combo.currentIndex(),
+                                                            context=self.measure_context)
+        return converted_length
+            
+    def update_radius_text(self, outer_point):
+        # Show the current radius in the dialog. Ellipsoidal lengths are
+        # measured in a background task when async_measurements is on and the
+        # text is filled in when the latest one arrives.
+        if self.dlg.cartesian_rb.isChecked():
+            # A pending ellipsoidal result must not overwrite this
+            self.length_runner.cancel()
+            self.area_runner.cancel()
+            radius = self.cartesian_length(self.radius_length, self.units,
+                                            self.dlg.radius_combo.currentIndex())
+            self.set_radius_text(radius)
+            self.set_shape_text(2 * math.pi * radius, math.pi * radius ** 2)
+            self.live_area = False
+        elif self.dlg.ellipsoidal_rb.isChecked():
+            if self.async_measurements:
+                units = self.distance_units[self.dlg.radius_combo.currentIndex()]
+                self.length_runner.submit(ellipsoidal_length_job, self.set_radius_text,
+                                            QgsCoordinateReferenceSystem(self.crs), self.ellipsoid,
+                                            self.project.transformContext(),
+                                            QgsPointXY(self.centre_point), QgsPointXY(outer_point), units)
+                self.area_runner.submit(circle_measures_job, self.set_geodesic_text,
+                                        QgsCoordinateReferenceSystem(self.crs), self.ellipsoid,
+                                        self.project.transformContext(), QgsPointXY(self.centre_point),
+                                        QgsPointXY(outer_point), LIVE_AREA_VERTICES)
+            else:
+                self.set_radius_text(self.ellipsoidal_length(self.centre_point, outer_point))
+                self.set_geodesic_text(self.circle_measures(self.centre_point, outer_point,
+                                                            LIVE_AREA_VERTICES))
+            self.live_area = True
+                
+    def circle_measures(self, centre, outer, vertices):
+        with self.stage('area'):
+            return kernel.geodesic_circle_measures(centre, outer, self.crs, self.measure_context.ellipsoid,
+                                                    vertices, context=self.measure_context)
+            
+    def radios_toggled(self):
+        if self.recorder:
+            self.recorder.mode(self.dlg.ellipsoidal_rb.isChecked())
+        self.update_rings()
+        self.show_matrix()
+        if self.render_item:
+            self.render_item.lod = self.lod if self.dlg.ellipsoidal_rb.isChecked() else None
+            self.render_item.update()
+        if not self.centre_point or not self.outer_point:
+            return
+        if self.result and not self.drawing:
+            self.show_result()
+            # Planar and ellipsoidal tests can give different features
+            self.query_measurement()
+            return
+        self.update_radius_text(self.outer_point)
+        
+    def units_changed(self, idx):
+        if self.recorder:
+            self.recorder.units(idx)
+        self.set_area_units()
+        self.show_matrix()
+        if not self.centre_point or not self.outer_point:
+            return
+        if self.result and not self.drawing:
+            self.show_result()
+            return
+        self.update_radius_text(self.outer_point)
+
+    def crs_changed(self):
+        self.crs = self.project.crs()
+        if self.recorder:
+            self.recorder.crs(self.crs)
+        self.ellipsoid = self.crs.ellipsoidAcronym()
+        self.units = self.crs.mapUnits()
+        self.measure_context.set_crs(self.crs, self.ellipsoid)
+        # Cartesian radii are in the units of the old CRS
+        self.results.clear()
+        self.lod.clear()
+        self.result = None
+        # Any pending preview point is in the old CRS
+        self.render_scheduler.cancel()
+        self.snapper.reset()
+        
+        # Regenerate display geometry from the measurement model rather than
+        # reprojecting the rubber band geometries
+        if self.measurement:
+            m = self.measurement
+            self.centre_point = self.transforms.point(m.centre, m.crs, self.crs)
+            if m.outer is not None:
+                self.outer_point = self.transforms.point(m.outer, m.crs, self.crs)
+            self.set_centre_text()
+            self.redraw_measurement()
+            self.update_rings()
+            self.update_matrix()
+        if self.render_item:
+            self.render_item.update()
+        
+        ##########10-12-23######################################################
+        if not self.centre_point or not self.outer_point:
+            return
+        if self.measurement_id is not None and not self.drawing:
+            self.result = self.measurement_result(self.measurement_id)
+            self.show_result()
+            self.query_measurement()
+            return
+        self.update_radius_text(self.outer_point)
+        #######################################################################
+                
+    def transform_context_changed(self):
+        self.measure_context.set_transform_context(self.project.transformContext())
+        self.transforms.set_transform_context(self.project.transformContext())
+        self.session.invalidate_display()
+        self.display_runner.cancel()
+        self.results.clear()
+        self.lod.clear()
+        if self.result:
+            self.result = self.measurement_result(self.measurement_id)
+            self.show_result()
+        
+    def redraw_measurement(self):
+        if self.outer_point:
+            self.radius_length = self.centre_point.distance(self.outer_point)
+        if self.drawing:
+            self.canvas_item().set_preview(self.centre_point, self.outer_point)
+            
+    def set_outer_point(self, point):
+        # point is in the project CRS, the model keeps it in its own CRS
+        self.outer_point = point
+        m = self.measurement
+        m.outer = self.transforms.point_back(point, m.crs, self.crs)
+        
+    def set_centre_text(self):
+        if self.project.crs().isGeographic():
+            rounding_val = 5
+        else:
+            rounding_val = 3
+        self.dlg.x_edit.setText(str(round(self.centre_point.x(), rounding_val)))
+        self.dlg.y_edit.setText(str(round(self.centre_point.y(), rounding_val)))
+        
+    def show_measurement(self, measurement_id):
+        # Make a stored measurement the current one shown in the dialog
+        m = self.session.measurement(measurement_id)
+        self.measurement = m
+        self.measurement_id = measurement_id if m else None
+        self.result = None
+        if m is None:
+            self.centre_point = None
+            self.outer_point = None
+            self.radius_length = 0.0
+            self.reset_dlg_line_edits()
+            self.dlg.query_tree.clear()
+            self.update_rings()
+            self.update_matrix()
+            return
+        self.centre_point = self.transforms.point(m.centre, m.crs, self.crs)
+        self.outer_point = self.transforms.point(m.outer, m.crs, self.crs)
+        self.radius_length = self.centre_point.distance(self.outer_point)
+        self.set_centre_text()
+        self.result = self.measurement_result(measurement_id)
+        self.show_result()
+        self.query_measurement()
+        self.update_rings()
+        self.update_matrix()
+        
+    def measurement_result(self, measurement_id, centre=None, outer=None):
+        # Both modes in every unit for the current measurement (or centre
+        # and outer in the project CRS), computed once per finalized
+        # measurement
+        result = self.results.get(measurement_id)
+        if result is None:
+            if centre is None:
+                centre, outer = self.centre_point, self.outer_point
+            with self.stage('ellipsoidal'):
+                result = kernel.measure(centre, outer, self.crs, self.measure_context.ellipsoid,
+                                        context=self.measure_context)
+            self.results[measurement_id] = result
+        return result
+        
+    def show_result(self):
+        # Supersedes any ellipsoidal length still being measured
+        self.length_runner.cancel()
+        self.area_runner.cancel()
+        ellipsoidal = self.dlg.ellipsoidal_rb.isChecked()
+        units = self.dlg.radius_combo.currentIndex()
+        self.set_radius_text(self.result.radius(ellipsoidal, units))
+        if ellipsoidal and self.result.geodesic is None:
+            # The coarse values of a measurement just drawn stay up until the
+            # geodesic circle is measured, otherwise the circle formulas on
+            # the ellipsoidal radius stand in
+            if not self.live_area:
+                self.set_shape_text(self.result.circumference(True, units), self.result.area(True, units))
+            self.refine_result(self.result)
+        else:
+            self.set_shape_text(self.result.circumference(ellipsoidal, units),
+                                self.result.area(ellipsoidal, units))
+        self.live_area = False
+            
+    def refine_result(self, result):
+        # Geodesic area and circumference of the current measurement on the
+        # finest ring, measured once and kept with its result
+        if self.async_measurements:
+            self.area_runner.submit(circle_measures_job, lambda measures: self.result_refined(result, measures),
+                                    QgsCoordinateReferenceSystem(self.crs), self.ellipsoid,
+                                    self.project.transformContext(), QgsPointXY(self.centre_point),
+                                    QgsPointXY(self.outer_point), self.tessellator.max_vertices)
+        else:
+            self.result_refined(result, self.circle_measures(self.centre_point, self.outer_point,
+                                                            self.tessellator.max_vertices))
+            
+    def result_refined(self, result, measures):
+        result.geodesic = measures
+        if result is self.result and self.dlg.ellipsoidal_rb.isChecked():
+            units = self.dlg.radius_combo.currentIndex()
+            self.set_shape_text(result.circumference(True, units), result.area(True, units))
+        
+    def undo_measurement(self):
+        if self.recorder:
+            self.recorder.undo()
+        if self.drawing:
+            # Abandon the measurement in progress
+            self.clear_preview_items()
+            self.drawing = False
+            self.live_area = False
+            self.render_scheduler.cancel()
+        else:
+            measurement_id = self.session.undo()
+            self.results.pop(measurement_id, None)
+            self.lod.forget(measurement_id)
+            self.canvas_item().update()
+        self.show_measurement(self.session.last_id())
+        
+    def measurement_at(self, map_point, tolerance=5):
+        # Id of the stored measurement whose centre or circle edge is
+        # nearest to map_point, within tolerance pixels
+        if not len(self.session):
+            return None
+        cx, cy, ox, oy = self.session.display_points(self.crs, self.transforms)
+        tolerance_map = tolerance * self.canvas.mapUnitsPerPixel()
+        to_centre = np.hypot(cx - map_point.x(), cy - map_point.y())
+        to_edge = np.abs(to_centre - np.hypot(ox - cx, oy - cy))
+        distances = np.minimum(to_centre, to_edge)
+        nearest = int(np.argmin(distances))
+        if distances[nearest] > tolerance_map:
+            return None
+        return int(self.session.rows()['id'][nearest])
+        
+    def remove_measurement_at(self, map_point):
+        measurement_id = self.measurement_at(map_point)
+        if measurement_id is None:
+            return
+        self.session.remove(measurement_id)
+        self.results.pop(measurement_id, None)
+        self.lod.forget(measurement_id)
+        self.canvas_item().update()
+        if not self.drawing:
+            self.show_measurement(self.session.last_id())
+            
+    def canvas_item(self):
+        if self.render_item is None:
+            self.render_item = self.items.acquire('render', lambda: MeasureRadiusCanvasItem(
+                    self.canvas, self.session, self.transforms))
+            self.render_item.request_display_points = self.request_display_points
+            self.render_item.lod = self.lod if self.dlg.ellipsoidal_rb.isChecked() else None
+            self.render_item.instrumentation = self.instrumentation
+        return self.render_item
+        
+    def request_display_points(self, dest_crs):
+        # Called by the canvas item when stored measurements are not cached
+        # for dest_crs. Returns False to have them computed inline.
+        if not self.async_measurements:
+            return False
+        if all(crs == dest_crs for crs in self.session.crs_list):
+            # Nothing to reproject, copying the columns is cheap
+            return False
+        if self.display_runner.is_busy() and self.display_request == self.session.display_key(dest_crs):
+            return True
+        key = self.session.display_key(dest_crs)
+        self.display_request = key
+        
+        def display_points_ready(points):
+            self.session.set_display_points(key, points)
+            if self.render_item:
+                self.render_item.update()
+                
+        self.display_runner.submit(display_points_job, display_points_ready,
+                                    self.session.rows().copy(), list(self.session.crs_list),
+                                    QgsCoordinateReferenceSystem(dest_crs),
+                                    self.project.transformContext())
+        return True
+        
+    def clear_preview_items(self):
+        if self.render_item:
+            self.render_item.clear_preview()
+            
+    ######NUMERIC ENTRY OF CENTRES AND RADII######
+    def typed_measurement(self):
+        if self.recorder:
+            self.recorder.typed(self.dlg.x_edit.text(), self.dlg.y_edit.text(), self.dlg.radius_edit.text())
+        try:
+            x = float(self.dlg.x_edit.text())
+            y = float(self.dlg.y_edit.text())
+            radius = float(self.dlg.radius_edit.text())
+        except ValueError:
+            return
+        if not (math.isfinite(x) and math.isfinite(y) and math.isfinite(radius)) or radius <= 0:
+            return
+        self.add_circles(np.array([x]), np.array([y]), np.array([radius]))
+        
+    def paste_measurements(self):
+        # Many 'x, y, radius' rows at once, prefilled from the clipboard
+        text, ok = QInputDialog.getMultiLineText(self.dlg, 'Paste circles',
+                'One centre x, y (project CRS) and radius ({}, {}) per line'.format(
+                    self.dlg.radius_combo.currentText(),
+                    'ellipsoidal' if self.dlg.ellipsoidal_rb.isChecked() else 'cartesian'),
+                QApplication.clipboard().text())
+        if not ok:
+            return
+        xs, ys, radii, skipped = parse_circle_rows(text)
+        if skipped:
+            QgsMessageLog.logMessage('Skipped pasted lines which are not x, y and a positive radius: {}'.format(
+                                        ', '.join(str(number) for number in skipped)),
+                                        'Measure Radius', Qgis.MessageLevel.Warning)
+        if len(xs):
+            if self.recorder:
+                self.recorder.circles(xs, ys, radii)
+            self.add_circles(xs, ys, radii)
+            
+    def outer_points(self, xs, ys, radii):
+        # Outer points due east of the centres for radii in the dialog units
+        # and mode
+        idx = self.dlg.radius_combo.currentIndex()
+        planar_x = xs + radii * conversion_factor(idx, self.units)
+        if self.dlg.ellipsoidal_rb.isChecked():
+            meters = radii * conversion_factor(idx, Qgis.DistanceUnit.Meters)
+            outer = geodesic_outer_points(xs, ys, meters, self.crs, self.ellipsoid, self.transforms)
+            if outer is not None:
+                ox, oy = outer
+                failed = np.isnan(ox) | np.isnan(oy)
+                if failed.any():
+                    # Outside the area the CRS can be transformed in
+                    QgsMessageLog.logMessage('{} centres could not be transformed to the ellipsoid, '
+                                                'their radii are cartesian'.format(int(failed.sum())),
+                                                'Measure Radius', Qgis.MessageLevel.Warning)
+                    ox[failed] = planar_x[failed]
+                    oy[failed] = ys[failed]
+                return ox, oy
+        return planar_x, ys.copy()
+        
+    def add_circles(self, xs, ys, radii):
+        # Typed and pasted circles go through here: they are added to the
+        # session in one batch and painted with a single update
+        if self.drawing:
+            self.clear_preview_items()
+            self.drawing = False
+            self.render_scheduler.cancel()
+        if not self.dlg.isVisible():
+            self.dlg.show()
+        ox, oy = self.outer_points(xs, ys, radii)
+        ids = self.session.add_rows(xs, ys, ox, oy, self.crs)
+        self.canvas_item().update()
+        if self.writer:
+            for measurement_id in ids:
+                m = self.session.measurement(measurement_id)
+                self.record_measurement(m, self.measurement_result(measurement_id, m.centre, m.outer))
+        self.show_measurement(int(ids[-1]))
+    ##############################################
+        
+    def lod_extents_changed(self):
+        self.lod.set_scale(self.canvas.mapUnitsPerPixel())
+        if self.recorder:
+            self.recorder.extent(self.canvas)
+        
+    ######CONCENTRIC RANGE RINGS######
+    def ring_distances(self):
+        # Distances from the dialog in meters if ellipsoidal, otherwise in
+        # project CRS units
+        distances = parse_ring_distances(self.dlg.rings_edit.text())
+        idx = self.dlg.rings_combo.currentIndex()
+        if self.dlg.ellipsoidal_rb.isChecked():
+            return distances * conversion_factor(idx, Qgis.DistanceUnit.Meters), True
+        return distances * conversion_factor(idx, self.units), False
+        
+    def map_units_per_meter(self, point):
+        # Local scale of the project CRS along the ellipsoid around point
+        fallback = conversion_factor(Qgis.DistanceUnit.Meters, self.units)
+        step = 1000 * fallback
+        da = self.measure_context.distance_area()
+        meters = da.measureLine(point, QgsPointXY(point.x() + step, point.y()))
+        meters *= conversion_factor(da.lengthUnits(), Qgis.DistanceUnit.Meters)
+        return step / meters if meters else fallback
+        
+    def update_rings(self, *args):
+        # Rings are drawn around the centre of the current measurement
+        if not self.render_item and not self.centre_point:
+            return
+        distances, ellipsoidal = self.ring_distances()
+        if not self.centre_point or not len(distances):
+            self.canvas_item().set_rings(None, [])
+            return
+        if ellipsoidal:
+            # True geodesic rings, like the exported ones. A circle scaled
+            # from the east-west distance is too short north-south away from
+            # the equator in a geographic CRS.
+            rings = self.geodesic_rings(self.centre_point, distances)
+            if rings is not None:
+                self.canvas_item().set_rings(self.centre_point, [], rings)
+                return
+            distances = distances * self.map_units_per_meter(self.centre_point)
+        self.canvas_item().set_rings(self.centre_point, distances)
+        
+    def geodesic_rings(self, centre, distances):
+        # (xs, ys) arrays in the project CRS of rings distances meters around
+        # centre along the ellipsoid. None if there is no ellipsoid or the
+        # rings can't be transformed.
+        try:
+            engine = GeodesicCircleEngine.from_acronym(self.ellipsoid, RING_VERTICES)
+        except ValueError:
+            return None
+        geographic = self.crs.toGeographicCrs()
+        try:
+            lonlat = self.transforms.point(centre, self.crs, geographic)
+            lons, lats = engine.rings(np.full(len(distances), lonlat.x()),
+                                        np.full(len(distances), lonlat.y()), distances)
+            xform = self.transforms.transform(geographic, self.crs)
+            return [transform_arrays(lons[i], lats[i], xform) for i in range(len(distances))]
+        except QgsCsException:
+            return None
+        
+    def export_range_rings(self):
+        # Rings around every stored measurement in one memory layer. All
+        # rings are scaled from one unit circle (or one azimuth table for
+        # geodesic rings) in a single vectorized call.
+        distances, ellipsoidal = self.ring_distances()
+        if not len(distances) or not len(self.session):
+            return
+        cx, cy, ox, oy = self.session.display_points(self.crs, self.transforms)
+        count = len(distances)
+        engine = None
+        if ellipsoidal:
+            try:
+                engine = GeodesicCircleEngine.from_acronym(self.ellipsoid, RING_VERTICES)
+            except ValueError:
+                # No ellipsoid, fall back to planar rings
+                distances = distances * conversion_factor(Qgis.DistanceUnit.Meters, self.units)
+        sites = self.session.rows()['id']
+        if engine is not None:
+            layer_crs = self.crs.toGeographicCrs()
+            centres = np.array([transformed_xy(self.transforms, x, y, self.crs, layer_crs)
+                                for x, y in zip(cx, cy)]).reshape(-1, 2)
+            ok = np.isfinite(centres[:, 0])
+            if not ok.all():
+                QgsMessageLog.logMessage('Skipped range rings of {} measurements whose centres could not be '
+                                            'transformed to the ellipsoid'.format(int((~ok).sum())),
+                                            'Measure Radius', Qgis.MessageLevel.Warning)
+                centres = centres[ok]
+                sites = sites[ok]
+            ring_distances = np.tile(distances, len(centres))
+            xs, ys = engine.rings(np.repeat(centres[:, 0], count), np.repeat(centres[:, 1], count),
+                                    ring_distances)
+        else:
+            layer_crs = self.crs
+            ring_distances = np.tile(distances, len(cx))
+            xs, ys = self.tessellator.ring_arrays(np.repeat(cx, count), np.repeat(cy, count),
+                                                    ring_distances, np.zeros(len(ring_distances)),
+                                                    RING_VERTICES)
+        if not len(sites):
+            return
+        layer = range_ring_layer(layer_crs)
+        site_ids = np.repeat(sites, count)
+        shown = np.tile(parse_ring_distances(self.dlg.rings_edit.text()), len(sites))
+        units = self.dlg.rings_combo.currentText()
+        features = []
+        for i in range(len(xs)):
+            ft = QgsFeature(layer.fields())
+            ft.setGeometry(QgsGeometry(QgsLineString(xs[i].tolist(), ys[i].tolist())))
+            ft.setAttributes([int(site_ids[i]), float(shown[i]), units])
+            features.append(ft)
+        layer.dataProvider().addFeatures(features)
+        layer.updateExtents()
+        self.project.addMapLayer(layer)
+    ##################################
+        
+    ######DISTANCES FROM THE CENTRE TO MANY FEATURES######
+    def matrix_layer_changed(self, layer):
+        self.matrix.set_layer(layer)
+        self.update_matrix()
+        
+    def matrix_ready(self, layer):
+        self.update_matrix()
+        
+    def update_matrix(self, *args):
+        # Distances to every target are computed once per centre, the
+        # dialog shows the nearest ones in the selected unit and mode
+        self.matrix_result = None
+        if self.matrix.layer() is not None and self.centre_point:
+            with self.stage('query'):
+                self.matrix_result = self.matrix.distances(self.centre_point, self.crs, self.ellipsoid,
+                                                            self.dlg.matrix_vertices_cb.isChecked())
+        self.show_matrix()
+        
+    def show_matrix(self, *args):
+        tree = self.dlg.matrix_tree
+        tree.clear()
+        if self.matrix_result is None:
+            if self.matrix.layer() is not None and self.centre_point:
+                tree.addTopLevelItem(QTreeWidgetItem(['reading features...', '', '']))
+            return
+        fids, cartesian, ellipsoidal = self.matrix_result
+        idx = self.dlg.radius_combo.currentIndex()
+        sort_by = cartesian
+        if self.dlg.ellipsoidal_rb.isChecked() and ellipsoidal is not None:
+            sort_by = ellipsoidal
+        nearest = self.matrix.nearest(sort_by, self.dlg.matrix_count.value())
+        shown_cartesian = cartesian[nearest] * conversion_factor(self.units, idx)
+        shown_ellipsoidal = None
+        if ellipsoidal is not None:
+            shown_ellipsoidal = ellipsoidal[nearest] * conversion_factor(Qgis.DistanceUnit.Meters, idx)
+        items = []
+        for row, i in enumerate(nearest):
+            items.append(QTreeWidgetItem([str(fids[i]),
+                                            str(round(shown_cartesian[row], 5)),
+                                            '' if shown_ellipsoidal is None else str(round(shown_ellipsoidal[row], 5))]))
+        tree.addTopLevelItems(items)
+    ######################################################
+        
+    ######RADIUS QUERY OF THE FEATURES OF THE CHECKED LAYERS######
+    def refresh_query_layers(self, *args):
+        # Offer every vector layer of the project, keeping what is checked
+        checked = set(self.dlg.query_combo.checkedItemsData())
+        self.dlg.query_combo.blockSignals(True)
+        self.dlg.query_combo.clear()
+        for layer in self.project.mapLayers().values():
+            if isinstance(layer, QgsVectorLayer) and layer.isSpatial():
+                state = Qt.Checked if layer.id() in checked else Qt.Unchecked
+                self.dlg.query_combo.addItemWithCheckState(layer.name(), state, layer.id())
+        self.dlg.query_combo.blockSignals(False)
+        self.query_layers_changed()
+        
+    def query_layers_changed(self, *args):
+        layers = [self.project.mapLayer(layer_id) for layer_id in self.dlg.query_combo.checkedItemsData()]
+        self.query.set_layers([layer for layer in layers if layer])
+        self.update_query()
+        
+    def query_index_ready(self, layer):
+        self.update_query()
+        
+    def update_query(self):
+        if self.drawing and self.outer_point:
+            self.live_query()
+        else:
+            self.query_measurement()
+            
+    def live_query(self):
+        # Bounding box counts from the spatial indexes while dragging
+        with self.stage('query'):
+            counts = self.query.approximate_counts(planar_rect(self.centre_point, self.radius_length),
+                                                    self.crs)
+        for item in self.query_items(list(counts)):
+            count = counts[item.data(0, Qt.UserRole)]
+            if item.childCount():
+                item.takeChildren()
+            item.setText(1, 'indexing...' if count is None else '~{}'.format(count))
+            
+    def query_measurement(self):
+        # Exact test of the finished measurement, planar or ellipsoidal to
+        # match the dialog
+        if not len(self.query) or not self.centre_point or not self.outer_point:
+            self.dlg.query_tree.clear()
+            return
+        with self.stage('query'):
+            rect = planar_rect(self.centre_point, self.radius_length)
+            if self.dlg.ellipsoidal_rb.isChecked():
+                da = self.measure_context.distance_area()
+                radius = da.measureLine(self.centre_point, self.outer_point)
+                radius_m = radius * conversion_factor(da.lengthUnits(), Qgis.DistanceUnit.Meters)
+                rect = ellipsoidal_rect(self.centre_point, radius_m, self.crs, self.ellipsoid,
+                                        self.transforms) or rect
+                results = self.query.features_within(self.centre_point, radius, rect, self.crs, da)
+            else:
+                results = self.query.features_within(self.centre_point, self.radius_length, rect,
+                                                        self.crs)
+        for item in self.query_items(list(results)):
+            fids = results[item.data(0, Qt.UserRole)]
+            item.takeChildren()
+            if fids is None:
+                item.setText(1, 'indexing...')
+                continue
+            item.setText(1, str(len(fids)))
+            item.addChildren([QTreeWidgetItem(['Feature {}'.format(fid)])
+                                for fid in fids[:MAX_LISTED_FEATURES]])
+            if len(fids) > MAX_LISTED_FEATURES:
+                item.addChild(QTreeWidgetItem(['... {} more'.format(len(fids) - MAX_LISTED_FEATURES)]))
+                
+    def query_items(self, layer_ids):
+        # One top level item per queried layer, only rebuilt when the
+        # layers change
+        tree = self.dlg.query_tree
+        items = [tree.topLevelItem(i) for i in range(tree.topLevelItemCount())]
+        if [item.data(0, Qt.UserRole) for item in items] != layer_ids:
+            tree.clear()
+            items = []
+            for layer_id in layer_ids:
+                layer = self.project.mapLayer(layer_id)
+                item = QTreeWidgetItem([layer.name() if layer else layer_id, ''])
+                item.setData(0, Qt.UserRole, layer_id)
+                items.append(item)
+            tree.addTopLevelItems(items)
+        return items
+    ##############################################################
+        
+    ######RECORDING FINISHED MEASUREMENTS TO A LAYER######
+    def record_target_changed(self, idx):
+        self.stop_recording()
+        if idx == 0:
+            return
+        if idx == 1:
+            layer = memory_layer(self.crs)
+        else:
+            path, _ = QFileDialog.getSaveFileName(self.dlg, 'Record measurements to', '',
+                                                    'GeoPackage (*.gpkg)')
+            if not path:
+                self.reset_record_combo()
+                return
+            if not path.lower().endswith('.gpkg'):
+                path += '.gpkg'
+            try:
+                layer = geopackage_layer(path, self.crs)
+            except IOError as e:
+                self.reset_record_combo()
+                QgsMessageLog.logMessage(str(e), 'Measure Radius', Qgis.MessageLevel.Warning)
+                return
+        self.project.addMapLayer(layer)
+        self.start_recording(layer)
+        
+    def start_recording(self, layer):
+        self.stop_recording()
+        self.writer = MeasurementWriter(layer)
+        layer.willBeDeleted.connect(self.recording_layer_removed)
+        
+    def stop_recording(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        try:
+            self.writer.layer.willBeDeleted.disconnect(self.recording_layer_removed)
+        except (TypeError, RuntimeError):
+            pass
+        self.writer = None
+        
+    def recording_layer_removed(self):
+        # The layer is going away, so drop anything not yet written
+        self.writer = None
+        self.reset_record_combo()
+        
+    def reset_record_combo(self):
+        self.dlg.record_combo.blockSignals(True)
+        self.dlg.record_combo.setCurrentIndex(0)
+        self.dlg.record_combo.blockSignals(False)
+        
+    def record_measurement(self, m=None, result=None):
+        if m is None:
+            m, result = self.measurement, self.result
+        ellipsoidal = self.dlg.ellipsoidal_rb.isChecked()
+        geometry = kernel.circle_geometry(m.centre, m.outer, tessellator=self.tessellator)
+        self.writer.add(m, geometry, result.radii(ellipsoidal),
+                        'ellipsoidal' if ellipsoidal else 'cartesian')
+    ######################################################
+        
+    def keyPressEvent(self, event):
+        if event.matches(QKeySequence.Undo):
+            self.undo_measurement()
+            event.accept()
+        else:
+            event.ignore()
+        
+    def dialog_closed(self, result):
+        # print(result)
+        if self.recorder:
+            self.recorder.new()
+        self.clear_canvas_items()
+        self.reset_dlg_line_edits()
+                
+    def new_measurement(self):
+        if self.recorder:
+            self.recorder.new()
+        self.clear_canvas_items()
+        self.reset_dlg_line_edits()
+        
+    def reset_dlg_line_edits(self):
+        self.dlg.x_edit.clear()
+        self.dlg.y_edit.clear()
+        self.dlg.radius_edit.setText(str(round(self.radius_length, 5)))
+        self.dlg.circumference_edit.clear()
+        self.dlg.area_edit.clear()
+        self.set_area_units()
+        
+    def canvasPressEvent(self, event):
+        if event.button() == Qt.LeftButton and event.modifiers() & Qt.ShiftModifier:
+            # Shift+click removes a stored measurement
+            if self.recorder:
+                self.recorder.press(event, event.mapPoint())
+            self.remove_measurement_at(event.mapPoint())
+        elif event.button() == Qt.LeftButton:
+            self.drawing = True
+            self.render_scheduler.cancel()
+            if not self.dlg.isVisible():
+                self.dlg.show()
+            self.reset_dlg_line_edits()
+            # Earlier measurements stay in the session
+            self.outer_point = None
+            self.measurement_id = None
+            self.result = None
+            # Clicks always do a full snapping query
+            self.centre_point = self.snapper.snap_exact(event.mapPoint())
+            if self.recorder:
+                self.recorder.press(event, self.centre_point)
+            self.measurement = RadiusMeasurement(self.centre_point, crs=self.crs)
+            self.canvas_item().set_preview(self.centre_point)
+            self.set_centre_text()
+            self.update_rings()
+            self.update_matrix()
+                        
+        elif event.button() == Qt.RightButton:
+            was_drawing = self.drawing
+            self.drawing = False
+            self.render_scheduler.cancel()
+            if was_drawing and self.measurement:
+                # The finished measurement is painted with the session
+                self.clear_preview_items()
+                outer_point = self.snapper.snap_exact(event.mapPoint())
+                if self.recorder:
+                    self.recorder.press(event, outer_point)
+                self.set_outer_point(outer_point)
+                self.radius_length = self.centre_point.distance(self.outer_point)
+                self.measurement_id = self.session.add(self.measurement)
+                self.canvas_item().update()
+                self.result = self.measurement_result(self.measurement_id)
+                self.show_result()
+                if self.recorder:
+                    self.recorder.output(self)
+                self.query_measurement()
+                if self.writer:
+                    self.record_measurement()
+                
+    def create_radius_geom(self):
+        return kernel.radius_line(self.centre_point, self.outer_point)
+
+    def create_buffer_geom(self, vertex_count=None, radius=None):
+        # With no explicit vertex count, tessellate for the current map scale
+        if vertex_count is None:
+            if radius is None:
+                radius = self.centre_point.distance(self.outer_point)
+            vertex_count = kernel.circle_vertex_count(radius, self.canvas.mapUnitsPerPixel(), self.tessellator)
+        return kernel.circle_geometry(self.centre_point, self.outer_point, vertex_count, self.tessellator)
+        
+    def set_radius_text(self, length):
+        # Skip the line edit update (and its repaint) if the rounded value
+        # is unchanged
+        with self.stage('dialog'):
+            text = str(round(length, 5))
+            if text != self.dlg.radius_edit.text():
+                self.dlg.radius_edit.setText(text)
+        
+    def set_shape_text(self, circumference, area):
+        # Circumference and area in the dialog units, skipping unchanged text
+        # like set_radius_text()
+        with self.stage('dialog'):
+            for edit, value in ((self.dlg.circumference_edit, circumference), (self.dlg.area_edit, area)):
+                text = str(round(value, 5))
+                if text != edit.text():
+                    edit.setText(text)
+                    
+    def set_geodesic_text(self, measures):
+        # measures is (area in square meters, circumference in meters)
+        factor = conversion_factor(Qgis.DistanceUnit.Meters, self.dlg.radius_combo.currentIndex())
+        self.set_shape_text(measures[1] * factor, measures[0] * factor ** 2)
+        
+    def set_area_units(self):
+        self.dlg.area_units_label.setText('square {}'.format(self.dlg.radius_combo.currentText()))
+        
+    ######OPT-IN INSTRUMENTATION OF THE EVENT HOT PATH#######
+    def enable_instrumentation(self, overlay=False, size=1024):
+        # Times every stage of an event into ring buffer histograms, read
+        # them with instrumentation_summary() or log_instrumentation()
+        self.instrumentation = Instrumentation(size)
+        self.canvas_item().instrumentation = self.instrumentation
+        if overlay:
+            self.overlay = self.items.acquire('overlay', lambda: FrameTimeOverlay(self.canvas, None))
+            self.overlay.instrumentation = self.instrumentation
+            
+    def disable_instrumentation(self):
+        self.log_instrumentation()
+        self.instrumentation = None
+        if self.render_item:
+            self.render_item.instrumentation = None
+        self.items.release('overlay')
+        self.overlay = None
+            
+    def instrumentation_summary(self):
+        if self.instrumentation is None:
+            return {}
+        return self.instrumentation.summary()
+        
+    def log_instrumentation(self):
+        if self.instrumentation:
+            self.instrumentation.log_summary()
+            
+    def start_trace(self, path):
+        # Records the input the tool sees to path for replay_trace(). The
+        # trace starts from an empty session so a replay starts from the
+        # same state.
+        self.stop_trace()
+        self.new_measurement()
+        self.recorder = TraceRecorder(path)
+        self.recorder.state(self)
+        
+    def stop_trace(self):
+        if self.recorder is None:
+            return
+        self.recorder.close()
+        QgsMessageLog.logMessage('Recorded {} events to {}'.format(self.recorder.records, self.recorder.path),
+                                    'Measure Radius', Qgis.MessageLevel.Info)
+        self.recorder = None
+        
+    def stage(self, name):
+        if self.instrumentation is None:
+            return NULL_STAGE
+        return self.instrumentation.stage(name)
+    ############################################################
+        
+    def canvasMoveEvent(self, event):
+        with self.stage('snap'):
+            cursor_point = self.snapper.snap(event.mapPoint(), event.pixelPoint())
+        if self.recorder:
+            self.recorder.move(event, cursor_point)
+        if not self.drawing:
+            return
+        # Geometry is rebuilt at most once per frame for the latest point
+        self.render_scheduler.schedule(cursor_point)
+        
+    def idle_snapped(self, point):
+        # A deferred snapping query finished after the cursor settled
+        if self.recorder:
+            self.recorder.idle_snap(point)
+        if self.drawing:
+            self.render_scheduler.schedule(point)
+        
+    def render_preview(self, cursor_point):
+        if not self.drawing:
+            return
+        if self.recorder:
+            self.recorder.frame()
+        with self.stage('frame'):
+            with self.stage('geometry'):
+                self.set_outer_point(cursor_point)
+                self.radius_length = self.centre_point.distance(self.outer_point)
+            with self.stage('render'):
+                self.canvas_item().set_preview(self.centre_point, self.outer_point)
+            
+            self.update_radius_text(cursor_point)
+            if len(self.query):
+                self.live_query()
+        if self.overlay:
+            self.overlay.update()
+            
+    def clear_canvas_items(self):
+        self.drawing = False
+        self.measurement = None
+        self.measurement_id = None
+        self.result = None
+        self.results.clear()
+        self.render_scheduler.cancel()
+        self.length_runner.cancel()
+        self.area_runner.cancel()
+        self.display_runner.cancel()
+        self.radius_length = 0.0
+        self.centre_point = None # NOV_2024
+        self.outer_point = None # NOV_2024
+        self.clear_preview_items()
+        self.session.clear()
+        self.lod.clear()
+        self.dlg.query_tree.clear()
+        self.matrix_result = None
+        self.dlg.matrix_tree.clear()
+        self.items.release('render')
+        self.render_item = None
+    
+    def activate(self):
+        if not self.project_connected:
+            self.project.crsChanged.connect(self.crs_changed)
+            self.project.transformContextChanged.connect(self.transform_context_changed)
+            self.project.layersAdded.connect(self.refresh_query_layers)
+            self.project.layersRemoved.connect(self.refresh_query_layers)
+            self.project_connected = True
+        # Pick up anything that changed while the tool was inactive
+        if self.project.transformContext() != self.measure_context.transform_context:
+            self.transform_context_changed()
+        if self.project.crs() != self.crs:
+            self.crs_changed()
+        self.refresh_query_layers()
+        super(MeasureRadiusTool, self).activate()
+        
+    def unload(self):
+        # Lets go of everything outside the tool that refers back to it, so
+        # reloading the plugin leaves nothing of the old tool behind
+        self.stop_trace()
+        self.stop_recording()
+        self.canvas.extentsChanged.disconnect(self.lod_extents_changed)
+        self.canvas.extentsChanged.disconnect(self.snapper.reset)
+        self.query.clear()
+        self.matrix.set_layer(None)
+        self.length_runner.cancel()
+        self.area_runner.cancel()
+        self.display_runner.cancel()
+        self.items.clear()
+        self.render_item = None
+        self.overlay = None
+        self.dlg.close()
+        self.dlg.deleteLater()
+        
+    def memory_stats(self):
+        # Leak accounting for long sessions: everything here should stay
+        # flat however many measurements are made and cleared
+        return {'canvas_items': self.items.stats(),
+                'measurements': len(self.session),
+                'session_capacity': len(self.session.records),
+                'results': len(self.results),
+                'lod_cache': self.lod.cache.stats(),
+                'lod_params': len(self.lod.params),
+                'query_layers': len(self.query),
+                'running_tasks': sum(len(runner.running) for runner in
+                                    (self.length_runner, self.area_runner, self.display_runner))}
+        
+    def deactivate(self):
+        if self.project_connected:
+            self.project.crsChanged.disconnect(self.crs_changed)
+            self.project.transformContextChanged.disconnect(self.transform_context_changed)
+            self.project.layersAdded.disconnect(self.refresh_query_layers)
+            self.project.layersRemoved.disconnect(self.refresh_query_layers)
+            self.project_connected = False
+        self.log_instrumentation()
+        self.stop_trace()
+        if self.writer:
+            self.writer.flush()
+        self.snapper.reset()
+        self.clear_canvas_items()
+        self.dlg.close()
\ No newline at end of file
@@ -0,0 +1,183 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from qgis.core import Qgis, QgsFeatureRequest, QgsPointXY
+
+import array
+import math
+
+import numpy as np
+
+from .radius_math import transform_arrays
+from .geodesic import GeodesicCircleEngine
+from .kernel import geodesic_distances
+from .nearest import (feature_starts, segment_starts, nearest_on_segments,
+                        inside_rings, nearest_per_feature)
+from .tasks import LayerCache
+
+
+def vertex_arrays_job(task, source):
+    # Runs in a QgsTask worker. Every vertex of every feature with the id of
+    # its feature and of its ring or line, vertices of one feature are
+    # contiguous. Consecutive vertices with the same ring id are a segment.
+    fids = array.array('q')
+    rings = array.array('q')
+    xs = array.array('d')
+    ys = array.array('d')
+    ring = 0
+    request = QgsFeatureRequest().setNoAttributes()
+    for i, ft in enumerate(source.getFeatures(request)):
+        if i % 1000 == 0 and task.isCanceled():
+            return None
+        geom = ft.geometry()
+        if geom.isNull():
+            continue
+        for part in geom.constGet().coordinateSequence():
+            for points in part:
+                ring += 1
+                for vertex in points:
+                    fids.append(ft.id())
+                    rings.append(ring)
+                    xs.append(vertex.x())
+                    ys.append(vertex.y())
+    return (np.frombuffer(fids, dtype=np.int64), np.frombuffer(rings, dtype=np.int64),
+            np.frombuffer(xs, dtype=float), np.frombuffer(ys, dtype=float))
+
+
+class LayerVertices(LayerCache):
+    # Vertex coordinates of one layer as NumPy arrays, read in the
+    # background. Copies in other CRSs are made on demand and kept until
+    # the vertices are read again.
+
+    def __init__(self, layer, on_ready=None):
+        self.projected = {}
+        # Points inside a polygon are at distance 0
+        self.polygons = layer.geometryType() == Qgis.GeometryType.Polygon
+        super(LayerVertices, self).__init__(layer, vertex_arrays_job,
+                'Measure radius: read vertices of {}'.format(layer.name()), on_ready)
+
+    def invalidate(self, *args):
+        super(LayerVertices, self).invalidate()
+        self.projected = {}
+
+    def set_value(self, value):
+        self.projected = {}
+        super(LayerVertices, self).set_value(value)
+
+    def vertices(self):
+        # (fids, rings, xs, ys) in the layer CRS, None while they are being
+        # read
+        return self.get()
+
+    def vertices_in(self, crs, transforms):
+        arrays = self.vertices()
+        if arrays is None:
+            return None
+        if crs == self.layer.crs():
+            return arrays
+        key = transforms.crs_key(crs)
+        projected = self.projected.get(key)
+        if projected is None:
+            fids, rings, xs, ys = arrays
+            projected = (fids, rings) + transform_arrays(xs, ys, transforms.transform(self.layer.crs(), crs))
+            self.projected[key] = projected
+        return projected
+
+
+class DistanceMatrix:
+    # Cartesian and ellipsoidal distances from one centre to every feature
+    # (its nearest point) or every vertex of a layer in a single vectorized
+    # pass
+
+    def __init__(self, transforms, on_ready=None):
+        self.transforms = transforms
+        self.on_ready = on_ready
+        self.source = None
+        self.engines = {}
+
+    def set_layer(self, layer):
+        if self.source is not None and self.source.layer is layer:
+            return
+        if self.source is not None:
+            self.source.disconnect()
+        self.source = LayerVertices(layer, self.on_ready) if layer else None
+        if self.source is not None:
+            # Start reading straight away
+            self.source.vertices()
+
+    def layer(self):
+        return self.source.layer if self.source is not None else None
+
+    def engine(self, ellipsoid):
+        if ellipsoid not in self.engines:
+            try:
+                self.engines[ellipsoid] = GeodesicCircleEngine.from_acronym(ellipsoid)
+            except ValueError:
+                self.engines[ellipsoid] = None
+        return self.engines[ellipsoid]
+
+    def distances(self, centre, crs, ellipsoid, per_vertex=False):
+        # Returns (fids, cartesian, ellipsoidal) for every target, cartesian
+        # in crs units and ellipsoidal in meters (None without an ellipsoid),
+        # or None while the layer is being read
+        if self.source is None:
+            return None
+        arrays = self.source.vertices_in(crs, self.transforms)
+        if arrays is None:
+            return None
+        fids, rings, xs, ys = arrays
+        cx = centre.x()
+        cy = centre.y()
+        cartesian = np.hypot(xs - cx, ys - cy)
+        ellipsoidal = None
+        engine = self.engine(ellipsoid)
+        if engine is not None:
+            geographic = crs.toGeographicCrs()
+            _, _, lons, lats = self.source.vertices_in(geographic, self.transforms)
+            lonlat = self.transforms.point(QgsPointXY(centre), crs, geographic)
+            lon0 = lonlat.x()
+            lat0 = lonlat.y()
+            ellipsoidal = geodesic_distances(lon0, lat0, lons, lats, geographic, ellipsoid, engine,
+                                                self.transforms.transform_context)
+        if per_vertex or not len(fids):
+            return fids, cartesian, ellipsoidal
+
+        # Nearest point of each feature. Every vertex and the nearest point
+        # of every segment are candidates, each mode takes its own minimum.
+        starts = feature_starts(fids)
+        first = segment_starts(rings)
+        sx, sy = nearest_on_segments(cx, cy, xs, ys, first)
+        cartesian = nearest_per_feature(starts, cartesian, first, np.hypot(sx - cx, sy - cy))
+        if ellipsoidal is not None:
+            # The nearest point of a segment is found in an equirectangular
+            # frame around the centre, then measured on the ellipsoid
+            scale = max(math.cos(math.radians(lat0)), 1e-9)
+            fx = ((lons - lon0 + 180) % 360 - 180) * scale
+            fy = lats - lat0
+            sx, sy = nearest_on_segments(0.0, 0.0, fx, fy, first)
+            ellipsoidal = nearest_per_feature(starts, ellipsoidal, first,
+                    geodesic_distances(lon0, lat0, lon0 + sx / scale, lat0 + sy, geographic, ellipsoid,
+                                        engine, self.transforms.transform_context))
+        if self.source.polygons:
+            inside = inside_rings(cx, cy, xs, ys, first, starts)
+            cartesian[inside] = 0.0
+            if ellipsoidal is not None:
+                ellipsoidal[inside] = 0.0
+        return fids[starts], cartesian, ellipsoidal
+
+    @staticmethod
+    def nearest(values, count):
+        # Indices of the count smallest values, sorted
+        if len(values) > count:
+            candidates = np.argpartition(values, count)[:count]
+        else:
+            candidates = np.arange(len(values))
+        return candidates[np.argsort(values[candidates])]
@@ -0,0 +1,61 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+# Nearest points and point in polygon tests of one point against the
+# vertex arrays of a whole layer, see matrix.vertex_arrays_job(). Only
+# NumPy is imported so these run and are tested without QGIS.
+import numpy as np
+
+
+def feature_starts(fids):
+    # Index of the first vertex of every feature
+    return np.flatnonzero(np.r_[True, fids[1:] != fids[:-1]])
+
+
+def segment_starts(rings):
+    # Index of the first vertex of every segment
+    return np.flatnonzero(rings[1:] == rings[:-1])
+
+
+def nearest_on_segments(px, py, xs, ys, first):
+    # Point of every segment, from vertex first to first + 1, which is
+    # nearest to px, py
+    x1 = xs[first]
+    y1 = ys[first]
+    dx = xs[first + 1] - x1
+    dy = ys[first + 1] - y1
+    length2 = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(length2 > 0, ((px - x1) * dx + (py - y1) * dy) / length2, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return x1 + t * dx, y1 + t * dy
+
+
+def inside_rings(px, py, xs, ys, first, starts):
+    # Even-odd test of px, py against all rings of every feature, which
+    # handles holes and multipolygons
+    x1 = xs[first]
+    y1 = ys[first]
+    x2 = xs[first + 1]
+    y2 = ys[first + 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        crosses = ((y1 > py) != (y2 > py)) & (px < x1 + (py - y1) * (x2 - x1) / (y2 - y1))
+    features = np.searchsorted(starts, first[crosses], side='right') - 1
+    return np.bincount(features, minlength=len(starts)) % 2 == 1
+
+
+def nearest_per_feature(starts, vertex_values, first, segment_values):
+    # Smallest value of every feature over its vertices and the nearest
+    # points of its segments. A segment belongs to the feature of its first
+    # vertex.
+    values = np.array(vertex_values, dtype=float)
+    values[first] = np.minimum(values[first], segment_values)
+    return np.minimum.reduceat(values, starts)
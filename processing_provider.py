@@ -0,0 +1,347 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from qgis.PyQt.QtCore import QVariant
+from qgis.PyQt.QtGui import QIcon
+
+from qgis.core import (QgsProcessingProvider, QgsProcessingAlgorithm, QgsProcessing,
+                        QgsProcessingException, QgsProcessingParameterFeatureSource,
+                        QgsProcessingParameterField, QgsProcessingParameterEnum,
+                        QgsProcessingParameterNumber, QgsProcessingParameterFeatureSink,
+                        QgsCoordinateTransform, QgsFeature, QgsFeatureSink, QgsField,
+                        QgsFields, QgsGeometry, QgsLineString, QgsPolygon, QgsMultiPolygon,
+                        QgsWkbTypes, NULL)
+
+import os
+
+# QGIS imports this module at startup to register the provider, which only
+# needs the unit names. NumPy and the measurement modules are imported when
+# an algorithm runs.
+from .units import RADIUS_UNIT_NAMES, UNIT_TO_METERS
+
+# Most features read, measured and written in one go
+CHUNK_SIZE = 50000
+
+# Most ring vertices held per chunk. Rings are built as two (chunk,
+# vertices + 1) float arrays, so this caps each at about 16 MB however many
+# vertices the circles have.
+RING_VERTEX_BUDGET = 2000000
+
+
+def point_of(geom):
+    # First point of multipoint geometries
+    if geom.isMultipart():
+        return geom.asMultiPoint()[0]
+    return geom.asPoint()
+
+
+class MeasureRadiusProvider(QgsProcessingProvider):
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(MeasureRadiiAlgorithm())
+        self.addAlgorithm(GeodesicCirclesAlgorithm())
+
+    def id(self):
+        return 'measureradius'
+
+    def name(self):
+        return 'Measure Radius'
+
+    def icon(self):
+        return QIcon(os.path.join(os.path.dirname(__file__), 'measure-radius-icon.png'))
+
+
+class MeasureRadiiAlgorithm(QgsProcessingAlgorithm):
+    CENTRES = 'CENTRES'
+    CENTRE_ID_FIELD = 'CENTRE_ID_FIELD'
+    OUTER = 'OUTER'
+    OUTER_ID_FIELD = 'OUTER_ID_FIELD'
+    RADIUS_FIELD = 'RADIUS_FIELD'
+    RADIUS_UNITS = 'RADIUS_UNITS'
+    OUTPUT_UNITS = 'OUTPUT_UNITS'
+    VERTICES = 'VERTICES'
+    OUTPUT = 'OUTPUT'
+
+    def createInstance(self):
+        return MeasureRadiiAlgorithm()
+
+    def name(self):
+        return 'measureradii'
+
+    def displayName(self):
+        return 'Measure radii'
+
+    def shortHelpString(self):
+        return ('Measures the radius from every centre point to its outer point and '
+                'creates the matching circle. Outer points are matched to centres by '
+                'the id fields, or by feature order when no id fields are given. '
+                'Without an outer point layer the radius is read from a field of the '
+                'centre layer. Cartesian radii are measured in the centre layer CRS and '
+                'ellipsoidal radii on the ellipsoid of that CRS, as in the map tool.')
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.CENTRES,
+                'Centre points', [QgsProcessing.TypeVectorPoint]))
+        self.addParameter(QgsProcessingParameterField(self.CENTRE_ID_FIELD,
+                'Centre id field', parentLayerParameterName=self.CENTRES, optional=True))
+        self.addParameter(QgsProcessingParameterFeatureSource(self.OUTER,
+                'Outer points', [QgsProcessing.TypeVectorPoint], optional=True))
+        self.addParameter(QgsProcessingParameterField(self.OUTER_ID_FIELD,
+                'Outer point id field', parentLayerParameterName=self.OUTER, optional=True))
+        self.addParameter(QgsProcessingParameterField(self.RADIUS_FIELD,
+                'Radius field (used when there is no outer point layer)',
+                parentLayerParameterName=self.CENTRES,
+                type=QgsProcessingParameterField.Numeric, optional=True))
+        self.addParameter(QgsProcessingParameterEnum(self.RADIUS_UNITS,
+                'Radius field units', RADIUS_UNIT_NAMES, defaultValue=0))
+        self.addParameter(QgsProcessingParameterEnum(self.OUTPUT_UNITS,
+                'Output units', RADIUS_UNIT_NAMES, defaultValue=0))
+        self.addParameter(QgsProcessingParameterNumber(self.VERTICES,
+                'Circle vertices', defaultValue=360, minValue=8, maxValue=3600))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT,
+                'Circles', QgsProcessing.TypeVectorPolygon))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        import numpy as np
+        from .radius_math import conversion_factor, CircleTessellator
+        from . import kernel
+
+        centres = self.parameterAsSource(parameters, self.CENTRES, context)
+        if centres is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.CENTRES))
+        centre_id_field = self.parameterAsString(parameters, self.CENTRE_ID_FIELD, context)
+        outer = self.parameterAsSource(parameters, self.OUTER, context)
+        outer_id_field = self.parameterAsString(parameters, self.OUTER_ID_FIELD, context)
+        radius_field = self.parameterAsString(parameters, self.RADIUS_FIELD, context)
+        radius_units = self.parameterAsEnum(parameters, self.RADIUS_UNITS, context)
+        output_units = self.parameterAsEnum(parameters, self.OUTPUT_UNITS, context)
+        vertices = self.parameterAsInt(parameters, self.VERTICES, context)
+        if outer is None and not radius_field:
+            raise QgsProcessingException('Either an outer point layer or a radius field is required')
+        if outer is not None and bool(centre_id_field) != bool(outer_id_field):
+            raise QgsProcessingException('Id fields must be given for both layers or neither')
+
+        crs = centres.sourceCrs()
+        map_units = crs.mapUnits()
+        try:
+            conversion_factor(map_units, output_units)
+        except ValueError as e:
+            raise QgsProcessingException('Map units of the centre layer CRS are not supported: {}'.format(e))
+        ellipsoid = crs.ellipsoidAcronym()
+        tessellator = CircleTessellator()
+
+        fields = QgsFields()
+        fields.append(QgsField('centre_id', QVariant.String))
+        fields.append(QgsField('radius_cartesian', QVariant.Double))
+        fields.append(QgsField('radius_ellipsoidal', QVariant.Double))
+        fields.append(QgsField('units', QVariant.String))
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
+                fields, QgsWkbTypes.Polygon, crs)
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        if outer is not None:
+            outer_points = self.outer_points(outer, outer_id_field, crs, context)
+        total = centres.featureCount()
+        step = 100.0 / total if total else 0
+        done = 0
+
+        chunk_size = max(1, min(CHUNK_SIZE, RING_VERTEX_BUDGET // (vertices + 1)))
+        for chunk in self.chunks(centres.getFeatures(), chunk_size):
+            if feedback.isCanceled():
+                break
+            ids = []
+            centre_xy = []
+            outer_xy = []
+            for offset, ft in enumerate(chunk):
+                ft_id = ft[centre_id_field] if centre_id_field else ft.id()
+                if ft.geometry().isEmpty():
+                    continue
+                pt = point_of(ft.geometry())
+                if outer is None:
+                    radius = ft[radius_field]
+                    if radius is None or radius == NULL:
+                        continue
+                    # Outer point due north of the centre
+                    r = float(radius) * conversion_factor(radius_units, map_units)
+                    outer_xy.append((pt.x(), pt.y() + r))
+                else:
+                    key = ft_id if centre_id_field else done + offset
+                    outer_pt = outer_points.get(key)
+                    if outer_pt is None:
+                        continue
+                    outer_xy.append(outer_pt)
+                ids.append(ft_id)
+                centre_xy.append((pt.x(), pt.y()))
+            done += len(chunk)
+            if not ids:
+                continue
+
+            centre_xy = np.array(centre_xy, dtype=float)
+            outer_xy = np.array(outer_xy, dtype=float)
+            coords = (centre_xy[:, 0], centre_xy[:, 1], outer_xy[:, 0], outer_xy[:, 1])
+            cartesian = kernel.cartesian_radii(*coords, crs, output_units)
+            ellipsoidal = kernel.ellipsoidal_radii(*coords, crs, ellipsoid, output_units,
+                                                    context.transformContext())
+            xs, ys = kernel.circle_rings(*coords, vertices, tessellator)
+
+            for i, ft_id in enumerate(ids):
+                poly = QgsPolygon()
+                poly.setExteriorRing(QgsLineString(xs[i].tolist(), ys[i].tolist()))
+                out_ft = QgsFeature(fields)
+                out_ft.setGeometry(QgsGeometry(poly))
+                out_ft.setAttributes([str(ft_id), float(cartesian[i]), float(ellipsoidal[i]),
+                                        RADIUS_UNIT_NAMES[output_units]])
+                sink.addFeature(out_ft, QgsFeatureSink.FastInsert)
+            feedback.setProgress(done * step)
+
+        return {self.OUTPUT: dest_id}
+
+    def outer_points(self, source, id_field, crs, context):
+        # Outer points keyed by id field value, or by feature order
+        xform = None
+        if source.sourceCrs() != crs:
+            xform = QgsCoordinateTransform(source.sourceCrs(), crs, context.transformContext())
+        points = {}
+        for i, ft in enumerate(source.getFeatures()):
+            if ft.geometry().isEmpty():
+                continue
+            pt = point_of(ft.geometry())
+            if xform is not None:
+                pt = xform.transform(pt)
+            points[ft[id_field] if id_field else i] = (pt.x(), pt.y())
+        return points
+
+    def chunks(self, features, size):
+        chunk = []
+        for ft in features:
+            chunk.append(ft)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class GeodesicCirclesAlgorithm(QgsProcessingAlgorithm):
+    CENTRES = 'CENTRES'
+    RADIUS = 'RADIUS'
+    RADIUS_FIELD = 'RADIUS_FIELD'
+    RADIUS_UNITS = 'RADIUS_UNITS'
+    VERTICES = 'VERTICES'
+    WORKERS = 'WORKERS'
+    OUTPUT = 'OUTPUT'
+
+    def createInstance(self):
+        return GeodesicCirclesAlgorithm()
+
+    def name(self):
+        return 'geodesiccircles'
+
+    def displayName(self):
+        return 'Geodesic circles'
+
+    def shortHelpString(self):
+        return ('Creates true geodesic circles around every centre point, on the '
+                'ellipsoid of the centre layer CRS. Each vertex lies exactly the '
+                'radius away from the centre along the ellipsoid, so large circles and '
+                'circles at high latitudes are not distorted. The circles are written '
+                'in the geographic CRS of the centre layer. Circles around a pole are '
+                'closed through the pole and circles across the antimeridian are split '
+                'there. Centres are split into '
+                'chunks which are computed on several processes (0 workers uses every core).')
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.CENTRES,
+                'Centre points', [QgsProcessing.TypeVectorPoint]))
+        self.addParameter(QgsProcessingParameterNumber(self.RADIUS,
+                'Radius', QgsProcessingParameterNumber.Double, defaultValue=1000, minValue=0))
+        self.addParameter(QgsProcessingParameterField(self.RADIUS_FIELD,
+                'Radius field (overrides radius)', parentLayerParameterName=self.CENTRES,
+                type=QgsProcessingParameterField.Numeric, optional=True))
+        self.addParameter(QgsProcessingParameterEnum(self.RADIUS_UNITS,
+                'Radius units', RADIUS_UNIT_NAMES, defaultValue=0))
+        self.addParameter(QgsProcessingParameterNumber(self.VERTICES,
+                'Circle vertices', defaultValue=360, minValue=8, maxValue=3600))
+        self.addParameter(QgsProcessingParameterNumber(self.WORKERS,
+                'Worker processes', defaultValue=0, minValue=0))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT,
+                'Geodesic circles', QgsProcessing.TypeVectorPolygon))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        from .geodesic import GeodesicCircleEngine, lonlat_polygons
+
+        centres = self.parameterAsSource(parameters, self.CENTRES, context)
+        if centres is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.CENTRES))
+        radius = self.parameterAsDouble(parameters, self.RADIUS, context)
+        radius_field = self.parameterAsString(parameters, self.RADIUS_FIELD, context)
+        to_meters = UNIT_TO_METERS[self.parameterAsEnum(parameters, self.RADIUS_UNITS, context)]
+        vertices = self.parameterAsInt(parameters, self.VERTICES, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context) or None
+
+        crs = centres.sourceCrs()
+        try:
+            engine = GeodesicCircleEngine.from_acronym(crs.ellipsoidAcronym(), vertices)
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
+        geographic_crs = crs.toGeographicCrs()
+        xform = QgsCoordinateTransform(crs, geographic_crs, context.transformContext())
+
+        ids = []
+        lons = []
+        lats = []
+        radii = []
+        for ft in centres.getFeatures():
+            if feedback.isCanceled():
+                return {}
+            if ft.geometry().isEmpty():
+                continue
+            r = radius
+            if radius_field:
+                r = ft[radius_field]
+                if r is None or r == NULL:
+                    continue
+            pt = xform.transform(point_of(ft.geometry()))
+            ids.append(ft.id())
+            lons.append(pt.x())
+            lats.append(pt.y())
+            radii.append(float(r) * to_meters)
+
+        fields = QgsFields()
+        fields.append(QgsField('centre_id', QVariant.String))
+        fields.append(QgsField('radius_m', QVariant.Double))
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context,
+                fields, QgsWkbTypes.MultiPolygon, geographic_crs)
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        step = 100.0 / len(ids) if ids else 0
+        rings = engine.rings_parallel(lons, lats, radii, workers)
+        for start, ring_lons, ring_lats in rings:
+            if feedback.isCanceled():
+                # Cancels the chunks still queued in the pool
+                rings.close()
+                break
+            for i in range(len(ring_lons)):
+                # Valid in lon/lat around the poles and across the antimeridian
+                multi = QgsMultiPolygon()
+                for part_lons, part_lats in lonlat_polygons(ring_lons[i], ring_lats[i]):
+                    poly = QgsPolygon()
+                    poly.setExteriorRing(QgsLineString(part_lons.tolist(), part_lats.tolist()))
+                    multi.addGeometry(poly)
+                out_ft = QgsFeature(fields)
+                out_ft.setGeometry(QgsGeometry(multi))
+                out_ft.setAttributes([str(ids[start + i]), radii[start + i]])
+                sink.addFeature(out_ft, QgsFeatureSink.FastInsert)
+            feedback.setProgress((start + len(ring_lons)) * step)
+
+        return {self.OUTPUT: dest_id}
@@ -0,0 +1,160 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from qgis.core import (QgsSpatialIndex, QgsFeatureRequest, QgsGeometry, QgsRectangle,
+                        QgsPointXY, QgsCsException)
+
+from .geodesic import GeodesicCircleEngine
+from .tasks import LayerCache
+
+
+def build_index_job(task, source):
+    # Runs in a QgsTask worker, source is a QgsVectorLayerFeatureSource so
+    # the layer itself is never touched off the GUI thread
+    request = QgsFeatureRequest().setNoAttributes()
+    return QgsSpatialIndex(source.getFeatures(request), None,
+                            QgsSpatialIndex.FlagStoreFeatureGeometries)
+
+
+def planar_rect(centre, radius):
+    return QgsRectangle(centre.x() - radius, centre.y() - radius,
+                        centre.x() + radius, centre.y() + radius)
+
+
+def ellipsoidal_rect(centre, radius_m, crs, ellipsoid, transforms, vertices=32):
+    # Bounding box in crs of the geodesic circle of radius_m meters around
+    # centre, or None if there is no ellipsoid to measure on or the circle
+    # can't be transformed
+    try:
+        engine = GeodesicCircleEngine.from_acronym(ellipsoid, vertices)
+    except ValueError:
+        return None
+    geographic = crs.toGeographicCrs()
+    try:
+        lonlat = transforms.point(centre, crs, geographic)
+        lons, lats = engine.ring(lonlat.x(), lonlat.y(), radius_m)
+        points = [transforms.point(QgsPointXY(x, y), geographic, crs) for x, y in zip(lons, lats)]
+    except QgsCsException:
+        return None
+    rect = QgsRectangle(min(p.x() for p in points), min(p.y() for p in points),
+                        max(p.x() for p in points), max(p.y() for p in points))
+    # The ring is a polygon inscribed in the circle
+    rect.scale(1.02)
+    return rect
+
+
+class LayerIndex(LayerCache):
+    # QgsSpatialIndex of one vector layer, built in the background on first
+    # use. The index stores geometries so exact tests never go back to the
+    # provider.
+
+    def __init__(self, layer, on_ready=None):
+        super(LayerIndex, self).__init__(layer, build_index_job,
+                'Measure radius: index {}'.format(layer.name()), on_ready)
+
+    def spatial_index(self):
+        # None while the index is being (re)built
+        return self.get()
+
+
+class RadiusQuery:
+    # Finds the features of a set of layers within a measured circle. The
+    # spatial index gives bounding box candidates, which are then tested
+    # exactly against the planar or ellipsoidal radius.
+
+    def __init__(self, transforms, on_index_ready=None):
+        self.transforms = transforms
+        self.on_index_ready = on_index_ready
+        self.indexes = {}
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def set_layers(self, layers):
+        layer_ids = [layer.id() for layer in layers]
+        for layer_id in list(self.indexes):
+            if layer_id not in layer_ids or self.indexes[layer_id].layer is None:
+                self.indexes.pop(layer_id).disconnect()
+        for layer in layers:
+            if layer.id() not in self.indexes:
+                self.indexes[layer.id()] = LayerIndex(layer, self.on_index_ready)
+                # Start building straight away so it is ready for the query
+                self.indexes[layer.id()].spatial_index()
+
+    def layer_ids(self):
+        return list(self.indexes)
+
+    def clear(self):
+        self.set_layers([])
+
+    def layer_rect(self, layer, rect, crs):
+        # rect in the layer CRS, or None when it lies outside what the
+        # transform can handle, e.g. a circle dragged off the edge of the
+        # world. The layer has no candidates then.
+        if layer.crs() == crs:
+            return rect
+        try:
+            return self.transforms.transform(crs, layer.crs()).transformBoundingBox(rect)
+        except QgsCsException:
+            return None
+
+    def candidates(self, index, layer, rect, crs):
+        layer_rect = self.layer_rect(layer, rect, crs)
+        if layer_rect is None:
+            return []
+        return index.intersects(layer_rect)
+
+    def approximate_counts(self, rect, crs):
+        # Bounding box hits per layer id, an upper bound on the number of
+        # features within the circle. None for layers still being indexed.
+        counts = {}
+        for layer_id, layer_index in self.indexes.items():
+            index = layer_index.spatial_index()
+            if index is None:
+                # Still being indexed or deleted
+                counts[layer_id] = None
+            else:
+                counts[layer_id] = len(self.candidates(index, layer_index.layer, rect, crs))
+        return counts
+
+    def features_within(self, centre, radius, rect, crs, da=None):
+        # Feature ids per layer id of everything within radius of centre.
+        # Without da, radius is a planar length in crs units, otherwise an
+        # ellipsoidal length in da.lengthUnits(). rect bounds the circle in
+        # crs. None for layers still being indexed.
+        results = {}
+        centre_geom = QgsGeometry.fromPointXY(centre)
+        for layer_id, layer_index in self.indexes.items():
+            index = layer_index.spatial_index()
+            if index is None:
+                results[layer_id] = None
+                continue
+            layer = layer_index.layer
+            xform = None
+            if layer.crs() != crs:
+                xform = self.transforms.transform(layer.crs(), crs)
+            hits = []
+            for fid in self.candidates(index, layer, rect, crs):
+                geom = QgsGeometry(index.geometry(fid))
+                if xform is not None:
+                    try:
+                        geom.transform(xform)
+                    except QgsCsException:
+                        continue
+                if da is None:
+                    distance = geom.distance(centre_geom)
+                else:
+                    nearest = geom.nearestPoint(centre_geom).asPoint()
+                    distance = da.measureLine(centre, nearest)
+                if distance <= radius:
+                    hits.append(fid)
+            results[layer_id] = hits
+        return results
@@ -0,0 +1,289 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from qgis.core import (Qgis, QgsCoordinateTransform, QgsDistanceArea, QgsGeometry,
+                        QgsLineString, QgsPolygon, QgsUnitTypes)
+
+import math
+import threading
+
+import numpy as np
+
+from .units import UNIT_TO_METERS, UNIT_CONVERSION_MATRIX
+
+# The Qgis.DistanceUnit of each of units.RADIUS_UNIT_NAMES
+DISTANCE_UNITS = [Qgis.DistanceUnit.Meters,
+                    Qgis.DistanceUnit.Kilometers,
+                    Qgis.DistanceUnit.Feet,
+                    Qgis.DistanceUnit.NauticalMiles,
+                    Qgis.DistanceUnit.Yards,
+                    Qgis.DistanceUnit.Miles,
+                    Qgis.DistanceUnit.Degrees,
+                    Qgis.DistanceUnit.Centimeters,
+                    Qgis.DistanceUnit.Millimeters]
+
+CONVERSION_ARRAY = np.array(UNIT_CONVERSION_MATRIX)
+
+def unit_index(units):
+    # Accepts a Qgis.DistanceUnit or an index into DISTANCE_UNITS
+    if units in DISTANCE_UNITS:
+        return DISTANCE_UNITS.index(units)
+    try:
+        idx = int(units)
+    except (TypeError, ValueError):
+        idx = -1
+    if not 0 <= idx < len(DISTANCE_UNITS):
+        raise ValueError('Unsupported distance unit: {}'.format(units))
+    return idx
+
+def meters_per_unit(units):
+    # Map units of a CRS can be outside DISTANCE_UNITS, e.g. US survey feet,
+    # QgsUnitTypes knows those
+    try:
+        return UNIT_TO_METERS[unit_index(units)]
+    except ValueError:
+        pass
+    try:
+        factor = QgsUnitTypes.fromUnitToUnitFactor(units, Qgis.DistanceUnit.Meters)
+    except TypeError:
+        factor = 0.0
+    if not factor or not math.isfinite(factor):
+        raise ValueError('Unsupported distance unit: {}'.format(units))
+    return factor
+
+def conversion_factor(input_units, output_units):
+    try:
+        return UNIT_CONVERSION_MATRIX[unit_index(input_units)][unit_index(output_units)]
+    except ValueError:
+        return meters_per_unit(input_units) / meters_per_unit(output_units)
+
+def convert_lengths(lengths, input_units, output_units):
+    # Converts a whole array of lengths in one call
+    return np.asarray(lengths, dtype=float) * conversion_factor(input_units, output_units)
+
+class CircleTessellator:
+    # Builds circle polygons with just enough vertices for the on-screen
+    # radius, so that the chord between two neighbouring vertices never
+    # strays more than max_chord_error pixels from the true arc.
+    # Unit circle cos/sin tables are cached per vertex count and only
+    # scaled/rotated/translated for each new circle.
+    
+    def __init__(self, max_chord_error=0.5, min_vertices=16, max_vertices=3600):
+        self.max_chord_error = max_chord_error
+        self.min_vertices = min_vertices
+        self.max_vertices = max_vertices
+        self.tables = {}
+        self.array_tables = {}
+        
+    def vertex_count(self, radius_px):
+        if radius_px <= self.max_chord_error:
+            return self.min_vertices
+        # Sagitta of a chord spanning 2*pi/n is r*(1-cos(pi/n))
+        n = math.ceil(math.pi / math.acos(1 - self.max_chord_error / radius_px))
+        # Round up to a multiple of 8 so the table cache stays small
+        n = -(-n // 8) * 8
+        return max(self.min_vertices, min(self.max_vertices, n))
+        
+    def unit_circle(self, n):
+        table = self.tables.get(n)
+        if table is None:
+            step = 2 * math.pi / n
+            cos_table = [math.cos(i * step) for i in range(n)]
+            sin_table = [math.sin(i * step) for i in range(n)]
+            # Close the ring with the exact first vertex
+            cos_table.append(cos_table[0])
+            sin_table.append(sin_table[0])
+            table = (cos_table, sin_table)
+            self.tables[n] = table
+        return table
+        
+    def unit_circle_array(self, n):
+        table = self.array_tables.get(n)
+        if table is None:
+            cos_table, sin_table = self.unit_circle(n)
+            table = (np.array(cos_table), np.array(sin_table))
+            self.array_tables[n] = table
+        return table
+        
+    def ring_arrays(self, cx, cy, dx, dy, n):
+        # Vectorized ring(): cx, cy, dx, dy are arrays with one entry per
+        # circle and the result is a pair of (circles, n + 1) arrays
+        cos_table, sin_table = self.unit_circle_array(n)
+        cx, cy, dx, dy = (np.asarray(a, dtype=float)[:, None] for a in (cx, cy, dx, dy))
+        xs = cx + dx * cos_table - dy * sin_table
+        ys = cy + dx * sin_table + dy * cos_table
+        return xs, ys
+        
+    def ring(self, cx, cy, dx, dy, n):
+        # (dx, dy) is the radius vector, so the ring starts at the outer
+        # point like QgsCircle(centre, radius, azimuth).toPolygon() did
+        cos_table, sin_table = self.unit_circle(n)
+        xs = [cx + dx * c - dy * s for c, s in zip(cos_table, sin_table)]
+        ys = [cy + dx * s + dy * c for c, s in zip(cos_table, sin_table)]
+        return xs, ys
+        
+    def circle_geom(self, centre, outer, n):
+        xs, ys = self.ring(centre.x(), centre.y(),
+                            outer.x() - centre.x(), outer.y() - centre.y(), n)
+        poly = QgsPolygon()
+        poly.setExteriorRing(QgsLineString(xs, ys))
+        return QgsGeometry(poly)
+
+class MeasurementContext:
+    # Holds a QgsDistanceArea which is built once and only rebuilt after
+    # the CRS, the ellipsoid or the project transform context changes.
+    # Setting up the ellipsoid goes through PROJ, so it is far too
+    # expensive to repeat on every mouse move.
+    
+    def __init__(self, crs, ellipsoid, transform_context):
+        self.crs = crs
+        self.ellipsoid = ellipsoid
+        self.transform_context = transform_context
+        self.da = None
+        self.hits = 0
+        self.rebuilds = 0
+        
+    def set_crs(self, crs, ellipsoid):
+        if crs != self.crs or ellipsoid != self.ellipsoid:
+            self.crs = crs
+            self.ellipsoid = ellipsoid
+            self.invalidate()
+            
+    def set_transform_context(self, transform_context):
+        self.transform_context = transform_context
+        self.invalidate()
+        
+    def invalidate(self):
+        self.da = None
+        
+    def distance_area(self):
+        if self.da is None:
+            da = QgsDistanceArea()
+            da.setSourceCrs(self.crs, self.transform_context)
+            da.setEllipsoid(self.ellipsoid)
+            self.da = da
+            self.rebuilds += 1
+        else:
+            self.hits += 1
+        return self.da
+        
+    def stats(self):
+        return {'hits': self.hits, 'rebuilds': self.rebuilds}
+
+thread_contexts = threading.local()
+
+def thread_measurement_context(crs, ellipsoid, transform_context):
+    # One MeasurementContext per thread, for QgsTask and thread pool workers
+    # which must not share the GUI thread's QgsDistanceArea
+    context = getattr(thread_contexts, 'context', None)
+    if context is None:
+        context = MeasurementContext(crs, ellipsoid, transform_context)
+        thread_contexts.context = context
+    else:
+        context.set_crs(crs, ellipsoid)
+        if context.transform_context != transform_context:
+            context.set_transform_context(transform_context)
+    return context
+
+class MeasurementResult:
+    # Radius of one finalized measurement in every DISTANCE_UNITS unit for
+    # both cartesian and ellipsoidal mode, computed once so that switching
+    # units or mode in the dialog is just a lookup. Circumference and area
+    # are derived from the same radii, except in ellipsoidal mode once
+    # geodesic holds the (area in square meters, circumference in meters)
+    # measured on the geodesic circle itself.
+    __slots__ = ('cartesian', 'ellipsoidal', 'geodesic')
+    
+    def __init__(self, cartesian, ellipsoidal, geodesic=None):
+        self.cartesian = cartesian
+        self.ellipsoidal = ellipsoidal
+        self.geodesic = geodesic
+        
+    @classmethod
+    def from_lengths(cls, cartesian_length, cartesian_units, ellipsoidal_length, ellipsoidal_units):
+        return cls(cartesian_length * meters_per_unit(cartesian_units) * CONVERSION_ARRAY[0],
+                    ellipsoidal_length * meters_per_unit(ellipsoidal_units) * CONVERSION_ARRAY[0])
+        
+    def radii(self, ellipsoidal):
+        return self.ellipsoidal if ellipsoidal else self.cartesian
+        
+    def radius(self, ellipsoidal, units):
+        return float(self.radii(ellipsoidal)[unit_index(units)])
+        
+    def circumference(self, ellipsoidal, units):
+        if ellipsoidal and self.geodesic is not None:
+            return self.geodesic[1] * CONVERSION_ARRAY[0][unit_index(units)]
+        return 2 * math.pi * self.radius(ellipsoidal, units)
+        
+    def area(self, ellipsoidal, units):
+        # In square units
+        if ellipsoidal and self.geodesic is not None:
+            return self.geodesic[0] * CONVERSION_ARRAY[0][unit_index(units)] ** 2
+        return math.pi * self.radius(ellipsoidal, units) ** 2
+
+class RadiusMeasurement:
+    # Compact model of one measurement: the centre and outer point in the
+    # CRS they were digitized in. Display geometry is regenerated from this
+    # for whatever CRS the canvas is in, so changing CRS back and forth
+    # never accumulates reprojection error.
+    __slots__ = ('centre', 'outer', 'crs')
+    
+    def __init__(self, centre, outer=None, crs=None):
+        self.centre = centre
+        self.outer = outer
+        self.crs = crs
+        
+    def radius(self):
+        # Radius in the units of crs
+        if self.outer is None:
+            return 0.0
+        return self.centre.distance(self.outer)
+
+def transform_arrays(xs, ys, xform):
+    # Transforms whole coordinate arrays in C++ by way of a line string
+    if not len(xs):
+        return xs, ys
+    line = QgsLineString(xs.tolist(), ys.tolist())
+    line.transform(xform)
+    return np.array(line.xVector()), np.array(line.yVector())
+
+class TransformCache:
+    # Reuses one QgsCoordinateTransform per source/destination CRS pair
+    
+    def __init__(self, transform_context):
+        self.transform_context = transform_context
+        self.transforms = {}
+        
+    def set_transform_context(self, transform_context):
+        self.transform_context = transform_context
+        self.transforms.clear()
+        
+    def crs_key(self, crs):
+        return crs.authid() or crs.toWkt()
+        
+    def transform(self, src_crs, dest_crs):
+        key = (self.crs_key(src_crs), self.crs_key(dest_crs))
+        xform = self.transforms.get(key)
+        if xform is None:
+            xform = QgsCoordinateTransform(src_crs, dest_crs, self.transform_context)
+            self.transforms[key] = xform
+        return xform
+        
+    def point(self, point, src_crs, dest_crs):
+        if src_crs == dest_crs:
+            return point
+        return self.transform(src_crs, dest_crs).transform(point)
+        
+    def point_back(self, point, src_crs, dest_crs):
+        # Transforms point from dest_crs back into src_crs
+        if src_crs == dest_crs:
+            return point
+        return self.transform(src_crs, dest_crs).transform(point, Qgis.TransformDirection.Reverse)
@@ -0,0 +1,191 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from qgis.core import QgsPointXY
+
+import numpy as np
+
+from .radius_math import RadiusMeasurement
+
+# One row per finalized measurement. Points are stored in the CRS they were
+# digitized in, crs is an index into MeasurementSession.crs_list.
+RECORD_DTYPE = np.dtype([('id', np.int64),
+                        ('cx', np.float64),
+                        ('cy', np.float64),
+                        ('ox', np.float64),
+                        ('oy', np.float64),
+                        ('radius', np.float64),
+                        ('crs', np.int32)])
+
+
+def transform_rows(rows, crs_list, dest_crs, transforms, is_canceled=None):
+    # Centre and outer coordinates of rows in dest_crs. Safe to run in a
+    # worker thread as long as transforms is not shared with another thread.
+    cx = rows['cx'].copy()
+    cy = rows['cy'].copy()
+    ox = rows['ox'].copy()
+    oy = rows['oy'].copy()
+    for idx, crs in enumerate(crs_list):
+        if crs == dest_crs:
+            continue
+        xform = transforms.transform(crs, dest_crs)
+        for i in np.flatnonzero(rows['crs'] == idx):
+            if is_canceled is not None and is_canceled():
+                return None
+            centre = xform.transform(QgsPointXY(cx[i], cy[i]))
+            outer = xform.transform(QgsPointXY(ox[i], oy[i]))
+            cx[i], cy[i] = centre.x(), centre.y()
+            ox[i], oy[i] = outer.x(), outer.y()
+    return (cx, cy, ox, oy)
+
+
+class MeasurementSession:
+    # Array backed store of all measurements taken while the tool is in use.
+    # Rows are kept in the order they were added so undo() removes the most
+    # recent one.
+
+    def __init__(self, capacity=256):
+        self.records = np.zeros(capacity, dtype=RECORD_DTYPE)
+        self.count = 0
+        self.next_id = 1
+        self.crs_list = []
+        self.crs_keys = {}
+        # Bumped on every change so cached display coordinates can be
+        # invalidated
+        self.version = 0
+        self.display_cache = None
+
+    def __len__(self):
+        return self.count
+
+    def rows(self):
+        return self.records[:self.count]
+
+    def crs_index(self, crs):
+        key = crs.authid() or crs.toWkt()
+        idx = self.crs_keys.get(key)
+        if idx is None:
+            idx = len(self.crs_list)
+            self.crs_list.append(crs)
+            self.crs_keys[key] = idx
+        return idx
+
+    def grow(self, size):
+        if size <= len(self.records):
+            return
+        capacity = max(size, 2 * len(self.records))
+        records = np.zeros(capacity, dtype=RECORD_DTYPE)
+        records[:self.count] = self.rows()
+        self.records = records
+
+    def add(self, measurement):
+        self.grow(self.count + 1)
+        row = self.records[self.count]
+        row['id'] = self.next_id
+        row['cx'] = measurement.centre.x()
+        row['cy'] = measurement.centre.y()
+        row['ox'] = measurement.outer.x()
+        row['oy'] = measurement.outer.y()
+        row['radius'] = measurement.radius()
+        row['crs'] = self.crs_index(measurement.crs)
+        self.count += 1
+        self.next_id += 1
+        self.changed()
+        return int(row['id'])
+
+    def add_rows(self, cx, cy, ox, oy, crs):
+        # Appends many measurements digitized in the same crs in one go and
+        # returns their ids
+        n = len(cx)
+        self.grow(self.count + n)
+        rows = self.records[self.count:self.count + n]
+        rows['id'] = np.arange(self.next_id, self.next_id + n)
+        rows['cx'] = cx
+        rows['cy'] = cy
+        rows['ox'] = ox
+        rows['oy'] = oy
+        rows['radius'] = np.hypot(rows['ox'] - rows['cx'], rows['oy'] - rows['cy'])
+        rows['crs'] = self.crs_index(crs)
+        self.count += n
+        self.next_id += n
+        self.changed()
+        return rows['id'].copy()
+
+    def position(self, measurement_id):
+        hits = np.flatnonzero(self.rows()['id'] == measurement_id)
+        return int(hits[0]) if len(hits) else None
+
+    def measurement(self, measurement_id):
+        pos = self.position(measurement_id)
+        if pos is None:
+            return None
+        row = self.records[pos]
+        return RadiusMeasurement(QgsPointXY(row['cx'], row['cy']),
+                                    QgsPointXY(row['ox'], row['oy']),
+                                    self.crs_list[row['crs']])
+
+    def last_id(self):
+        if not self.count:
+            return None
+        return int(self.records[self.count - 1]['id'])
+
+    def remove(self, measurement_id):
+        pos = self.position(measurement_id)
+        if pos is None:
+            return False
+        self.records[pos:self.count - 1] = self.records[pos + 1:self.count]
+        self.count -= 1
+        self.changed()
+        return True
+
+    def undo(self):
+        last_id = self.last_id()
+        if last_id is not None:
+            self.remove(last_id)
+        return last_id
+
+    def clear(self):
+        # Forget the CRSs too, nothing refers to their indices any more
+        self.count = 0
+        self.crs_list = []
+        self.crs_keys = {}
+        self.changed()
+
+    def changed(self):
+        self.version += 1
+        self.display_cache = None
+
+    def display_key(self, dest_crs):
+        return (self.version, dest_crs.authid() or dest_crs.toWkt())
+
+    def cached_display_points(self, dest_crs):
+        if self.display_cache is not None and self.display_cache[0] == self.display_key(dest_crs):
+            return self.display_cache[1]
+        return None
+
+    def set_display_points(self, key, points):
+        # Only accept points computed for the current version of the session
+        if key[0] == self.version:
+            self.display_cache = (key, points)
+
+    def display_points(self, dest_crs, transforms):
+        # Centre and outer coordinates of every row in dest_crs, as four
+        # arrays (cx, cy, ox, oy). Cached until the session or the
+        # destination CRS changes.
+        points = self.cached_display_points(dest_crs)
+        if points is None:
+            points = transform_rows(self.rows(), self.crs_list, dest_crs, transforms)
+            self.set_display_points(self.display_key(dest_crs), points)
+        return points
+
+    def invalidate_display(self):
+        # Transform context changed
+        self.display_cache = None
@@ -0,0 +1,143 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+from qgis.core import Qgis, QgsApplication, QgsTask, QgsMessageLog, QgsVectorLayerFeatureSource
+
+from .radius_math import TransformCache
+from . import kernel
+from .session import transform_rows
+
+
+def ellipsoidal_length_job(task, crs, ellipsoid, transform_context, pt1, pt2, units):
+    # Runs in a QgsTask worker. Everything passed in is a copy owned by the
+    # task, the QgsDistanceArea comes from the worker thread's own context.
+    length = kernel.ellipsoidal_radius(pt1, pt2, crs, ellipsoid, units, transform_context)
+    if task.isCanceled():
+        return None
+    return length
+
+
+def circle_measures_job(task, crs, ellipsoid, transform_context, centre, outer, vertices):
+    # Area and circumference of the geodesic circle, see
+    # kernel.geodesic_circle_measures()
+    measures = kernel.geodesic_circle_measures(centre, outer, crs, ellipsoid, vertices, transform_context)
+    if task.isCanceled():
+        return None
+    return measures
+
+
+def display_points_job(task, rows, crs_list, dest_crs, transform_context):
+    # rows is a copy of MeasurementSession.rows()
+    transforms = TransformCache(transform_context)
+    return transform_rows(rows, crs_list, dest_crs, transforms, task.isCanceled)
+
+
+class LatestTaskRunner:
+    # Runs one kind of job in the QgsTaskManager where only the most recent
+    # submission matters. Submitting cancels the job still running and
+    # results of anything but the latest job are dropped, so a slow worker
+    # can never overwrite a newer value.
+
+    def __init__(self, description):
+        self.description = description
+        self.generation = 0
+        self.task = None
+        # Python must hold a reference to every task until it finishes or
+        # it is garbage collected while the task manager still owns it
+        self.running = set()
+
+    def submit(self, function, on_result, *args):
+        self.cancel()
+        generation = self.generation
+        task = None
+
+        def finished(exception, result=None):
+            self.running.discard(task)
+            if self.task is task:
+                self.task = None
+            if generation != self.generation:
+                # Superseded or cancelled, which also shows up as an exception
+                return
+            if exception is not None:
+                QgsMessageLog.logMessage('{} failed: {}'.format(self.description, exception),
+                                            'Measure Radius', Qgis.MessageLevel.Warning)
+                return
+            if result is not None:
+                on_result(result)
+
+        task = QgsTask.fromFunction(self.description, function, *args,
+                                    on_finished=finished, flags=QgsTask.Hidden)
+        self.task = task
+        self.running.add(task)
+        QgsApplication.taskManager().addTask(task)
+        return task
+
+    def cancel(self):
+        self.generation += 1
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def is_busy(self):
+        return self.task is not None
+
+
+class LayerCache:
+    # Something read from one vector layer by a background job, e.g. its
+    # spatial index or its vertex arrays. The job runs on first use with a
+    # QgsVectorLayerFeatureSource, so the layer itself is never touched off
+    # the GUI thread. The value is thrown away whenever the layer's features
+    # or geometries change and for good when the layer is deleted.
+
+    def __init__(self, layer, job, description, on_ready=None):
+        self.layer = layer
+        self.job = job
+        self.on_ready = on_ready
+        self.value = None
+        self.builds = 0
+        self.runner = LatestTaskRunner(description)
+        self.layer.featureAdded.connect(self.invalidate)
+        self.layer.featureDeleted.connect(self.invalidate)
+        self.layer.geometryChanged.connect(self.invalidate)
+        self.layer.dataChanged.connect(self.invalidate)
+        self.layer.willBeDeleted.connect(self.layer_deleted)
+
+    def layer_deleted(self):
+        self.invalidate()
+        self.layer = None
+
+    def disconnect(self):
+        self.runner.cancel()
+        if self.layer is None:
+            return
+        self.layer.willBeDeleted.disconnect(self.layer_deleted)
+        self.layer.featureAdded.disconnect(self.invalidate)
+        self.layer.featureDeleted.disconnect(self.invalidate)
+        self.layer.geometryChanged.disconnect(self.invalidate)
+        self.layer.dataChanged.disconnect(self.invalidate)
+
+    def invalidate(self, *args):
+        self.value = None
+        self.runner.cancel()
+
+    def get(self):
+        # None while the job is running
+        if self.layer is None:
+            return None
+        if self.value is None and not self.runner.is_busy():
+            self.runner.submit(self.job, self.set_value, QgsVectorLayerFeatureSource(self.layer))
+        return self.value
+
+    def set_value(self, value):
+        self.value = value
+        self.builds += 1
+        if self.on_ready:
+            self.on_ready(self.layer)
@@ -0,0 +1,28 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+# The plugin folder name isn't necessarily a valid module name, so the
+# package is loaded as measure_radius like benchmarks/bench_map_tool.py
+# does. The package __init__ doesn't import QGIS, test modules which need
+# it skip themselves when it isn't available.
+import importlib.util
+import os
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if 'measure_radius' not in sys.modules:
+    spec = importlib.util.spec_from_file_location('measure_radius',
+            os.path.join(PLUGIN_DIR, '__init__.py'),
+            submodule_search_locations=[PLUGIN_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['measure_radius'] = module
+    spec.loader.exec_module(module)
@@ -0,0 +1,144 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from qgis.gui import QgsMapCanvas
+from qgis.testing import start_app
+
+from measure_radius.canvas_items import CanvasItemPool, MeasureRadiusCanvasItem
+
+start_app()
+
+
+class StubScene:
+
+    def __init__(self):
+        self.contents = []
+
+    def items(self):
+        return list(self.contents)
+
+    def removeItem(self, item):
+        self.contents.remove(item)
+        item.in_scene = None
+
+
+class StubCanvas:
+
+    def __init__(self):
+        self.stub_scene = StubScene()
+
+    def scene(self):
+        return self.stub_scene
+
+
+class StubItem:
+
+    def __init__(self, canvas):
+        self.visible = True
+        self.resets = 0
+        self.in_scene = canvas.scene()
+        self.in_scene.contents.append(self)
+
+    def scene(self):
+        return self.in_scene
+
+    def isVisible(self):
+        return self.visible
+
+    def show(self):
+        self.visible = True
+
+    def hide(self):
+        self.visible = False
+
+    def reset(self):
+        self.resets += 1
+
+
+def test_acquire_creates_once():
+    canvas = StubCanvas()
+    pool = CanvasItemPool(canvas)
+    item = pool.acquire('render', lambda: StubItem(canvas))
+    assert pool.acquire('render', lambda: StubItem(canvas)) is item
+    assert pool.acquire('overlay', lambda: StubItem(canvas)) is not item
+    assert (pool.created, pool.reused) == (2, 0)
+
+
+def test_release_hides_and_resets():
+    canvas = StubCanvas()
+    pool = CanvasItemPool(canvas)
+    item = pool.acquire('render', lambda: StubItem(canvas))
+    pool.release('render')
+    assert not item.isVisible()
+    assert item.resets == 1
+    # Releasing again or releasing an unknown name does nothing
+    pool.release('render')
+    pool.release('overlay')
+    assert item.resets == 1
+    assert item.scene() is canvas.scene()
+
+
+def test_released_items_are_reused():
+    canvas = StubCanvas()
+    pool = CanvasItemPool(canvas)
+    item = pool.acquire('render', lambda: StubItem(canvas))
+    for _ in range(3):
+        pool.release('render')
+        assert pool.acquire('render', lambda: StubItem(canvas)) is item
+        assert item.isVisible()
+    assert (pool.created, pool.reused) == (1, 3)
+    assert len(canvas.scene().items()) == 1
+
+
+def test_stats():
+    canvas = StubCanvas()
+    pool = CanvasItemPool(canvas)
+    pool.acquire('render', lambda: StubItem(canvas))
+    pool.acquire('overlay', lambda: StubItem(canvas))
+    pool.release('overlay')
+    pool.acquire('overlay', lambda: StubItem(canvas))
+    pool.release('overlay')
+    assert pool.stats() == {'items': 2, 'visible': 1, 'created': 2, 'reused': 1,
+                            'removed': 0, 'leaked': 0}
+    pool.clear()
+    assert canvas.scene().items() == []
+    assert pool.stats() == {'items': 0, 'visible': 0, 'created': 2, 'reused': 1,
+                            'removed': 2, 'leaked': 0}
+
+
+def test_leaked_counts_pooled_kinds_only():
+    canvas = QgsMapCanvas()
+    pool = CanvasItemPool(canvas)
+    pool.acquire('render', lambda: MeasureRadiusCanvasItem(canvas, None, None))
+    assert pool.leaked() == 0
+    # Owned by nobody, like the item of a tool that was never unloaded
+    stray = MeasureRadiusCanvasItem(canvas, None, None)
+    assert pool.leaked() == 1
+    canvas.scene().removeItem(stray)
+    assert pool.leaked() == 0
+
+
+def test_nothing_leaked_after_tool_unload():
+    from measure_radius.map_tool import MeasureRadiusTool
+    canvas = QgsMapCanvas()
+    tool = MeasureRadiusTool(canvas)
+    tool.canvas_item()
+    tool.enable_instrumentation(overlay=True)
+    assert tool.items.stats()['items'] == 2
+    tool.unload()
+    assert tool.items.stats()['removed'] == 2
+    assert tool.items.leaked() == 0
+    # A fresh pool owns nothing, so it would count anything left behind
+    assert CanvasItemPool(canvas).leaked() == 0
@@ -0,0 +1,52 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import numpy as np
+import pytest
+
+from measure_radius.entry import MAX_RINGS, parse_circle_rows, parse_ring_distances
+
+
+def test_circle_rows():
+    xs, ys, radii, skipped = parse_circle_rows('1, 2, 3\n4;5;6\n7\t8 9\n')
+    np.testing.assert_array_equal(xs, [1, 4, 7])
+    np.testing.assert_array_equal(ys, [2, 5, 8])
+    np.testing.assert_array_equal(radii, [3, 6, 9])
+    assert skipped == []
+
+
+def test_circle_rows_report_line_numbers():
+    text = 'x, y, radius\n1, 2, 3\n\n# comment\n4, 5\n6, 7, 0\n8, 9, -1\n10, 11, 12\n'
+    xs, ys, radii, skipped = parse_circle_rows(text)
+    np.testing.assert_array_equal(xs, [1, 10])
+    # Blank lines are ignored, not reported
+    assert skipped == [1, 4, 5, 6, 7]
+
+
+@pytest.mark.parametrize('row', ['nan, 1, 2', '1, inf, 2', '1, 2, nan', '1, 2, inf',
+                                    '-inf, 2, 3', '1e400, 2, 3'])
+def test_circle_rows_reject_non_finite(row):
+    xs, ys, radii, skipped = parse_circle_rows('1, 2, 3\n' + row)
+    assert len(xs) == 1
+    assert skipped == [2]
+
+
+def test_ring_distances():
+    np.testing.assert_array_equal(parse_ring_distances('5 x 2'), [2, 4, 6, 8, 10])
+    np.testing.assert_array_equal(parse_ring_distances('10, 1; 5 2 5'), [1, 2, 5, 10])
+    assert len(parse_ring_distances('1000 x 1')) == MAX_RINGS
+
+
+@pytest.mark.parametrize('text', ['', 'x', 'rings', 'inf x 1', '1e400 x 1', 'nan x 1', '3 x inf',
+                                    '3 x nan', '0 x 5', '-2 x 5', '1, inf, 2', 'nan',
+                                    '1e308 x 1e308'])
+def test_ring_distances_reject(text):
+    assert len(parse_ring_distances(text)) == 0
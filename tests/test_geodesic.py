@@ -0,0 +1,120 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import math
+
+import numpy as np
+import pytest
+
+from measure_radius.geodesic import GeodesicCircleEngine, direct, inverse, lonlat_polygons
+
+# GRS80
+SEMI_MAJOR = 6378137.0
+FLATTENING = 1 / 298.257222101
+
+
+def dms(degrees, minutes, seconds):
+    return math.copysign(abs(degrees) + minutes / 60 + seconds / 3600, degrees)
+
+
+# Vincenty's worked example from Flinders Peak to Buninyong, as published
+# by Geoscience Australia
+FLINDERS_PEAK = (dms(144, 25, 29.52440), dms(-37, 57, 3.72030))
+BUNINYONG = (dms(143, 55, 35.38390), dms(-37, 39, 10.15610))
+DISTANCE = 54972.271
+AZIMUTH = dms(306, 52, 5.37)
+
+
+def test_inverse_flinders_peak_buninyong():
+    distance = inverse(*FLINDERS_PEAK, *BUNINYONG, SEMI_MAJOR, FLATTENING)
+    assert distance == pytest.approx(DISTANCE, abs=1e-3)
+
+
+def test_direct_flinders_peak_buninyong():
+    lon, lat = direct(*FLINDERS_PEAK, AZIMUTH, DISTANCE, SEMI_MAJOR, FLATTENING)
+    # 0.01" of azimuth is about 3 mm at this distance
+    assert lon == pytest.approx(BUNINYONG[0], abs=1e-7)
+    assert lat == pytest.approx(BUNINYONG[1], abs=1e-7)
+
+
+def test_direct_inverse_round_trip():
+    azimuths = np.arange(0, 360, 15.0)
+    lons, lats = direct(*FLINDERS_PEAK, azimuths, DISTANCE, SEMI_MAJOR, FLATTENING)
+    distances = inverse(*FLINDERS_PEAK, lons, lats, SEMI_MAJOR, FLATTENING)
+    np.testing.assert_allclose(distances, DISTANCE, atol=1e-6)
+
+
+def test_inverse_flags_antipodal_pairs():
+    lons = [180.0, 179.5, 10.0]
+    lats = [0.0, 0.5, 0.0]
+    distances, converged = inverse(0, 0, lons, lats, SEMI_MAJOR, FLATTENING, True)
+    assert converged.tolist() == [False, True, True]
+    np.testing.assert_array_equal(distances, inverse(0, 0, lons, lats, SEMI_MAJOR, FLATTENING))
+
+
+def test_ring_vertices_are_on_the_circle():
+    engine = GeodesicCircleEngine(SEMI_MAJOR, FLATTENING, 64)
+    lons, lats = engine.ring(*FLINDERS_PEAK, 10000.0)
+    # Closed ring
+    assert (lons[0], lats[0]) == (lons[-1], lats[-1])
+    distances = inverse(*FLINDERS_PEAK, lons, lats, SEMI_MAJOR, FLATTENING)
+    np.testing.assert_allclose(distances, 10000.0, atol=1e-6)
+
+
+def ring_area(lons, lats):
+    # Shoelace area in square degrees
+    return abs(np.sum(lons[:-1] * lats[1:] - lons[1:] * lats[:-1])) / 2
+
+
+def test_ring_around_pole():
+    # 50 km around a centre 11 km from the north pole
+    engine = GeodesicCircleEngine(SEMI_MAJOR, FLATTENING, 360)
+    lons, lats = engine.ring(10.0, 89.9, 50000.0)
+    # Continuous longitudes sweeping a full turn
+    assert np.abs(np.diff(lons)).max() < 180
+    assert abs(lons[-1] - lons[0]) == pytest.approx(360)
+    parts = lonlat_polygons(lons, lats)
+    assert len(parts) == 1
+    part_lons, part_lats = parts[0]
+    assert (part_lons[0], part_lats[0]) == (part_lons[-1], part_lats[-1])
+    assert part_lons.min() == -180 and part_lons.max() == 180
+    assert part_lats.max() == 90
+    # Every ring vertex is kept
+    assert len(part_lons) == len(lons) - 1 + 5
+
+
+def test_ring_around_south_pole():
+    engine = GeodesicCircleEngine(SEMI_MAJOR, FLATTENING, 360)
+    (part_lons, part_lats), = lonlat_polygons(*engine.ring(-120.0, -89.95, 20000.0))
+    assert part_lats.min() == -90
+    assert np.all(np.abs(part_lons) <= 180)
+
+
+@pytest.mark.parametrize('lon', [179.9, -179.9, 539.9])
+def test_ring_across_antimeridian(lon):
+    engine = GeodesicCircleEngine(SEMI_MAJOR, FLATTENING, 360)
+    lons, lats = engine.ring(lon, 0.0, 50000.0)
+    parts = lonlat_polygons(lons, lats)
+    assert len(parts) == 2
+    for part_lons, part_lats in parts:
+        assert np.all(np.abs(part_lons) <= 180)
+        assert (part_lons[0], part_lats[0]) == (part_lons[-1], part_lats[-1])
+    assert sorted(abs(part_lons).max() for part_lons, part_lats in parts) == [180, 180]
+    # Split without losing any of the circle
+    assert sum(ring_area(*part) for part in parts) == pytest.approx(ring_area(lons, lats))
+
+
+def test_ring_within_range():
+    engine = GeodesicCircleEngine(SEMI_MAJOR, FLATTENING, 360)
+    lons, lats = engine.ring(10.0, 50.0, 50000.0)
+    (part_lons, part_lats), = lonlat_polygons(lons, lats)
+    np.testing.assert_array_equal(part_lons, lons)
+    np.testing.assert_array_equal(part_lats, lats)
@@ -0,0 +1,43 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import numpy as np
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from qgis.core import Qgis, QgsCoordinateReferenceSystem, QgsPointXY
+from qgis.testing import start_app
+
+from measure_radius import kernel
+
+start_app()
+
+# Centre and outer point pairs in EPSG:4326. The last two are nearly and
+# exactly antipodal, Vincenty's inverse formula doesn't converge for the
+# last one.
+PAIRS = [((144.42, -37.95), (143.93, -37.65)),
+         ((10.0, 60.0), (10.5, 60.2)),
+         ((-179.9, 0.0), (179.9, 0.0)),
+         ((0.0, 0.0), (179.5, 0.5)),
+         ((0.0, 0.0), (180.0, 0.0))]
+
+
+def test_batch_matches_qgs_distance_area():
+    crs = QgsCoordinateReferenceSystem('EPSG:4326')
+    cx, cy, ox, oy = (np.array(values) for values in zip(*[c + o for c, o in PAIRS]))
+    batch = kernel.ellipsoidal_radii(cx, cy, ox, oy, crs, 'EPSG:7030', Qgis.DistanceUnit.Meters)
+    single = [kernel.ellipsoidal_radius(QgsPointXY(*c), QgsPointXY(*o), crs, 'EPSG:7030',
+                                        Qgis.DistanceUnit.Meters) for c, o in PAIRS]
+    np.testing.assert_allclose(batch, single, atol=1e-3)
+    # The shortest path between antipodal points on the equator runs over a
+    # pole, half the length of a meridian
+    assert batch[-1] == pytest.approx(20003931.46, abs=1.0)
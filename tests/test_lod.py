@@ -0,0 +1,54 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import numpy as np
+
+from measure_radius.lod import LodCache
+
+
+def ring():
+    # 160 bytes
+    return (np.zeros(10), np.zeros(10))
+
+
+def test_evicts_least_recently_used():
+    cache = LodCache(max_bytes=400)
+    cache.put((1, 0), ring())
+    cache.put((2, 0), ring())
+    # Using 1 makes 2 the oldest
+    assert cache.get((1, 0)) is not None
+    cache.put((3, 0), ring())
+    assert cache.get((2, 0)) is None
+    assert cache.get((1, 0)) is not None
+    assert cache.get((3, 0)) is not None
+    assert cache.stats() == {'entries': 2, 'bytes': 320, 'hits': 3, 'misses': 1, 'evictions': 1}
+
+
+def test_replacing_a_ring_keeps_the_byte_count():
+    cache = LodCache(max_bytes=400)
+    cache.put((1, 0), ring())
+    cache.put((1, 0), ring())
+    assert len(cache) == 1
+    assert cache.bytes == 160
+
+
+def test_discard():
+    cache = LodCache()
+    for key in [(1, 0), (1, 1), (2, 0), (2, 9)]:
+        cache.put(key, ring())
+    cache.discard_measurement(1)
+    assert list(cache.entries) == [(2, 0), (2, 9)]
+    cache.discard_buckets(lambda bucket: bucket < 4)
+    assert list(cache.entries) == [(2, 0)]
+    assert cache.bytes == 160
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.bytes == 0
@@ -0,0 +1,172 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from qgis.core import QgsPointXY
+from qgis.testing import start_app
+
+from measure_radius.map_tool import SnappingThrottle
+
+start_app()
+
+
+class FakeMatch:
+
+    def __init__(self, point=None):
+        self.snapped = point
+
+    def isValid(self):
+        return self.snapped is not None
+
+    def point(self):
+        return self.snapped
+
+
+class FakeSnapUtils:
+    # Snaps to a grid of vertices 10 map units apart within 3 map units
+
+    def __init__(self):
+        self.calls = []
+
+    def snapToMap(self, point):
+        self.calls.append(point)
+        vertex = QgsPointXY(round(point.x(), -1), round(point.y(), -1))
+        return FakeMatch(vertex if vertex.distance(point) <= 3 else None)
+
+
+class FakeIndicator:
+
+    def __init__(self):
+        self.match = None
+
+    def setMatch(self, match):
+        self.match = match
+
+
+class IdentityTransform:
+
+    def transform(self, point):
+        return point
+
+
+class FakeCanvas:
+    # One map unit per pixel
+
+    def getCoordinateTransform(self):
+        return IdentityTransform()
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def throttle(clock):
+    return SnappingThrottle(FakeCanvas(), FakeSnapUtils(), FakeIndicator(), clock=clock)
+
+
+def move(throttle, x, y):
+    # Map and pixel coordinates are the same on the fake canvas
+    return throttle.snap(QgsPointXY(x, y), QgsPointXY(x, y))
+
+
+def test_sub_pixel_moves_are_skipped(throttle, clock):
+    assert move(throttle, 5, 5) == QgsPointXY(5, 5)
+    clock.now = 1.0
+    assert move(throttle, 5.5, 5.5) == QgsPointXY(5.5, 5.5)
+    assert move(throttle, 19, 19) == QgsPointXY(20, 20)
+    clock.now = 2.0
+    assert move(throttle, 19.4, 19.4) == QgsPointXY(20, 20)
+    assert (throttle.queries, throttle.skipped) == (2, 2)
+
+
+def test_match_reused_within_window(throttle, clock):
+    assert move(throttle, 9, 9) == QgsPointXY(10, 10)
+    clock.now = 1.0
+    assert move(throttle, 11, 10) == QgsPointXY(10, 10)
+    assert move(throttle, 15, 10) == QgsPointXY(15, 10)
+    assert throttle.queries == 2
+
+
+def test_queries_throttled_in_time(throttle, clock):
+    assert move(throttle, 9, 9) == QgsPointXY(10, 10)
+    # Too soon for another query, the last result is kept
+    clock.now = 0.01
+    assert move(throttle, 15, 15) == QgsPointXY(10, 10)
+    assert throttle.queries == 1
+    assert throttle.timer.isActive()
+    assert throttle.idle_point == QgsPointXY(15, 15)
+    clock.now = 0.03
+    assert move(throttle, 21, 21) == QgsPointXY(20, 20)
+    assert throttle.queries == 2
+    assert not throttle.timer.isActive()
+    assert throttle.idle_point is None
+
+
+def test_fast_moves_are_deferred(throttle, clock):
+    move(throttle, 5, 5)
+    clock.now = 1.0
+    assert move(throttle, 101, 99) == QgsPointXY(101, 99)
+    assert throttle.queries == 1
+    assert not throttle.snap_indicator.match.isValid()
+    assert throttle.timer.isActive()
+
+
+def test_deferred_query_flushed_when_idle(throttle, clock):
+    snapped = []
+    throttle.idle_callback = snapped.append
+    move(throttle, 5, 5)
+    clock.now = 1.0
+    move(throttle, 101, 99)
+    # What the idle timer does once the cursor settles
+    throttle.idle_snap()
+    assert snapped == [QgsPointXY(100, 100)]
+    assert throttle.snap_utils.calls[-1] == QgsPointXY(101, 99)
+    assert throttle.snap_indicator.match.point() == QgsPointXY(100, 100)
+    assert throttle.queries == 2
+    # Nothing left to flush
+    throttle.idle_snap()
+    assert snapped == [QgsPointXY(100, 100)]
+    assert throttle.queries == 2
+
+
+def test_click_drops_deferred_query(throttle, clock):
+    snapped = []
+    throttle.idle_callback = snapped.append
+    move(throttle, 9, 9)
+    clock.now = 0.01
+    move(throttle, 15, 15)
+    assert throttle.snap_exact(QgsPointXY(31, 31)) == QgsPointXY(30, 30)
+    assert not throttle.timer.isActive()
+    throttle.idle_snap()
+    assert snapped == []
+    assert throttle.queries == 2
+
+
+def test_reset_forgets_last_query(throttle, clock):
+    move(throttle, 9, 9)
+    throttle.reset()
+    assert move(throttle, 9, 9) == QgsPointXY(10, 10)
+    assert throttle.queries == 2
+    assert not throttle.timer.isActive()
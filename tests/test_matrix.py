@@ -0,0 +1,64 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import numpy as np
+
+from measure_radius.nearest import (feature_starts, segment_starts, nearest_on_segments,
+                                    inside_rings, nearest_per_feature)
+
+# Vertex arrays as read by vertex_arrays_job(): feature 7 is a 10 x 10
+# square, feature 8 a long line x = 20 and feature 9 a single point
+FIDS = np.array([7, 7, 7, 7, 7, 8, 8, 9])
+RINGS = np.array([1, 1, 1, 1, 1, 2, 2, 3])
+XS = np.array([0, 10, 10, 0, 0, 20, 20, 5], dtype=float)
+YS = np.array([0, 0, 10, 10, 0, -100, 100, 50], dtype=float)
+
+
+def nearest(px, py):
+    starts = feature_starts(FIDS)
+    first = segment_starts(RINGS)
+    sx, sy = nearest_on_segments(px, py, XS, YS, first)
+    return nearest_per_feature(starts, np.hypot(XS - px, YS - py), first, np.hypot(sx - px, sy - py))
+
+
+def test_segments_stay_within_rings():
+    np.testing.assert_array_equal(feature_starts(FIDS), [0, 5, 7])
+    np.testing.assert_array_equal(segment_starts(RINGS), [0, 1, 2, 3, 5])
+
+
+def test_nearest_point_not_nearest_vertex():
+    # Nearest vertices are 5 * sqrt(2), 100.1 and 45 away
+    np.testing.assert_allclose(nearest(5, 5), [5, 15, 45])
+    np.testing.assert_allclose(nearest(15, 5), [5, 5, np.hypot(10, 45)])
+
+
+def test_degenerate_segment():
+    x, y = nearest_on_segments(3, 4, np.array([1.0, 1.0]), np.array([1.0, 1.0]), np.array([0]))
+    np.testing.assert_array_equal([x[0], y[0]], [1, 1])
+
+
+def test_inside_rings():
+    starts = feature_starts(FIDS[:5])
+    first = segment_starts(RINGS[:5])
+    assert inside_rings(5, 5, XS[:5], YS[:5], first, starts).tolist() == [True]
+    assert inside_rings(15, 5, XS[:5], YS[:5], first, starts).tolist() == [False]
+
+
+def test_inside_hole():
+    # Square with a square hole, both rings of one feature
+    fids = np.zeros(10, dtype=np.int64)
+    rings = np.repeat([1, 2], 5)
+    xs = np.array([0, 10, 10, 0, 0, 4, 6, 6, 4, 4], dtype=float)
+    ys = np.array([0, 0, 10, 10, 0, 4, 4, 6, 6, 4], dtype=float)
+    starts = feature_starts(fids)
+    first = segment_starts(rings)
+    assert inside_rings(2, 2, xs, ys, first, starts).tolist() == [True]
+    assert inside_rings(5, 5, xs, ys, first, starts).tolist() == [False]
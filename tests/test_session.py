@@ -0,0 +1,118 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import numpy as np
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransformContext, QgsPointXY
+from qgis.testing import start_app
+
+from measure_radius.radius_math import RadiusMeasurement, TransformCache
+from measure_radius.session import MeasurementSession
+
+start_app()
+
+WGS84 = QgsCoordinateReferenceSystem('EPSG:4326')
+MERCATOR = QgsCoordinateReferenceSystem('EPSG:3857')
+
+
+def measurement(cx, cy, ox, oy, crs=MERCATOR):
+    return RadiusMeasurement(QgsPointXY(cx, cy), QgsPointXY(ox, oy), crs)
+
+
+def test_add():
+    session = MeasurementSession()
+    first = session.add(measurement(0, 0, 3, 4))
+    second = session.add(measurement(10, 10, 10, 12))
+    assert (first, second) == (1, 2)
+    assert len(session) == 2
+    np.testing.assert_array_equal(session.rows()['radius'], [5, 2])
+    restored = session.measurement(first)
+    assert (restored.centre, restored.outer) == (QgsPointXY(0, 0), QgsPointXY(3, 4))
+    assert restored.crs == MERCATOR
+    assert session.measurement(99) is None
+
+
+def test_add_rows():
+    session = MeasurementSession()
+    session.add(measurement(0, 0, 1, 0))
+    ids = session.add_rows(np.array([0.0, 1.0]), np.array([0.0, 1.0]),
+                            np.array([3.0, 1.0]), np.array([4.0, 3.0]), WGS84)
+    np.testing.assert_array_equal(ids, [2, 3])
+    np.testing.assert_array_equal(session.rows()['radius'], [1, 5, 2])
+    np.testing.assert_array_equal(session.rows()['crs'], [0, 1, 1])
+    assert session.crs_list == [MERCATOR, WGS84]
+
+
+def test_remove():
+    session = MeasurementSession()
+    ids = [session.add(measurement(i, 0, i + 1, 0)) for i in range(3)]
+    assert session.remove(ids[1])
+    assert not session.remove(ids[1])
+    np.testing.assert_array_equal(session.rows()['id'], [ids[0], ids[2]])
+    np.testing.assert_array_equal(session.rows()['cx'], [0, 2])
+
+
+def test_undo():
+    session = MeasurementSession()
+    ids = [session.add(measurement(i, 0, i + 1, 0)) for i in range(2)]
+    assert session.undo() == ids[1]
+    assert session.undo() == ids[0]
+    assert session.undo() is None
+    assert len(session) == 0
+    # Ids are never reused
+    assert session.add(measurement(0, 0, 1, 0)) == 3
+
+
+def test_growth():
+    session = MeasurementSession(capacity=2)
+    for i in range(5):
+        session.add(measurement(i, 0, i, 1))
+    assert len(session.records) >= 5
+    session.add_rows(np.zeros(100), np.zeros(100), np.ones(100), np.zeros(100), MERCATOR)
+    assert len(session) == 105
+    np.testing.assert_array_equal(session.rows()['id'], np.arange(1, 106))
+    np.testing.assert_array_equal(session.rows()['cx'][:5], np.arange(5))
+
+
+def test_display_cache():
+    session = MeasurementSession()
+    transforms = TransformCache(QgsCoordinateTransformContext())
+    session.add(measurement(0, 0, 1000, 0))
+    points = session.display_points(WGS84, transforms)
+    assert session.display_points(WGS84, transforms) is points
+    assert points[2][0] == pytest.approx(1000 / 111319.49, rel=1e-6)
+    # Any change or another destination CRS invalidates the cache
+    session.add(measurement(0, 0, 0, 1000))
+    assert session.cached_display_points(WGS84) is None
+    np.testing.assert_allclose(session.display_points(MERCATOR, transforms)[3], [0, 1000])
+    assert session.cached_display_points(WGS84) is None
+    # Points computed for an older version are not cached
+    key = session.display_key(MERCATOR)
+    session.undo()
+    session.set_display_points(key, points)
+    assert session.cached_display_points(MERCATOR) is None
+
+
+def test_clear_then_add():
+    session = MeasurementSession()
+    session.add(measurement(0, 0, 1, 0, WGS84))
+    session.add(measurement(0, 0, 1, 0, MERCATOR))
+    session.clear()
+    assert len(session) == 0
+    assert session.crs_list == [] and session.crs_keys == {}
+    assert session.cached_display_points(MERCATOR) is None
+    measurement_id = session.add(measurement(0, 0, 0, 2, MERCATOR))
+    assert session.crs_list == [MERCATOR]
+    assert session.rows()['crs'][0] == 0
+    assert session.measurement(measurement_id).crs == MERCATOR
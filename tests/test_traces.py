@@ -0,0 +1,70 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import numpy as np
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from qgis.core import QgsPointXY
+
+from measure_radius import traces
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'session.mrt')
+    recorder = traces.TraceRecorder(path)
+    recorder.write(traces.CRS, 'EPSG:4326')
+    recorder.units(3)
+    recorder.mode(True)
+    recorder.write(traces.PRESS, 1, False, 1.5, 2.5, 1.0, 2.0)
+    recorder.write(traces.MOVE, 3.5, 4.5, 3.0, 4.0)
+    recorder.idle_snap(QgsPointXY(5, 6))
+    recorder.frame()
+    output = (1,) + tuple(float(i) for i in range(22)) + ('1.5', '2.5', '3 km')
+    recorder.write(traces.OUTPUT, *output)
+    recorder.undo()
+    recorder.new()
+    recorder.typed('1', '2', 'é')
+    recorder.circles(np.array([1.0, 2.0]), np.array([3.0, 4.0]), np.array([5.0, 6.0]))
+    recorder.close()
+    assert recorder.records == 12
+
+    records = [(kind, values) for kind, elapsed, values in traces.read_trace(path)]
+    assert records[:-1] == [
+        (traces.CRS, ('EPSG:4326',)),
+        (traces.UNITS, (3,)),
+        (traces.MODE, (1,)),
+        (traces.PRESS, (1, 0, 1.5, 2.5, 1.0, 2.0)),
+        (traces.MOVE, (3.5, 4.5, 3.0, 4.0)),
+        (traces.IDLE_SNAP, (5.0, 6.0)),
+        (traces.FRAME, ()),
+        (traces.OUTPUT, output),
+        (traces.UNDO, ()),
+        (traces.NEW, ()),
+        (traces.TYPED, ('1', '2', 'é')),
+    ]
+    kind, (count, xs, ys, radii) = records[-1]
+    assert (kind, count) == (traces.CIRCLES, 2)
+    np.testing.assert_array_equal(xs, [1, 2])
+    np.testing.assert_array_equal(ys, [3, 4])
+    np.testing.assert_array_equal(radii, [5, 6])
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'other.mrt'
+    path.write_bytes(b'PNG\x00\x01\x00')
+    with pytest.raises(ValueError):
+        list(traces.read_trace(str(path)))
+    for version in (1, 99):
+        path.write_bytes(traces.FILE_HEADER.pack(traces.MAGIC, version))
+        with pytest.raises(ValueError):
+            list(traces.read_trace(str(path)))
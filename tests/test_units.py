@@ -0,0 +1,43 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+import itertools
+
+import pytest
+
+from measure_radius.units import RADIUS_UNIT_NAMES, UNIT_TO_METERS, UNIT_CONVERSION_MATRIX
+
+UNITS = range(len(RADIUS_UNIT_NAMES))
+
+
+def test_tables_match():
+    assert len(UNIT_TO_METERS) == len(RADIUS_UNIT_NAMES)
+    assert len(UNIT_CONVERSION_MATRIX) == len(RADIUS_UNIT_NAMES)
+    assert all(len(row) == len(RADIUS_UNIT_NAMES) for row in UNIT_CONVERSION_MATRIX)
+
+
+def test_identity_diagonal():
+    for a in UNITS:
+        assert UNIT_CONVERSION_MATRIX[a][a] == 1.0
+
+
+@pytest.mark.parametrize('a, b', list(itertools.product(UNITS, UNITS)))
+def test_round_trip(a, b):
+    # a to b and back again is the identity
+    assert 123.456 * UNIT_CONVERSION_MATRIX[a][b] * UNIT_CONVERSION_MATRIX[b][a] == pytest.approx(123.456, rel=1e-12)
+
+
+def test_conversion_factor_matches_table():
+    pytest.importorskip('qgis.core')
+    from measure_radius.radius_math import DISTANCE_UNITS, conversion_factor
+    for a, b in itertools.product(UNITS, UNITS):
+        assert conversion_factor(DISTANCE_UNITS[a], DISTANCE_UNITS[b]) == UNIT_CONVERSION_MATRIX[a][b]
+        assert conversion_factor(a, b) * conversion_factor(b, a) == pytest.approx(1.0, rel=1e-12)
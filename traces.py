@@ -0,0 +1,312 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+# Binary traces of what MeasureRadiusTool sees: clicks and moves with the
+# point snapping gave the tool, the frames the scheduler ran, CRS, extent,
+# unit and mode changes, edits of the session from the dialog (undo, new,
+# typed and pasted circles) and the dialog outputs of every finished
+# measurement. Replaying a trace feeds exactly the same points into the
+# tool in the same frames, so its outputs must come out identical.
+#
+# Record from the QGIS Python console with
+#     tool.start_trace('/tmp/session.mrt')
+#     ...
+#     tool.stop_trace()
+# and replay with benchmarks/replay_trace.py.
+from qgis.PyQt.QtCore import Qt, QEvent
+from qgis.core import QgsProject, QgsCoordinateReferenceSystem, QgsPointXY, QgsRectangle
+from qgis.gui import QgsMapMouseEvent
+
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b'MRTR'
+# Only traces of the current version are read
+VERSION = 2
+FILE_HEADER = struct.Struct('<4sH')
+
+# Every record starts with its kind and milliseconds since recording began
+RECORD_HEADER = struct.Struct('<BI')
+
+PRESS = 1
+MOVE = 2
+IDLE_SNAP = 3
+FRAME = 4
+CRS = 5
+EXTENT = 6
+UNITS = 7
+MODE = 8
+OUTPUT = 9
+UNDO = 10
+NEW = 11
+TYPED = 12
+CIRCLES = 13
+
+# Fixed size part of each kind, text follows as length prefixed UTF-8
+RECORDS = {
+    # button, shift, map x, map y, snapped x, snapped y
+    PRESS: struct.Struct('<BBdddd'),
+    # map x, map y, snapped x, snapped y
+    MOVE: struct.Struct('<dddd'),
+    IDLE_SNAP: struct.Struct('<dd'),
+    FRAME: struct.Struct('<'),
+    # followed by the CRS as authid or WKT
+    CRS: struct.Struct('<'),
+    # canvas width, height, xmin, ymin, xmax, ymax
+    EXTENT: struct.Struct('<HHdddd'),
+    UNITS: struct.Struct('<B'),
+    MODE: struct.Struct('<B'),
+    # measurement id, centre, outer, cartesian and ellipsoidal radius in
+    # every unit, followed by the x, y and radius text of the dialog
+    OUTPUT: struct.Struct('<I22d'),
+    UNDO: struct.Struct('<'),
+    NEW: struct.Struct('<'),
+    # followed by the x, y and radius text of the dialog
+    TYPED: struct.Struct('<'),
+    # number of circles, followed by an x, y, radius row of doubles for each
+    CIRCLES: struct.Struct('<I'),
+}
+TEXTS = {CRS: 1, OUTPUT: 3, TYPED: 3}
+TEXT_LENGTH = struct.Struct('<H')
+# Kinds followed by rows of this many doubles, as many as the first value
+ROWS = {CIRCLES: 3}
+ROW_FORMAT = np.dtype('<f8')
+
+BUTTONS = {Qt.LeftButton: 1, Qt.RightButton: 2}
+BUTTON_CODES = {code: button for button, code in BUTTONS.items()}
+
+
+def crs_text(crs):
+    return crs.authid() or crs.toWkt()
+
+
+def measurement_output(tool, first_id):
+    # What the dialog shows for the finished measurement, as an OUTPUT record.
+    # Ids are counted from the first measurement of the trace.
+    result = tool.result
+    return ((tool.measurement_id - first_id, tool.centre_point.x(), tool.centre_point.y(),
+                tool.outer_point.x(), tool.outer_point.y())
+            + tuple(float(r) for r in result.cartesian) + tuple(float(r) for r in result.ellipsoidal)
+            + (tool.dlg.x_edit.text(), tool.dlg.y_edit.text(), tool.dlg.radius_edit.text()))
+
+
+class TraceRecorder:
+    # Appends records to a trace file as the tool sees them
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.start = time.perf_counter()
+        self.records = 0
+        self.first_id = 0
+
+    def write(self, kind, *values):
+        elapsed = int((time.perf_counter() - self.start) * 1000)
+        fixed = RECORDS[kind]
+        texts = TEXTS.get(kind, 0)
+        count = len(values) - texts
+        self.file.write(RECORD_HEADER.pack(kind, elapsed) + fixed.pack(*values[:count]))
+        for text in values[count:]:
+            data = text.encode('utf-8')
+            self.file.write(TEXT_LENGTH.pack(len(data)) + data)
+        self.records += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def state(self, tool):
+        # Everything the replay has to set up before the first event
+        self.first_id = tool.session.next_id
+        self.crs(tool.crs)
+        self.extent(tool.canvas)
+        self.units(tool.dlg.radius_combo.currentIndex())
+        self.mode(tool.dlg.ellipsoidal_rb.isChecked())
+
+    def press(self, event, snapped):
+        shift = bool(event.modifiers() & Qt.ShiftModifier)
+        self.write(PRESS, BUTTONS.get(event.button(), 0), shift, event.mapPoint().x(), event.mapPoint().y(),
+                    snapped.x(), snapped.y())
+
+    def move(self, event, snapped):
+        self.write(MOVE, event.mapPoint().x(), event.mapPoint().y(), snapped.x(), snapped.y())
+
+    def idle_snap(self, point):
+        self.write(IDLE_SNAP, point.x(), point.y())
+
+    def frame(self):
+        self.write(FRAME)
+
+    def crs(self, crs):
+        self.write(CRS, crs_text(crs))
+
+    def extent(self, canvas):
+        size = canvas.mapSettings().outputSize()
+        extent = canvas.extent()
+        self.write(EXTENT, size.width(), size.height(), extent.xMinimum(), extent.yMinimum(),
+                    extent.xMaximum(), extent.yMaximum())
+
+    def units(self, idx):
+        self.write(UNITS, idx)
+
+    def mode(self, ellipsoidal):
+        self.write(MODE, ellipsoidal)
+
+    def output(self, tool):
+        self.write(OUTPUT, *measurement_output(tool, self.first_id))
+
+    def undo(self):
+        self.write(UNDO)
+
+    def new(self):
+        self.write(NEW)
+
+    def typed(self, x_text, y_text, radius_text):
+        self.write(TYPED, x_text, y_text, radius_text)
+
+    def circles(self, xs, ys, radii):
+        self.write(CIRCLES, len(xs))
+        self.file.write(np.column_stack((xs, ys, radii)).astype(ROW_FORMAT).tobytes())
+
+
+def read_trace(path):
+    # Yields (kind, milliseconds, values) for every record of a trace file
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('{} is not a measure radius trace'.format(path))
+    if version != VERSION:
+        raise ValueError('Unsupported trace version {} in {}'.format(version, path))
+    offset = FILE_HEADER.size
+    while offset < len(data):
+        kind, elapsed = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        fixed = RECORDS[kind]
+        values = fixed.unpack_from(data, offset)
+        offset += fixed.size
+        for i in range(TEXTS.get(kind, 0)):
+            (length,) = TEXT_LENGTH.unpack_from(data, offset)
+            offset += TEXT_LENGTH.size
+            values += (data[offset:offset + length].decode('utf-8'),)
+            offset += length
+        if kind in ROWS:
+            columns = ROWS[kind]
+            rows = np.frombuffer(data, ROW_FORMAT, values[0] * columns, offset).reshape(-1, columns)
+            offset += rows.nbytes
+            values += tuple(rows[:, i].astype(float) for i in range(columns))
+        yield kind, elapsed, values
+
+
+class TraceSnapper:
+    # Stands in for SnappingThrottle during a replay and returns the snapped
+    # points recorded in the trace, so replays don't depend on the layers
+    # or the timing of deferred snapping queries
+
+    def __init__(self):
+        self.point = None
+        self.idle_callback = None
+        self.queries = 0
+        self.skipped = 0
+
+    def snap(self, map_point, pixel):
+        return self.point
+
+    def snap_exact(self, map_point):
+        return self.point
+
+    def reset(self):
+        pass
+
+
+def mouse_event(canvas, event_type, button, shift, map_point):
+    pixel = canvas.getCoordinateTransform().transform(map_point).toQPointF().toPoint()
+    modifiers = Qt.ShiftModifier if shift else Qt.NoModifier
+    event = QgsMapMouseEvent(canvas, event_type, pixel, button, button, modifiers)
+    event.setMapPoint(map_point)
+    return event
+
+
+def replay_trace(tool, path, on_record=None):
+    # Feeds a trace into tool, which must be the active map tool of its
+    # canvas, as fast as possible with every measurement computed inline.
+    # Returns (records replayed, outputs checked, list of
+    # mismatches), each mismatch is (record number, expected, replayed).
+    # on_record(kind, values) is called after each record, e.g. for timing.
+    canvas = tool.canvas
+    project = QgsProject.instance()
+    async_measurements = tool.async_measurements
+    snapper = tool.snapper
+    recorder = tool.recorder
+    tool.async_measurements = False
+    tool.snapper = TraceSnapper()
+    tool.recorder = None
+    # Traces start from an empty session, see MeasureRadiusTool.start_trace()
+    tool.new_measurement()
+    first_id = tool.session.next_id
+    count = 0
+    checked = 0
+    mismatches = []
+    try:
+        for count, (kind, elapsed, values) in enumerate(read_trace(path), 1):
+            if kind == PRESS:
+                button, shift, x, y, sx, sy = values
+                tool.snapper.point = QgsPointXY(sx, sy)
+                tool.canvasPressEvent(mouse_event(canvas, QEvent.MouseButtonPress,
+                                                    BUTTON_CODES.get(button, Qt.NoButton), shift, QgsPointXY(x, y)))
+            elif kind == MOVE:
+                x, y, sx, sy = values
+                tool.snapper.point = QgsPointXY(sx, sy)
+                tool.canvasMoveEvent(mouse_event(canvas, QEvent.MouseMove, Qt.NoButton, False, QgsPointXY(x, y)))
+            elif kind == IDLE_SNAP:
+                tool.idle_snapped(QgsPointXY(*values))
+            elif kind == FRAME:
+                tool.render_scheduler.flush()
+            elif kind == CRS:
+                crs = QgsCoordinateReferenceSystem(values[0])
+                canvas.setDestinationCrs(crs)
+                project.setCrs(crs)
+            elif kind == EXTENT:
+                width, height, xmin, ymin, xmax, ymax = values
+                canvas.resize(width, height)
+                canvas.setExtent(QgsRectangle(xmin, ymin, xmax, ymax))
+            elif kind == UNITS:
+                tool.dlg.radius_combo.setCurrentIndex(values[0])
+            elif kind == MODE:
+                (tool.dlg.ellipsoidal_rb if values[0] else tool.dlg.cartesian_rb).setChecked(True)
+            elif kind == UNDO:
+                tool.undo_measurement()
+            elif kind == NEW:
+                tool.new_measurement()
+            elif kind == TYPED:
+                x_text, y_text, radius_text = values
+                tool.dlg.x_edit.setText(x_text)
+                tool.dlg.y_edit.setText(y_text)
+                tool.dlg.radius_edit.setText(radius_text)
+                tool.typed_measurement()
+            elif kind == CIRCLES:
+                tool.add_circles(*values[1:])
+            elif kind == OUTPUT:
+                checked += 1
+                replayed = measurement_output(tool, first_id)
+                if replayed != values:
+                    mismatches.append((count, values, replayed))
+            if on_record:
+                on_record(kind, values)
+    finally:
+        tool.async_measurements = async_measurements
+        tool.snapper = snapper
+        tool.recorder = recorder
+    return count, checked, mismatches
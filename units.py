@@ -0,0 +1,28 @@
+#-----------------------------------------------------------
+# Copyright (C) 2023 Ben Wirf
+# ben.wirf@gmail.com
+#-----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#---------------------------------------------------------------------
+# Plain unit tables. The Processing provider is registered at QGIS startup
+# and only needs the unit names, so this module imports neither QGIS nor
+# NumPy. radius_math builds the Qgis.DistanceUnit list and the NumPy
+# conversion array from these.
+
+# Units offered in the dialog radius combo box and the Processing algorithms
+RADIUS_UNIT_NAMES = ['meters', 'kilometers', 'feet', 'nautical miles',
+                    'yards', 'miles', 'degrees', 'centimeters', 'millimeters']
+
+# Length of one of each of the above units in meters. Degrees are
+# approximated by the length of one degree of arc at the equator.
+UNIT_TO_METERS = [1.0, 1000.0, 0.3048, 1852.0, 0.9144, 1609.344, 111319.49, 0.01, 0.001]
+
+# UNIT_CONVERSION_MATRIX[input][output] is the factor converting a length
+# in input units to output units. Deriving every entry from one base factor
+# per unit keeps all conversions consistent and reversible.
+UNIT_CONVERSION_MATRIX = [[from_m / to_m for to_m in UNIT_TO_METERS] for from_m in UNIT_TO_METERS]